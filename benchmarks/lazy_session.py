@@ -0,0 +1,95 @@
+"""Times requests to a route which does not use the database, with the
+async :class:`DatabaseAlchemy` creating the request session lazily, on first
+access to ``db.session``, and eagerly, in a request middleware as it used to.
+
+Needs ``httpx`` and ``aiosqlite``::
+
+    python -m benchmarks.lazy_session -n 2000 -r 5
+
+It prints the best time per request of the rounds of each variant.
+
+"""
+import argparse
+import asyncio
+import importlib
+import subprocess
+import sys
+import time
+
+import httpx
+from sanic import Sanic
+from sanic.response import json
+
+DatabaseAlchemy = importlib.import_module('va_apiprovider.database.async').DatabaseAlchemy
+
+
+class EagerDatabaseAlchemy(DatabaseAlchemy):
+    """Opens the session of every request before its handler runs."""
+
+    def init_app(self, app=None, uri=None):
+        super().init_app(app, uri)
+
+        @(app or self.app).middleware('request')
+        async def open_db_session(request):
+            self.session
+
+
+def make_app(name, db_cls):
+    app = Sanic(name)
+    db_cls(app, uri='sqlite+aiosqlite:///:memory:')
+
+    @app.get('/health')
+    async def health(request):
+        return json({'status': 'ok'})
+    return app
+
+
+async def run(app, number, repeat):
+    # Started once, unlike with app.asgi_client, which starts and stops the
+    # app around every request.
+    app.asgi = True
+    await app._startup()
+    await app._server_event('init', 'before')
+    await app._server_event('init', 'after')
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        response = await client.get('/health')
+        assert response.status_code == 200
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                await client.get('/health')
+            timings.append(time.perf_counter() - start)
+    await app._server_event('shutdown', 'before')
+    await app._server_event('shutdown', 'after')
+    return min(timings) / number
+
+
+VARIANTS = {'lazy': DatabaseAlchemy, 'eager': EagerDatabaseAlchemy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=2000,
+                        help='requests per round (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='rounds per variant (default: %(default)s)')
+    parser.add_argument('--variant', choices=sorted(VARIANTS),
+                        help='run only this variant')
+    args = parser.parse_args()
+
+    if args.variant is None:
+        # Sanic rewrites the methods of the first app it starts in a process,
+        # so each variant gets its own.
+        for variant in VARIANTS:
+            subprocess.run([sys.executable, '-m', __spec__.name, '-n', str(args.number),
+                            '-r', str(args.repeat), '--variant', variant], check=True)
+        return
+    app = make_app(args.variant, VARIANTS[args.variant])
+    per_request = asyncio.run(run(app, args.number, args.repeat))
+    print('{0:>5}: {1:8.1f} us/request'.format(args.variant, per_request * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Compares :class:`ModelSerializer` with the ``to_dict`` it replaced on a
+page of rows: it checks that both give the same dictionaries, with the same
+key order, then times them.
+
+Uses an in-memory SQLite database::
+
+    python -m benchmarks.serializer -n 1000 -r 5
+
+"""
+import argparse
+import datetime
+import json
+import time
+import uuid
+
+from sqlalchemy import (Column, Date, DateTime, ForeignKey, Integer, String, Uuid,
+                        create_engine, select)
+from sqlalchemy.exc import NoInspectionAvailable
+from sqlalchemy.ext import hybrid
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.orm import Query, Session, declarative_base, relationship, selectinload
+
+from va_apiprovider.helpers.sqlalchemy import (COLUMN_BLACKLIST, get_serializer,
+                                               is_like_list, is_mapped_class)
+
+Model = declarative_base()
+
+
+class Customer(Model):
+    __tablename__ = 'customer'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    key = Column(Uuid)
+    orders = relationship('Order', back_populates='customer')
+
+
+class Order(Model):
+    __tablename__ = 'order'
+    id = Column(Integer, primary_key=True)
+    status = Column(String)
+    total = Column(Integer)
+    placed = Column(DateTime)
+    shipped = Column(Date)
+    customer_id = Column(Integer, ForeignKey('customer.id'))
+    customer = relationship('Customer', back_populates='orders')
+
+    @hybrid.hybrid_property
+    def doubled(self):
+        return self.total * 2
+
+    def label(self):
+        return '{0}-{1}'.format(self.id, self.status)
+
+
+#: The arguments of each comparison, as the views pass them.
+CASES = [
+    ('columns', dict()),
+    ('relation', dict(deep={'customer': {}})),
+    ('exclude', dict(deep={'customer': {}}, exclude=['placed'],
+                     exclude_relations={'customer': ['key']})),
+    ('methods', dict(deep={'customer': {}}, include_methods=['label', 'customer.name'])),
+]
+
+
+def legacy_to_dict(instance, deep=None, exclude=None, include=None,
+                   exclude_relations=None, include_relations=None,
+                   include_methods=None):
+    """``to_dict`` as it was before :class:`ModelSerializer`, which inspects
+    the model and checks the type of every value for each instance.
+
+    """
+    if (exclude is not None or exclude_relations is not None) and \
+            (include is not None or include_relations is not None):
+        raise ValueError('Cannot specify both include and exclude.')
+    instance_type = type(instance)
+    columns = []
+    try:
+        inspected_instance = sqlalchemy_inspect(instance_type)
+        column_attrs = inspected_instance.column_attrs.keys()
+        descriptors = inspected_instance.all_orm_descriptors.items()
+        hybrid_columns = [k for k, d in descriptors
+                          if d.extension_type == hybrid.hybrid_property
+                          and not (deep and k in deep)]
+        columns = column_attrs + hybrid_columns
+    except NoInspectionAvailable:
+        return instance
+    if exclude is not None:
+        columns = (c for c in columns if c not in exclude)
+    elif include is not None:
+        columns = (c for c in columns if c in include)
+    result = dict((col, getattr(instance, col)) for col in columns
+                  if not (col.startswith('__') or col in COLUMN_BLACKLIST))
+    if include_methods is not None:
+        for method in include_methods:
+            if '.' not in method:
+                value = getattr(instance, method)
+                if callable(value):
+                    value = value()
+                result[method] = value
+    for key, value in result.items():
+        if isinstance(value, (datetime.date, datetime.time)):
+            result[key] = value.isoformat()
+        elif isinstance(value, uuid.UUID):
+            result[key] = str(value)
+        elif key not in column_attrs and is_mapped_class(type(value)):
+            result[key] = legacy_to_dict(value)
+    deep = deep or {}
+    for relation, rdeep in deep.items():
+        relatedvalue = getattr(instance, relation)
+        if relatedvalue is None:
+            result[relation] = None
+            continue
+        newexclude = None
+        newinclude = None
+        if exclude_relations is not None and relation in exclude_relations:
+            newexclude = exclude_relations[relation]
+        elif (include_relations is not None and
+              relation in include_relations):
+            newinclude = include_relations[relation]
+        newmethods = None
+        if include_methods is not None:
+            newmethods = [method.split('.', 1)[1] for method in include_methods
+                          if method.split('.', 1)[0] == relation]
+        if is_like_list(instance, relation):
+            result[relation] = [legacy_to_dict(inst, rdeep, exclude=newexclude,
+                                               include=newinclude,
+                                               include_methods=newmethods)
+                                for inst in relatedvalue]
+            continue
+        if isinstance(relatedvalue, Query):
+            relatedvalue = relatedvalue.one()
+        result[relation] = legacy_to_dict(relatedvalue, rdeep, exclude=newexclude,
+                                          include=newinclude,
+                                          include_methods=newmethods)
+    return result
+
+
+def load_page(number):
+    engine = create_engine('sqlite://')
+    Model.metadata.create_all(engine)
+    placed = datetime.datetime(2024, 1, 1, 12, 30)
+    with Session(engine) as session:
+        customers = [Customer(id=i, name='c{0}'.format(i), key=uuid.uuid4())
+                     for i in range(1, 11)]
+        session.add_all(customers)
+        session.add_all(Order(id=i, status='new', total=i, customer_id=1 + i % 10,
+                              placed=placed + datetime.timedelta(hours=i),
+                              shipped=None if i % 3 else placed.date())
+                        for i in range(1, number + 1))
+        session.commit()
+    session = Session(engine)
+    stmt = select(Order).options(selectinload(Order.customer)).order_by(Order.id)
+    return session.scalars(stmt).all()
+
+
+def best(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--number', type=int, default=1000,
+                        help='rows in the page (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='rounds of each serialization (default: %(default)s)')
+    args = parser.parse_args()
+
+    page = load_page(args.number)
+    for name, kw in CASES:
+        serializer = get_serializer(Order, **kw)
+        legacy = [legacy_to_dict(instance, **kw) for instance in page]
+        # Dumped without sorting the keys, so that their order is compared too.
+        assert json.dumps(legacy) == json.dumps([serializer(instance) for instance in page]), \
+            'ModelSerializer differs from to_dict for {0}'.format(name)
+
+        before = best(lambda: [legacy_to_dict(instance, **kw) for instance in page],
+                      args.repeat)
+        after = best(lambda: [get_serializer(Order, **kw)(instance) for instance in page],
+                     args.repeat)
+        shared = best(lambda: [serializer(instance) for instance in page], args.repeat)
+        print('{0:>8}: to_dict {1:7.2f} ms, get_serializer per row {2:7.2f} ms, '
+              'one serializer {3:7.2f} ms'.format(name, before * 1e3, after * 1e3,
+                                                   shared * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import importlib
+import itertools
+
+import pytest
+from sanic import Sanic
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine, event
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, validates
+
+from va_apiprovider import APIProvider
+from va_apiprovider.database.sqlalchemy import DatabaseAlchemy
+from va_apiprovider.exception import ValidationError
+from va_apiprovider.view_sqlalchemy import SQLAView
+from va_apiprovider.view_sqlalchemy_async import AsyncSQLAView
+
+AsyncDatabaseAlchemy = importlib.import_module('va_apiprovider.database.async').DatabaseAlchemy
+
+_app_numbers = itertools.count()
+
+
+class TestAPI(object):
+    """A Sanic app serving ``customers``, ``orders``, ``widgets`` and
+    ``gadgets`` from a SQLite database, with the statements it runs recorded
+    in :attr:`statements`.
+
+    ``Widget.name`` has a validator which rejects ``'bad'``, and
+    ``Gadget.label`` is a hybrid property. `config` is set on the app before
+    the database is created, `provider` holds the arguments of the
+    :class:`APIProvider` and `options` those of each ``create_api``.
+
+    """
+    __test__ = False
+
+    def __init__(self, path, view_cls, provider=None, config=None, **options):
+        self.app = Sanic('test_api_{0}'.format(next(_app_numbers)))
+        self.app.config.update(config or {})
+        if view_cls is AsyncSQLAView:
+            uri = 'sqlite+aiosqlite:///{0}'.format(path)
+            self.db = AsyncDatabaseAlchemy(self.app, uri=uri)
+        else:
+            uri = 'sqlite:///{0}'.format(path)
+            self.db = DatabaseAlchemy(self.app, uri=uri)
+        self.path = path
+        Model = self.db.Model
+
+        class Customer(Model):
+            __tablename__ = 'customer'
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+            orders = relationship('Order', back_populates='customer')
+
+        class Order(Model):
+            __tablename__ = 'order'
+            id = Column(Integer, primary_key=True)
+            status = Column(String)
+            total = Column(Integer)
+            customer_id = Column(Integer, ForeignKey('customer.id'))
+            customer = relationship('Customer', back_populates='orders')
+
+        class Widget(Model):
+            __tablename__ = 'widget'
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+
+            @validates('name')
+            def validate_name(self, key, value):
+                if value == 'bad':
+                    raise ValidationError('name cannot be bad')
+                return value
+
+        class Gadget(Model):
+            __tablename__ = 'gadget'
+            id = Column(Integer, primary_key=True)
+            name = Column(String)
+            size = Column(Integer)
+
+            @hybrid_property
+            def label(self):
+                return '{0}-{1}'.format(self.name, self.size)
+
+        self.Customer, self.Order, self.Widget, self.Gadget = Customer, Order, Widget, Gadget
+
+        engine = create_engine('sqlite:///{0}'.format(path))
+        Model.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Customer.__table__.insert(),
+                               [dict(id=i, name='c{0}'.format(i)) for i in range(1, 4)])
+            connection.execute(Order.__table__.insert(),
+                               [dict(id=i, status='new', total=i, customer_id=1 + i % 3)
+                                for i in range(1, 10)])
+            connection.execute(Widget.__table__.insert(),
+                               [dict(id=i, name='w{0}'.format(i)) for i in range(1, 4)])
+            connection.execute(Gadget.__table__.insert(),
+                               [dict(id=i, name='g{0}'.format(i), size=i) for i in range(1, 3)])
+        engine.dispose()
+
+        self.statements = []
+        sync_engine = getattr(self.db.engine, 'sync_engine', self.db.engine)
+        event.listen(sync_engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+
+        self.api = APIProvider(app=self.app, view_cls=view_cls, db=self.db, **(provider or {}))
+        for model, name in ((Customer, 'customers'), (Order, 'orders'), (Widget, 'widgets'),
+                            (Gadget, 'gadgets')):
+            self.api.create_api(model, collection_name=name,
+                                methods=['GET', 'POST', 'PUT', 'DELETE'], **options)
+
+    @property
+    def client(self):
+        return self.app.asgi_client
+
+    def selects(self):
+        return [s for s in self.statements if s.lstrip().upper().startswith('SELECT')]
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture(params=[SQLAView, AsyncSQLAView], ids=['sync', 'async'])
+def view_cls(request):
+    return request.param
+
+
+@pytest.fixture
+def make_api(tmp_path, view_cls):
+    """Returns a function building a :class:`TestAPI` of the view class
+    under test, with the arguments it is given.
+
+    """
+    apis = []
+
+    def make(provider=None, config=None, **options):
+        api = TestAPI(tmp_path / 'test{0}.db'.format(len(apis)), view_cls, provider, config,
+                      **options)
+        apis.append(api)
+        return api
+    return make
+
+
+@pytest.fixture
+def api(make_api):
+    return make_api()
@@ -0,0 +1,37 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bulk_post(api):
+    _, response = await api.client.post('/api/orders', json=[
+        {'status': 'a', 'total': 1}, {'status': 'b'}, 5])
+    assert response.status == 520
+    assert response.json['num_created'] == 2
+    assert [o and o['status'] for o in response.json['objects']] == ['a', 'b', None]
+    assert response.json['errors'] == [{'index': 2, 'message': 'Record must be a JSON object'}]
+
+
+async def test_bulk_post_runs_validators(api):
+    _, response = await api.client.post('/api/widgets', json=[
+        {'name': 'bad'}, {'name': 'x'}, {'name': 'y'}])
+    assert response.status == 520
+    assert response.json['num_created'] == 2
+    assert response.json['objects'][0] is None
+    assert [o['name'] for o in response.json['objects'][1:]] == ['x', 'y']
+    [error] = response.json['errors']
+    assert error['index'] == 0
+    assert 'validation_errors' in error
+
+    _, response = await api.client.get('/api/widgets')
+    assert sorted(w['name'] for w in response.json['objects']) == ['w1', 'w2', 'w3', 'x', 'y']
+
+
+async def test_bulk_post_validated_batch_falls_back_per_record(api):
+    _, response = await api.client.post('/api/widgets', json=[
+        {'id': 1, 'name': 'taken'}, {'name': 'bad'}, {'name': 'z'}])
+    assert response.status == 520
+    assert response.json['num_created'] == 1
+    assert response.json['objects'][2]['name'] == 'z'
+    assert [e['index'] for e in response.json['errors']] == [0, 1]
+    assert response.json['errors'][0]['message'] == 'IntegrityError'
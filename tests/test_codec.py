@@ -0,0 +1,82 @@
+import datetime
+from decimal import Decimal
+import json
+import uuid
+
+import pytest
+from sqlalchemy import Column, Date, DateTime, Integer, Numeric, Time, Uuid
+from sqlalchemy.orm import declarative_base
+
+from va_apiprovider.codec import ORJSON_CODEC, STDLIB_CODEC, get_codec
+from va_apiprovider.helpers.sqlalchemy import get_serializer
+
+pytestmark = pytest.mark.anyio
+
+Base = declarative_base()
+
+
+class Event(Base):
+    __tablename__ = 'event'
+    id = Column(Integer, primary_key=True)
+    day = Column(Date)
+    at = Column(DateTime)
+    at_utc = Column(DateTime(timezone=True))
+    time = Column(Time)
+    amount = Column(Numeric(10, 2))
+    key = Column(Uuid)
+
+
+@pytest.mark.skipif(ORJSON_CODEC is None, reason='orjson is not installed')
+def test_native_types_encode_as_the_default_encoder():
+    event = Event(id=1, day=datetime.date(2024, 2, 29),
+                  at=datetime.datetime(2024, 2, 29, 12, 30, 5, 123456),
+                  at_utc=datetime.datetime(2024, 2, 29, 12, 30, tzinfo=datetime.timezone.utc),
+                  time=datetime.time(8, 15), amount=Decimal('12.50'),
+                  key=uuid.UUID('12345678-1234-5678-1234-567812345678'))
+    default = STDLIB_CODEC.encode(get_serializer(Event)(event))
+    native = ORJSON_CODEC.encode(get_serializer(Event, native_types=True)(event))
+    assert json.loads(native) == json.loads(default) == {
+        'id': 1, 'day': '2024-02-29', 'at': '2024-02-29T12:30:05.123456',
+        'at_utc': '2024-02-29T12:30:00+00:00', 'time': '08:15:00', 'amount': 12.5,
+        'key': '12345678-1234-5678-1234-567812345678'}
+    assert ORJSON_CODEC.encode({'amount': Decimal('0.1')}) == b'{"amount":0.1}'
+
+
+def test_get_codec():
+    assert get_codec() is STDLIB_CODEC
+    assert get_codec(STDLIB_CODEC) is STDLIB_CODEC
+    assert get_codec('json').loads(b'{"a": 1}') == {'a': 1}
+    with pytest.raises(ValueError):
+        get_codec('bogus')
+
+
+@pytest.mark.skipif(ORJSON_CODEC is None, reason='orjson is not installed')
+async def test_orjson_responses(api, make_api):
+    fast = make_api(json_codec='orjson')
+    for url in ('/api/orders', '/api/orders/3', '/api/customers?format=columnar'):
+        _, expected = await api.client.get(url)
+        _, response = await fast.client.get(url)
+        assert response.status == 200
+        assert response.json == expected.json
+
+    _, response = await fast.client.post('/api/widgets', json={'name': 'fast'})
+    assert response.status == 201
+    assert response.json['name'] == 'fast'
+
+
+async def test_columnar_format(api):
+    _, response = await api.client.get('/api/orders?results_per_page=4')
+    objects = response.json['objects']
+
+    _, response = await api.client.get('/api/orders?results_per_page=4&format=columnar')
+    assert response.status == 200
+    result = response.json
+    assert sorted(result) == ['columns', 'num_results', 'page', 'rows', 'total_pages']
+    assert result['columns'] == ['id', 'status', 'total', 'customer_id', 'customer']
+    assert (result['page'], result['num_results'], result['total_pages']) == (1, 9, 3)
+    assert all(len(row) == len(result['columns']) for row in result['rows'])
+    assert [dict(zip(result['columns'], row)) for row in result['rows']] == objects
+
+    _, response = await api.client.get('/api/orders?format=columnar&fields=id,total')
+    assert response.json['columns'] == ['id', 'total']
+    assert response.json['rows'][:2] == [[1, 1], [2, 2]]
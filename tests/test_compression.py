@@ -0,0 +1,83 @@
+import gzip
+import zlib
+
+import pytest
+
+from va_apiprovider.compression import Compression
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize('accept_encoding, encoding', [
+    ('gzip', 'gzip'),
+    ('deflate, gzip', 'gzip'),
+    ('gzip;q=0.5, deflate;q=0.8', 'deflate'),
+    ('gzip;q=0, deflate', 'deflate'),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('*;q=0.1, deflate;q=0.5', 'deflate'),
+    ('*, gzip;q=0', 'deflate'),
+    ('*;q=0', None),
+    ('GZIP;q=bogus, deflate;q=0.1', 'deflate'),
+    ('identity', None),
+    ('', None),
+    (None, None),
+])
+def test_negotiate(accept_encoding, encoding):
+    assert Compression(encodings=['gzip', 'deflate']).negotiate(accept_encoding) == encoding
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        Compression(encodings=['lzma'])
+
+
+@pytest.mark.parametrize('encoding, decompress', [
+    ('gzip', gzip.decompress),
+    ('deflate', zlib.decompress),
+])
+def test_round_trip(encoding, decompress):
+    compression = Compression()
+    data = b'{"id": 1, "name": "widget"}\n' * 100
+    assert decompress(compression.compressor(encoding).finish(data)) == data
+
+    # Each flushed chunk decodes on arrival, and the last ends the stream.
+    compressor = compression.compressor(encoding)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding == 'gzip'
+                                      else zlib.MAX_WBITS)
+    assert decompressor.decompress(compressor.chunk(data[:500])) == data[:500]
+    assert decompressor.decompress(compressor.chunk(data[500:])) == data[500:]
+    assert decompressor.decompress(compressor.finish()) == b''
+    assert decompressor.eof
+
+
+async def test_compressed_responses(make_api):
+    compression = Compression(encodings=['gzip'], min_size=200)
+    api = make_api(provider=dict(compression=compression))
+    _, plain = await api.client.get('/api/orders', headers={'accept-encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    assert plain.headers['vary'] == 'Accept-Encoding'
+
+    _, response = await api.client.get('/api/orders', headers={'accept-encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.json == plain.json
+
+    # Below min_size, the body is sent as it is, whatever the client accepts.
+    _, response = await api.client.get('/api/widgets/1', headers={'accept-encoding': 'gzip'})
+    assert 'content-encoding' not in response.headers
+    assert 'vary' not in response.headers
+    assert response.json == {'id': 1, 'name': 'w1'}
+
+    _, response = await api.client.get('/api/orders?stream=true',
+                                       headers={'accept-encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert len(response.text.splitlines()) == 9
+
+    stats = compression.stats()
+    assert stats['encodings'] == ['gzip']
+    assert stats['responses'] == 1
+    assert stats['streamed'] == 1
+    assert stats['bytes_in'] > stats['bytes_out'] > 0
+    assert stats['ratio'] == stats['bytes_in'] / stats['bytes_out']
+    assert stats['cpu_time_total'] >= 0
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_count_mode_none(make_api):
+    api = make_api(count_mode='none')
+    del api.statements[:]
+    _, response = await api.client.get('/api/widgets?results_per_page=2')
+    assert response.status == 200
+    assert response.json == {'page': 1, 'has_more': True,
+                             'objects': [{'id': 1, 'name': 'w1'}, {'id': 2, 'name': 'w2'}]}
+    assert len(api.statements) == 1
+    assert len(api.selects()) == 1
+
+    _, response = await api.client.get('/api/widgets?results_per_page=2&page=2')
+    assert response.json['has_more'] is False
+    assert [w['id'] for w in response.json['objects']] == [3]
+
+
+async def test_count_argument(api):
+    _, response = await api.client.get('/api/widgets?count=none')
+    assert response.json['has_more'] is False
+    assert 'num_results' not in response.json
+
+    _, response = await api.client.get('/api/widgets?count=bogus')
+    assert response.json['num_results'] == 3
+
+
+async def test_count_mode_estimated_is_exact_on_sqlite(make_api):
+    api = make_api(count_mode='estimated')
+    q = json.dumps({'filters': {'total': {'$gt': 2}}})
+    _, response = await api.client.get('/api/orders?results_per_page=4&q=' + q)
+    assert response.status == 200
+    assert response.json['num_results'] == 7
+    assert response.json['total_pages'] == 2
+    assert len(response.json['objects']) == 4
+
+
+async def windowed(api, url):
+    # The server version, which decides if the window is used, is only known
+    # once the engine has connected.
+    await api.client.get('/api/widgets/1')
+    del api.statements[:]
+    _, response = await api.client.get(url)
+    assert response.status == 200
+    return response.json
+
+
+async def test_window_count(api):
+    q = json.dumps({'filters': {'total': {'$gt': 2}}})
+    result = await windowed(api, '/api/widgets?results_per_page=2')
+    assert result['num_results'] == 3
+    assert result['total_pages'] == 2
+    [statement] = api.statements
+    assert 'OVER ()' in statement
+
+    result = await windowed(api, '/api/orders?results_per_page=4&page=2&q=' + q)
+    assert result['num_results'] == 7
+    assert [o['id'] for o in result['objects']] == [7, 8, 9]
+
+
+async def test_window_count_past_the_last_row(api):
+    # No row carries the window total, so it is counted separately.
+    result = await windowed(api, '/api/widgets?results_per_page=2&page=5')
+    assert result['objects'] == []
+    assert result['num_results'] == 3
+    assert result['total_pages'] == 2
+    assert 'OVER ()' in api.statements[0]
+    assert len(api.statements) == 2
+
+
+async def test_window_count_disabled(make_api):
+    api = make_api(window_count=False)
+    result = await windowed(api, '/api/widgets?results_per_page=2')
+    assert result['num_results'] == 3
+    assert not any('OVER ()' in statement for statement in api.statements)
+    assert len(api.statements) == 2
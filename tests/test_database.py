@@ -0,0 +1,345 @@
+import asyncio
+import contextvars
+import inspect
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+from sanic.response import text
+from sqlalchemy import (Column, Integer, String, create_engine, delete, event, insert, select,
+                        text as sql_text, update)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import declarative_base
+
+from va_apiprovider.database.executor import BoundedExecutor
+from va_apiprovider.database.pool import (InstrumentedAsyncAdaptedQueuePool,
+                                          InstrumentedQueuePool, pool_stats)
+from va_apiprovider.database.routing import (HAS_WRITTEN_KEY, REPLICAS_KEY, ReplicaSet,
+                                             RoutingSession, use_replica)
+from va_apiprovider.view_sqlalchemy import SQLAView
+from va_apiprovider.view_sqlalchemy_async import AsyncSQLAView
+
+pytestmark = pytest.mark.anyio
+
+
+def record_statements(engine):
+    statements = []
+    event.listen(getattr(engine, 'sync_engine', engine), 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+# -----------------------
+# Executor (offload mode)
+# -----------------------
+async def test_bounded_executor_stats():
+    executor = BoundedExecutor(1)
+    try:
+        results = await asyncio.gather(*(executor.run(time.sleep, 0.05) for _ in range(3)))
+        assert results == [None] * 3
+        stats = executor.stats()
+    finally:
+        executor.shutdown()
+    assert (stats['max_workers'], stats['queue_depth'], stats['active'],
+            stats['completed']) == (1, 0, 0, 3)
+    # The second and third calls waited for the first ones.
+    assert stats['wait_time_max'] >= 0.09
+    assert stats['wait_time_total'] >= stats['wait_time_max']
+    assert stats['wait_time_avg'] == pytest.approx(stats['wait_time_total'] / 3)
+
+
+@pytest.mark.parametrize('view_cls', [SQLAView], ids=['sync'])
+@pytest.mark.parametrize('offload', [True, False])
+async def test_offloaded_handlers_run_on_db_threads(make_api, offload):
+    api = make_api(config={'SQLALCHEMY_OFFLOAD': offload})
+    threads = []
+    event.listen(api.db.engine, 'before_cursor_execute',
+                 lambda *args: threads.append(threading.current_thread().name))
+
+    for method, url, body in (('get', '/api/customers', None),
+                              ('get', '/api/customers/1', None),
+                              ('post', '/api/orders', {'status': 'a'}),
+                              ('put', '/api/orders/1', {'status': 'b'}),
+                              ('delete', '/api/orders/2', None)):
+        del threads[:]
+        kw = {} if body is None else dict(json=body)
+        _, response = await getattr(api.client, method)(url, **kw)
+        assert response.status in (200, 201, 204), url
+        assert threads, url
+        on_executor = [name.startswith('va_apiprovider-db_') for name in threads]
+        assert on_executor == [offload] * len(threads), url
+
+
+@pytest.mark.parametrize('view_cls', [SQLAView], ids=['sync'])
+async def test_executor_size(make_api):
+    api = make_api()
+    assert api.db.executor is None
+
+    api = make_api(config={'SQLALCHEMY_OFFLOAD': True, 'SQLALCHEMY_POOL_SIZE': 2,
+                           'SQLALCHEMY_MAX_OVERFLOW': 1})
+    assert api.db.executor.max_workers == 3
+
+    api = make_api(config={'SQLALCHEMY_OFFLOAD': True, 'SQLALCHEMY_EXECUTOR_WORKERS': 2})
+    assert api.db.executor.max_workers == 2
+
+
+# -----------------------
+# Pool
+# -----------------------
+async def test_pool_config(make_api, view_cls):
+    api = make_api(config={'SQLALCHEMY_POOL_SIZE': 2, 'SQLALCHEMY_MAX_OVERFLOW': 1,
+                           'SQLALCHEMY_POOL_TIMEOUT': 3})
+    pool = api.db.engine.pool
+    expected = (InstrumentedAsyncAdaptedQueuePool if view_cls is AsyncSQLAView
+                else InstrumentedQueuePool)
+    assert type(pool) is expected
+    stats = api.db.pool_stats()
+    assert stats['pool'] == expected.__name__
+    assert (stats['size'], stats['max_overflow'], stats['timeout'],
+            stats['capacity']) == (2, 1, 3, 3)
+    assert 'replicas' not in stats
+
+
+async def test_pool_stats_checkouts(make_api):
+    api = make_api()
+    during = []
+    event.listen(getattr(api.db.engine, 'sync_engine', api.db.engine), 'before_cursor_execute',
+                 lambda *args: during.append(api.db.pool_stats()['checked_out']))
+    _, response = await api.client.get('/api/customers')
+    assert response.status == 200
+    assert during and set(during) == {1}
+    stats = api.db.pool_stats()
+    assert (stats['checked_out'], stats['idle'], stats['overflow']) == (0, 1, 0)
+    assert (stats['waits'], stats['waiting'], stats['timeouts']) == (0, 0, 0)
+
+
+def test_pool_stats_waits(tmp_path):
+    pool = InstrumentedQueuePool(lambda: sqlite3.connect(str(tmp_path / 'pool.db'),
+                                                         check_same_thread=False),
+                                 pool_size=1, max_overflow=0, timeout=0.05)
+    held = pool.connect()
+    with pytest.raises(PoolTimeoutError):
+        pool.connect()
+    assert pool_stats(pool)['timeouts'] == 1
+
+    release = threading.Timer(0.05, held.close)
+    release.start()
+    pool._timeout = 1
+    connection = pool.connect()
+    release.join()
+    stats = pool_stats(pool)
+    assert stats['checked_out'] == 1
+    assert (stats['waits'], stats['waiting'], stats['timeouts']) == (2, 0, 1)
+    assert stats['wait_time_max'] >= 0.04
+    connection.close()
+
+    # A checkout which finds an idle connection does not wait.
+    pool.connect().close()
+    assert pool_stats(pool)['waits'] == 2
+
+
+async def test_async_pool_stats_waits(tmp_path):
+    engine = create_async_engine('sqlite+aiosqlite:///{0}'.format(tmp_path / 'pool.db'),
+                                 poolclass=InstrumentedAsyncAdaptedQueuePool, pool_size=1,
+                                 max_overflow=0)
+
+    async def release(connection):
+        await asyncio.sleep(0.05)
+        await connection.close()
+
+    async def read():
+        async with engine.connect() as connection:
+            return (await connection.execute(sql_text('SELECT 1'))).scalar()
+
+    try:
+        held = await engine.connect()
+        _, value = await asyncio.gather(release(held), read())
+        assert value == 1
+        stats = pool_stats(engine.pool)
+    finally:
+        await engine.dispose()
+    assert (stats['waits'], stats['waiting'], stats['checked_out']) == (1, 0, 0)
+    assert stats['wait_time_max'] >= 0.04
+
+
+# -----------------------
+# Lazy session
+# -----------------------
+@pytest.mark.parametrize('view_cls', [AsyncSQLAView], ids=['async'])
+async def test_session_is_created_on_first_use(make_api):
+    api = make_api()
+
+    @api.app.get('/ping')
+    async def ping(request):
+        return text('pong')
+
+    sessions = []
+    sessionmaker = api.db._make_sessionmaker()
+
+    def make_session():
+        sessions.append(sessionmaker())
+        return sessions[-1]
+    api.db._sessionmaker = make_session
+
+    _, response = await api.client.get('/ping')
+    assert response.status == 200
+    assert sessions == [] and api.statements == []
+
+    _, response = await api.client.get('/api/widgets/1')
+    assert response.status == 200
+    assert len(sessions) == 1
+
+    with pytest.raises(RuntimeError):
+        contextvars.Context().run(lambda: api.db.session)
+
+
+# -----------------------
+# Replicas
+# -----------------------
+async def test_reads_go_to_the_replica(make_api, view_cls, tmp_path):
+    replica = tmp_path / 'replica.db'
+    driver = 'sqlite+aiosqlite' if view_cls is AsyncSQLAView else 'sqlite'
+    api = make_api(config={'SQLALCHEMY_REPLICA_URIS': ['{0}:///{1}'.format(driver, replica)]})
+    shutil.copy(str(api.path), str(replica))
+    with sqlite3.connect(str(replica)) as connection:
+        connection.execute("UPDATE customer SET name = 'replica' || id")
+    [engine] = api.db.replicas.engines
+    primary, replicated = api.statements, record_statements(engine)
+
+    _, response = await api.client.get('/api/customers')
+    assert [c['name'] for c in response.json['objects']] == ['replica1', 'replica2', 'replica3']
+    _, response = await api.client.get('/api/customers/1')
+    assert response.json['name'] == 'replica1'
+    assert primary == [] and replicated
+    assert api.db.pool_stats()['replicas'][0]['checked_out'] == 0
+
+    # Writes and the reads which return them go to the primary.
+    del replicated[:]
+    _, response = await api.client.post('/api/customers', json={'name': 'new'})
+    assert response.status == 201
+    assert response.json['name'] == 'new'
+    _, response = await api.client.put('/api/customers/1', json={'name': 'changed'})
+    assert response.status == 200
+    assert response.json['name'] == 'changed'
+    assert replicated == []
+    assert any(s.startswith('INSERT') for s in primary)
+    assert any(s.startswith('UPDATE') for s in primary)
+
+    # The replica is not replicated to here, so reads still see its rows.
+    _, response = await api.client.get('/api/customers/1')
+    assert response.json['name'] == 'replica1'
+
+
+class Row(declarative_base()):
+    __tablename__ = 'row'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@pytest.fixture
+def routed(tmp_path):
+    """A :class:`RoutingSession` on a primary with one replica, whose rows
+    are named after their database.
+
+    """
+    engines = []
+    for name in ('primary', 'replica'):
+        engine = create_engine('sqlite:///{0}'.format(tmp_path / '{0}.db'.format(name)))
+        Row.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(Row).values(id=1, name=name))
+        engines.append(engine)
+    with RoutingSession(bind=engines[0], info={REPLICAS_KEY: ReplicaSet(engines[1:])}) as session:
+        yield session
+    for engine in engines:
+        engine.dispose()
+
+
+def read(session):
+    name = session.execute(select(Row.name).where(Row.id == 1)).scalar()
+    session.rollback()
+    return name
+
+
+@pytest.mark.parametrize('write', [
+    lambda session: session.execute(update(Row).values(name='written')),
+    lambda session: session.execute(insert(Row).values(id=2, name='written')),
+    lambda session: session.execute(delete(Row).where(Row.id == 2)),
+    lambda session: session.add(Row(id=2, name='written')) or session.flush(),
+], ids=['update', 'insert', 'delete', 'flush'])
+def test_routing_session(routed, write):
+    # Only read-only sessions use the replicas.
+    assert read(routed) == 'primary'
+    use_replica(routed)
+    assert read(routed) == 'replica'
+    assert HAS_WRITTEN_KEY not in routed.info
+
+    write(routed)
+    assert routed.info[HAS_WRITTEN_KEY]
+    assert routed.get_bind() is routed.bind
+    routed.rollback()
+    # Once written, the session stays on the primary.
+    assert read(routed) == 'primary'
+
+
+def test_replica_strategies(tmp_path):
+    engines = [create_engine('sqlite:///{0}'.format(tmp_path / 'replica{0}.db'.format(i)))
+               for i in range(2)]
+    replicas = ReplicaSet(engines)
+    assert [replicas.pick() for _ in range(3)] == [engines[0], engines[1], engines[0]]
+
+    replicas = ReplicaSet(engines, strategy='least_connections')
+    with engines[0].connect():
+        assert replicas.pick() is engines[1]
+    with engines[1].connect(), engines[1].connect():
+        assert replicas.pick() is engines[0]
+    with pytest.raises(ValueError):
+        ReplicaSet(engines, strategy='random')
+
+
+# -----------------------
+# AsyncSQLAView
+# -----------------------
+@pytest.mark.parametrize('view_cls', [AsyncSQLAView], ids=['async'])
+async def test_async_view_runs_sync_helpers_in_run_sync(make_api, monkeypatch):
+    api = make_api()
+    calls = []
+    for name in ('_dict_to_inst', '_insert_many', '_update_single', '_update_relations',
+                 '_upsert_many'):
+        def spy(self, *args, _name=name, _method=getattr(SQLAView, name)):
+            session = inspect.signature(_method).bind(self, *args).arguments['session']
+            calls.append((_name, type(session)))
+            return _method(self, *args)
+        monkeypatch.setattr(SQLAView, name, spy)
+
+    async def request(method, url, body, status):
+        kw = {} if body is None else dict(json=body)
+        _, response = await getattr(api.client, method)(url, **kw)
+        assert response.status == status, response.json
+        return response.json
+
+    await request('post', '/api/customers',
+                  {'name': 'n', 'orders': [{'id': 1}, {'status': 'x'}]}, 201)
+    await request('post', '/api/orders', [{'status': 'a'}, {'status': 'b'}], 201)
+    await request('put', '/api/orders/2', {'status': 'paid'}, 200)
+    await request('put', '/api/customers/2', {'orders': {'add': [{'id': 3}]}}, 200)
+    await request('put', '/api/orders?upsert=true', [{'id': 4, 'status': 'u'}], 200)
+
+    assert [name for name, _ in calls] == ['_dict_to_inst', '_insert_many',
+                                             '_update_single', '_update_relations',
+                                             '_upsert_many']
+    # The helpers get the synchronous session of the AsyncSession, which is
+    # only usable inside run_sync.
+    assert all(issubclass(session, RoutingSession) for _, session in calls)
+    assert not any(issubclass(session, AsyncSession) for _, session in calls)
+
+    customer = await request('get', '/api/customers/4', None, 200)
+    assert sorted(o['id'] for o in customer['orders']) == [1, 10]
+    customer = await request('get', '/api/customers/2', None, 200)
+    assert 3 in [o['id'] for o in customer['orders']]
+    orders = await request('get', '/api/orders?results_per_page=20', None, 200)
+    statuses = dict((o['id'], o['status']) for o in orders['objects'])
+    assert (statuses[2], statuses[4], statuses[11], statuses[12]) == ('paid', 'u', 'a', 'b')
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+
+from va_apiprovider import export
+
+pytestmark = pytest.mark.anyio
+
+
+def read_csv(response):
+    assert response.status == 200
+    assert response.headers['content-type'] == 'text/csv; charset=utf-8'
+    return list(csv.reader(io.StringIO(response.text)))
+
+
+async def test_export_csv(make_api):
+    api = make_api(export=True)
+    _, response = await api.client.get('/api/orders/-/export')
+    rows = read_csv(response)
+    assert rows[0] == ['id', 'status', 'total', 'customer_id']
+    assert rows[1] == ['1', 'new', '1', '2']
+    assert len(rows) == 10
+
+    q = json.dumps({'filters': {'total': {'$gt': 6}},
+                    'order_by': [{'field': 'total', 'direction': 'desc'}]})
+    _, response = await api.client.get('/api/orders/-/export?fields=id,total&q=' + q)
+    assert read_csv(response) == [['id', 'total'], ['9', '9'], ['8', '8'], ['7', '7']]
+
+
+async def test_export_errors(make_api, monkeypatch):
+    api = make_api(export=True)
+    _, response = await api.client.get('/api/orders/-/export?fields=bogus')
+    assert response.status == 520
+    assert response.json == {'message': "Invalid field 'bogus'"}
+
+    _, response = await api.client.get('/api/orders/-/export?format=xml')
+    assert response.status == 520
+    assert response.json == {'message': 'format must be one of csv, arrow'}
+
+    monkeypatch.setattr(export, 'pyarrow', None)
+    _, response = await api.client.get('/api/orders/-/export?format=arrow')
+    assert response.status == 520
+    assert response.json == {
+        'message': 'The arrow format needs pyarrow, which is not installed'}
+
+
+async def test_export_route_does_not_shadow_instances(make_api):
+    api = make_api(export=True)
+    # An instance whose primary key is "export" is still reachable.
+    _, response = await api.client.get('/api/orders/export')
+    assert response.status == 520
+    assert response.json == {'message': 'No result found'}
@@ -0,0 +1,100 @@
+import pytest
+
+from va_apiprovider.view_sqlalchemy import SQLAView
+
+pytestmark = pytest.mark.anyio
+
+
+def selected(statement):
+    """Returns the names of the columns selected by `statement`."""
+    columns = statement.split('FROM')[0].replace('SELECT', '').split(',')
+    return [column.split(' AS ')[0].strip().split('.')[-1].strip('"') for column in columns]
+
+
+@pytest.fixture
+def row_columns(monkeypatch):
+    """Records the columns :meth:`SQLAView._row_columns` reads in row mode,
+    or ``None`` when a GET_MANY loads instances.
+
+    """
+    calls = []
+    row_columns = SQLAView._row_columns
+
+    def record(self, deep, keep=()):
+        columns = row_columns(self, deep, keep)
+        calls.append(None if columns is None else [c.key for c in columns])
+        return columns
+    monkeypatch.setattr(SQLAView, '_row_columns', record)
+    return calls
+
+
+async def get(api, url):
+    del api.statements[:]
+    _, response = await api.client.get(url)
+    assert response.status == 200
+    return response.json['objects']
+
+
+def page_select(api):
+    [statement] = [s for s in api.selects() if not s.startswith('SELECT count(*) AS')]
+    return statement
+
+
+async def test_row_mode_selects_the_requested_columns(api, row_columns):
+    objects = await get(api, '/api/orders?fields=id,total')
+    assert objects[:2] == [{'id': 1, 'total': 1}, {'id': 2, 'total': 2}]
+    assert row_columns == [['id', 'total']]
+    assert selected(page_select(api)) == ['id', 'total']
+
+
+async def test_row_mode_skips_hybrids_and_relations(api, row_columns):
+    # The hybrid property is not serialized, so it is not selected either.
+    objects = await get(api, '/api/gadgets')
+    assert objects[0] == {'id': 1, 'name': 'g1', 'size': 1}
+    assert row_columns.pop() == ['id', 'name', 'size']
+    assert selected(page_select(api))[:3] == ['id', 'name', 'size']
+
+    # The relation needs instances.
+    objects = await get(api, '/api/orders?results_per_page=1')
+    assert objects == [{'id': 1, 'status': 'new', 'total': 1, 'customer_id': 2,
+                        'customer': {'id': 2, 'name': 'c2'}}]
+    assert row_columns.pop() is None
+
+    objects = await get(api, '/api/gadgets?fields=id,size')
+    assert objects == [{'id': 1, 'size': 1}, {'id': 2, 'size': 2}]
+    assert row_columns.pop() == ['id', 'size']
+
+
+async def test_fields_without_row_mode(make_api, row_columns):
+    api = make_api(row_mode=False)
+    objects = await get(api, '/api/orders?fields=id,total')
+    assert objects[0] == {'id': 1, 'total': 1}
+    assert row_columns == [None]
+    # Instances loaded with load_only() of the fields and the foreign keys.
+    assert selected(page_select(api)) == ['id', 'total', 'customer_id']
+
+
+async def test_dotted_relation_fields(api):
+    objects = await get(api, '/api/orders?results_per_page=2&fields=id,customer.name')
+    assert objects == [{'id': 1, 'customer': {'name': 'c2'}},
+                       {'id': 2, 'customer': {'name': 'c3'}}]
+
+    objects = await get(api, '/api/orders?results_per_page=1&fields=total,customer')
+    assert objects == [{'total': 1, 'customer': {'id': 2, 'name': 'c2'}}]
+
+    objects = await get(api, '/api/customers?results_per_page=1&fields=name,orders.total')
+    assert objects == [{'name': 'c1', 'orders': [{'total': 3}, {'total': 6}, {'total': 9}]}]
+
+
+@pytest.mark.parametrize('fields, invalid', [
+    ('bogus', 'bogus'), ('id,bogus', 'bogus'), ('customer.bogus', 'customer.bogus'),
+    ('bogus.id', 'bogus.id'),
+])
+async def test_unknown_field(api, fields, invalid):
+    _, response = await api.client.get('/api/orders?fields=' + fields)
+    assert response.status == 520
+    assert response.json == {'message': "Invalid field '{0}'".format(invalid)}
+
+    _, response = await api.client.get('/api/gadgets?fields=label')
+    assert response.status == 520
+    assert response.json == {'message': "Invalid field 'label'"}
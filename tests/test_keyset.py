@@ -0,0 +1,50 @@
+import base64
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+async def walk(api, order_by):
+    q = json.dumps({'order_by': order_by})
+    url = '/api/orders?results_per_page=2&q=' + q
+    _, response = await api.client.get(url)
+    assert response.status == 200
+    pages = [response.json['objects']]
+    while response.json['next_cursor'] is not None:
+        _, response = await api.client.get(url + '&cursor=' + response.json['next_cursor'])
+        assert response.status == 200
+        pages.append(response.json['objects'])
+    return pages
+
+
+@pytest.mark.parametrize('order_by, key', [
+    ([], lambda o: o['id']),
+    ([{'field': 'total', 'direction': 'desc'}], lambda o: -o['total']),
+    ([{'field': 'customer_id', 'direction': 'asc'}, {'field': 'total', 'direction': 'desc'}],
+     lambda o: (o['customer_id'], -o['total'])),
+], ids=['pk', 'desc', 'mixed'])
+async def test_cursor_walks_every_row_once(make_api, order_by, key):
+    api = make_api(pagination='cursor')
+    pages = await walk(api, order_by)
+    assert [len(page) for page in pages] == [2, 2, 2, 2, 1]
+    objects = [o for page in pages for o in page]
+    assert sorted(o['id'] for o in objects) == list(range(1, 10))
+    assert objects == sorted(objects, key=key)
+
+
+@pytest.mark.parametrize('value', [
+    '!!!', 'bm90IGpzb24', cursor([1, 2]), cursor({'id': 1}), cursor([{'id': 1}]),
+    cursor([[1]]),
+])
+async def test_tampered_cursor(make_api, value):
+    api = make_api(pagination='cursor')
+    _, response = await api.client.get('/api/orders?cursor=' + value)
+    assert response.status == 520
+    assert response.json == {'message': 'Invalid cursor'}
+
@@ -0,0 +1,53 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+#: A fragment of the statement which loads the relation, by loader.
+LOADER_SQL = {
+    'joined': 'LEFT OUTER JOIN',
+    'selectin': ' IN (',
+    'subquery': 'FROM (SELECT',
+}
+
+URLS = ['/api/customers', '/api/customers?results_per_page=2', '/api/customers/1',
+        '/api/orders?results_per_page=3', '/api/orders/4']
+
+
+async def responses(api):
+    # Once the engine has connected, pages and their totals are one SELECT.
+    await api.client.get('/api/widgets/1')
+    results = []
+    for url in URLS:
+        del api.statements[:]
+        _, response = await api.client.get(url)
+        assert response.status == 200
+        results.append((response.json, list(api.statements)))
+    return results
+
+
+@pytest.mark.parametrize('loader', sorted(LOADER_SQL))
+async def test_relation_loaders(make_api, loader):
+    expected = await responses(make_api())
+    api = make_api(relation_loaders={'orders': loader, 'customer': loader})
+    for url, (body, statements), (expected_body, _) in zip(URLS, await responses(api),
+                                                           expected):
+        assert body == expected_body, url
+        if loader == 'joined':
+            [statement] = statements
+        else:
+            page, statement = statements
+        assert LOADER_SQL[loader] in statement, url
+
+
+async def test_default_and_lazy_loaders(make_api):
+    api = make_api()
+    [(_, statements)] = [r for url, r in zip(URLS, await responses(api))
+                         if url == '/api/customers']
+    # selectin for collections, joined for scalar relations
+    assert len(statements) == 2 and LOADER_SQL['selectin'] in statements[1]
+
+    api = make_api(relation_loaders={'orders': 'lazy'})
+    [(body, statements)] = [r for url, r in zip(URLS, await responses(api))
+                            if url == '/api/customers']
+    assert [len(customer['orders']) for customer in body['objects']] == [3, 3, 3]
+    assert len(statements) == 4
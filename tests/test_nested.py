@@ -0,0 +1,45 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_nested_records_statement_count(api):
+    _, response = await api.client.post('/api/orders', json=[{'status': 'old'}] * 300)
+    assert response.status == 201
+    ids = [order['id'] for order in response.json['objects']]
+
+    counts = []
+    for n in (10, 50, 100):
+        existing = [{'id': ids.pop(), 'status': 'moved'} for _ in range(n)]
+        del api.statements[:]
+        _, response = await api.client.post('/api/customers',
+                                            json={'name': 'x', 'orders': existing})
+        assert response.status == 201
+        assert len(response.json['orders']) == n
+        counts.append(len(api.statements))
+    assert len(set(counts)) == 1
+
+    # New rows are inserted one by one by the unit of work on SQLite, but the
+    # existing ones are still loaded together.
+    selects = []
+    for n in (10, 50):
+        existing = [{'id': ids.pop()} for _ in range(n)]
+        new = [{'status': 'new'} for _ in range(n)]
+        del api.statements[:]
+        _, response = await api.client.post('/api/customers',
+                                            json={'name': 'y', 'orders': existing + new})
+        assert response.status == 201
+        selects.append(len(api.selects()))
+    assert len(set(selects)) == 1
+
+
+async def test_nested_primary_keys_are_converted(api):
+    _, response = await api.client.post('/api/customers', json={
+        'name': 'x', 'orders': [{'id': 1.0, 'status': 'moved'}, {'id': '02'}]})
+    assert response.status == 201
+    assert sorted(order['id'] for order in response.json['orders']) == [1, 2]
+
+    _, response = await api.client.get('/api/orders/1')
+    assert response.json['status'] == 'moved'
+    _, response = await api.client.get('/api/orders')
+    assert response.json['num_results'] == 9
@@ -0,0 +1,25 @@
+import pytest
+
+from va_apiprovider.exception import IllegalArgumentError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize('options', [
+    dict(pagination='bogus'),
+    dict(count_mode='bogus'),
+    dict(relation_loaders={'orders': 'bogus'}),
+    dict(paginaton='cursor'),
+])
+def test_invalid_options_fail_at_setup(api, options):
+    with pytest.raises(IllegalArgumentError):
+        api.api.create_api(api.Order, collection_name='other', methods=['GET'], **options)
+
+
+async def test_valid_options(api):
+    api.api.create_api(api.Order, collection_name='other', methods=['GET'],
+                       pagination='cursor', count_mode='none',
+                       relation_loaders={'customer': 'joined'})
+    _, response = await api.client.get('/api/other')
+    assert response.status == 200
+    assert len(response.json['objects']) == 9
@@ -0,0 +1,45 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_put_many_by_statement(api):
+    del api.statements[:]
+    _, response = await api.client.put('/api/orders', json={
+        'status': 'paid', 'q': {'filters': {'total': {'$gt': 5}}}})
+    assert response.json == {'num_modified': 4}
+    assert [s.split()[0] for s in api.statements] == ['UPDATE']
+
+
+async def test_put_many_runs_validators(api):
+    _, response = await api.client.put('/api/widgets', json={'name': 'bad'})
+    assert response.status == 520
+    assert 'validation_errors' in response.json
+    _, response = await api.client.get('/api/widgets')
+    assert [w['name'] for w in response.json['objects']] == ['w1', 'w2', 'w3']
+
+    _, response = await api.client.put('/api/widgets', json={'name': 'fine'})
+    assert response.json == {'num_modified': 3}
+    _, response = await api.client.get('/api/widgets')
+    assert [w['name'] for w in response.json['objects']] == ['fine'] * 3
+
+
+async def test_put_single_by_statement(api):
+    del api.statements[:]
+    _, response = await api.client.put('/api/orders/3', json={'status': 'paid'})
+    assert response.status == 200
+    assert response.json['status'] == 'paid'
+    assert response.json['customer']['id'] == 1
+    assert len(api.statements) <= 2
+
+
+async def test_put_single_runs_validators(api):
+    _, response = await api.client.put('/api/widgets/1', json={'name': 'bad'})
+    assert response.status == 520
+    assert 'validation_errors' in response.json
+    _, response = await api.client.get('/api/widgets/1')
+    assert response.json['name'] == 'w1'
+
+    _, response = await api.client.put('/api/widgets/1', json={'name': 'good'})
+    assert response.status == 200
+    assert response.json == {'id': 1, 'name': 'good'}
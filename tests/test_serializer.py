@@ -0,0 +1,180 @@
+import datetime
+import uuid
+from collections import OrderedDict
+
+import pytest
+from sqlalchemy import Column, Date, ForeignKey, Integer, String, Uuid
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import configure_mappers, declarative_base, relationship
+
+from va_apiprovider.helpers import sqlalchemy as helpers
+from va_apiprovider.helpers.sqlalchemy import (ModelSerializer, get_relations, get_serializer,
+                                               model_metadata, to_dict)
+
+Model = declarative_base()
+
+KEY = uuid.UUID('12345678-1234-5678-1234-567812345678')
+
+
+class Customer(Model):
+    __tablename__ = 'customer'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    key = Column(Uuid)
+    orders = relationship('Order', back_populates='customer')
+
+
+class Order(Model):
+    __tablename__ = 'order'
+    id = Column(Integer, primary_key=True)
+    status = Column(String)
+    total = Column(Integer)
+    shipped = Column(Date)
+    customer_id = Column(Integer, ForeignKey('customer.id'))
+    customer = relationship('Customer', back_populates='orders')
+
+    @hybrid_property
+    def doubled(self):
+        return self.total * 2
+
+    def label(self):
+        return '{0}-{1}'.format(self.id, self.status)
+
+
+@pytest.fixture
+def customer():
+    customer = Customer(id=1, name='c1', key=KEY)
+    customer.orders = [Order(id=1, status='new', total=2, shipped=datetime.date(2024, 1, 2),
+                             customer_id=1),
+                       Order(id=2, status='paid', total=3, customer_id=1)]
+    return customer
+
+
+@pytest.fixture
+def serializers(monkeypatch):
+    """An empty cache of two serializers."""
+    monkeypatch.setattr(helpers, '_serializers', OrderedDict())
+    monkeypatch.setattr(helpers, 'SERIALIZER_CACHE_SIZE', 2)
+    return helpers._serializers
+
+
+def test_columns(customer):
+    order = customer.orders[0]
+    serializer = ModelSerializer(Order)
+    assert list(serializer(order).items()) == [
+        ('id', 1), ('status', 'new'), ('total', 2), ('shipped', '2024-01-02'),
+        ('customer_id', 1)]
+    assert serializer.names == ['id', 'status', 'total', 'shipped', 'customer_id']
+    assert serializer(customer.orders[1])['shipped'] is None
+    assert ModelSerializer(Customer)(customer) == dict(id=1, name='c1', key=str(KEY))
+    # Values are left for the JSON encoder.
+    assert ModelSerializer(Order, native_types=True)(order)['shipped'] == datetime.date(2024, 1, 2)
+    assert ModelSerializer(Customer, native_types=True)(customer)['key'] == KEY
+
+
+def test_exclude_and_include(customer):
+    order = customer.orders[0]
+    assert ModelSerializer(Order, exclude=['total', 'shipped'])(order) == dict(
+        id=1, status='new', customer_id=1)
+    assert ModelSerializer(Order, include=['status', 'id'])(order) == dict(id=1, status='new')
+    assert ModelSerializer(Order, include=[])(order) == {}
+    with pytest.raises(ValueError):
+        ModelSerializer(Order, exclude=['total'], include=['id'])
+    with pytest.raises(ValueError):
+        ModelSerializer(Order, exclude_relations={'customer': ['key']}, include=['id'])
+
+
+def test_methods_and_hybrids(customer):
+    order = customer.orders[0]
+    serializer = ModelSerializer(Order, include=['id'], include_methods=['label', 'doubled'])
+    assert list(serializer(order).items()) == [('id', 1), ('label', '1-new'), ('doubled', 4)]
+    assert serializer.names == ['id', 'label', 'doubled']
+
+
+def test_relations(customer):
+    serializer = ModelSerializer(Customer, deep={'orders': {}}, include=['name'],
+                                 include_relations={'orders': ['id', 'status']})
+    assert serializer(customer) == dict(name='c1', orders=[dict(id=1, status='new'),
+                                                           dict(id=2, status='paid')])
+
+    order = customer.orders[1]
+    serializer = ModelSerializer(Order, deep={'customer': {}}, exclude=['shipped'],
+                                 exclude_relations={'customer': ['key']},
+                                 include_methods=['customer.name'])
+    assert serializer(order) == dict(id=2, status='paid', total=3, customer_id=1,
+                                     customer=dict(id=1, name='c1'))
+
+    # Nested relations
+    nested = ModelSerializer(Customer, deep={'orders': {'customer': {}}},
+                             include_relations={'orders': ['id']})
+    [first, _] = nested(customer)['orders']
+    assert first == dict(id=1, customer=dict(id=1, name='c1', key=str(KEY)))
+
+    order.customer = None
+    assert serializer(order)['customer'] is None
+
+
+def test_matches_to_dict(customer):
+    for kw in (dict(), dict(deep={'orders': {}}), dict(exclude=['key']),
+               dict(deep={'orders': {}}, include_methods=['orders.label'])):
+        assert ModelSerializer(Customer, **kw)(customer) == to_dict(customer, **kw)
+
+
+def test_row_columns(customer):
+    order = customer.orders[0]
+    serializer = ModelSerializer(Order, exclude=['customer_id'])
+    assert serializer.row_columns == ['id', 'status', 'total', 'shipped']
+    row = (1, 'new', 2, datetime.date(2024, 1, 2))
+    assert serializer.serialize_row(row) == serializer(order)
+    assert serializer.row_values(row) == [1, 'new', 2, '2024-01-02']
+
+    # Relations and methods need the instance.
+    assert ModelSerializer(Order, deep={'customer': {}}).row_columns is None
+    assert ModelSerializer(Order, include_methods=['doubled']).row_columns is None
+
+
+def test_get_serializer_is_shared(serializers):
+    serializer = get_serializer(Order, deep={'customer': {}}, exclude=['total'])
+    assert isinstance(serializer, ModelSerializer)
+    # Equal arguments in new lists and dictionaries find the same serializer.
+    assert get_serializer(Order, deep={'customer': {}}, exclude=['total']) is serializer
+    assert get_serializer(Order, deep={'customer': {}}, exclude=['id']) is not serializer
+    assert get_serializer(Order, deep={'customer': {}}, exclude=('total',)) is serializer
+    assert get_serializer(Customer, deep={'customer': {}}, exclude=['total']) \
+        is not serializer
+
+
+def test_get_serializer_copies_its_arguments(serializers, customer):
+    exclude = ['total']
+    serializer = get_serializer(Order, exclude=exclude)
+    exclude.append('status')
+    assert 'status' in serializer(customer.orders[0])
+    assert get_serializer(Order, exclude=['total']) is serializer
+
+
+def test_get_serializer_keeps_the_most_recently_used(serializers):
+    first = get_serializer(Order)
+    second = get_serializer(Customer)
+    assert get_serializer(Order) is first
+    get_serializer(Order, exclude=['total'])
+    assert len(serializers) == 2
+    # Customer was used least recently.
+    assert get_serializer(Order) is first
+    assert get_serializer(Customer) is not second
+
+
+def test_model_metadata_registry():
+    metadata = model_metadata(Customer)
+    assert model_metadata(Customer) is metadata
+    assert sorted(get_relations(Customer)) == ['orders']
+
+    # A new mapper may add a backref to a model already introspected.
+    class Note(Model):
+        __tablename__ = 'note'
+        id = Column(Integer, primary_key=True)
+        customer_id = Column(Integer, ForeignKey('customer.id'))
+        customer = relationship('Customer', backref='notes')
+
+    configure_mappers()
+    assert model_metadata(Customer) is not metadata
+    assert sorted(get_relations(Customer)) == ['notes', 'orders']
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from va_apiprovider.view_sqlalchemy import SQLAView
+
+pytestmark = pytest.mark.anyio
+
+
+def ndjson(response):
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def checked_out(api):
+    return getattr(api.db.engine, 'sync_engine', api.db.engine).pool.checkedout()
+
+
+async def test_stream_matches_get(api):
+    _, response = await api.client.get('/api/orders')
+    objects = response.json['objects']
+
+    _, response = await api.client.get('/api/orders?stream=true')
+    assert response.status == 200
+    assert ndjson(response) == objects
+
+    _, response = await api.client.get('/api/orders',
+                                       headers={'accept': 'application/x-ndjson'})
+    assert ndjson(response) == objects
+
+    _, response = await api.client.get('/api/orders?stream=true&results_per_page=4&page=2')
+    assert ndjson(response) == objects[4:8]
+
+
+async def test_stream_batches_and_session_lifetime(make_api, monkeypatch):
+    api = make_api(stream_batch_size=2)
+    events = []
+    ndjson_lines = SQLAView._ndjson_lines
+    end_session = api.db.end_session
+
+    def lines(self, instances, serialize):
+        events.append(len(instances))
+        return ndjson_lines(self, instances, serialize)
+
+    async def end(request):
+        events.append('end')
+        await end_session(request)
+
+    monkeypatch.setattr(SQLAView, '_ndjson_lines', lines)
+    monkeypatch.setattr(api.db, 'end_session', end)
+    _, response = await api.client.get('/api/orders?stream=true')
+    assert len(ndjson(response)) == 9
+    # The session is ended once, after the last batch.
+    assert events == [2, 2, 2, 2, 1, 'end']
+    assert checked_out(api) == 0
+
+
+@pytest.mark.parametrize('loader', ['joined', 'selectin', 'subquery'])
+async def test_stream_collection_loaders(make_api, loader):
+    api = make_api(relation_loaders={'orders': loader})
+    _, response = await api.client.get('/api/customers')
+    objects = response.json['objects']
+    assert [len(c['orders']) for c in objects] == [3, 3, 3]
+
+    _, response = await api.client.get('/api/customers?stream=true')
+    assert response.status == 200
+    assert ndjson(response) == objects
+    assert checked_out(api) == 0
+
+
+async def test_stream_compressed(make_api):
+    api = make_api(provider=dict(compression=dict(encodings=['gzip'])))
+    _, response = await api.client.get('/api/orders')
+    objects = response.json['objects']
+
+    headers = {'accept-encoding': 'gzip'}
+    _, response = await api.client.get('/api/orders?stream=true', headers=headers)
+    assert response.headers['content-encoding'] == 'gzip'
+    assert ndjson(response) == objects
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import event
+
+pytestmark = pytest.mark.anyio
+
+
+def _flatten(params):
+    for value in params:
+        if isinstance(value, (tuple, list)):
+            yield from _flatten(value)
+        else:
+            yield value
+
+
+async def test_upsert_converts_primary_keys(api):
+    parameters = []
+    engine = getattr(api.db.engine, 'sync_engine', api.db.engine)
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, params, *args: parameters.append(params))
+    _, response = await api.client.put('/api/orders?upsert=true', json=[
+        {'id': 1.0, 'status': 'a'}, {'id': '02', 'status': 'b'}, {'id': 20, 'status': 'c'}])
+    assert response.status == 200
+    assert response.json['num_upserted'] == 3
+    assert [(o['id'], o['status']) for o in response.json['objects']] == [
+        (1, 'a'), (2, 'b'), (20, 'c')]
+    # Drivers like asyncpg do not cast them to the column type.
+    values = [value for params in parameters for value in _flatten(params)]
+    assert '02' not in values and 2 in values
+    assert not any(isinstance(value, float) for value in values)
+
+    _, response = await api.client.get('/api/orders')
+    assert response.json['num_results'] == 10
+
+
+async def test_upsert_distinct_primary_keys(api):
+    _, response = await api.client.put('/api/orders?upsert=true', json=[
+        {'id': 1, 'status': 'a'}, {'id': '01', 'status': 'b'}])
+    assert response.status == 520
+    assert response.json == {'message': 'Upserted records must have distinct primary keys',
+                             'index': 1}
+
+
+async def test_upsert_runs_validators(api):
+    _, response = await api.client.put('/api/widgets?upsert=true', json=[
+        {'id': 1, 'name': 'x'}, {'id': 2, 'name': 'bad'}])
+    assert response.status == 520
+    assert 'validation_errors' in response.json
+    _, response = await api.client.get('/api/widgets/1')
+    assert response.json['name'] == 'w1'
+
+    _, response = await api.client.put('/api/widgets?upsert=true',
+                                       json={'id': 5, 'name': 'y'})
+    assert response.status == 200
+    assert response.json == {'id': 5, 'name': 'y'}
+
+
+async def test_put_array_without_upsert(api):
+    _, response = await api.client.put('/api/orders', json=[{'id': 1, 'status': 'a'}])
+    assert response.status == 520
+    assert response.json == {'message': 'PUT_MANY body must be a JSON object'}
+
+    _, response = await api.client.put('/api/orders/1', json=[{'status': 'a'}])
+    assert response.status == 520
+    assert response.json == {'message': 'PUT body must be a JSON object'}
+
+
+async def test_upsert_runs_only_the_post_hooks(make_api):
+    calls = []
+
+    def hook(name):
+        return lambda **kw: calls.append((name, kw.get('data', kw.get('result'))))
+
+    api = make_api()
+    api.api.create_api(api.Widget, collection_name='hooked', methods=['PUT'],
+                       preprocess=dict(POST=[hook('pre')], PUT_SINGLE=[hook('put')],
+                                       PUT_MANY=[hook('put')]),
+                       postprocess=dict(POST=[hook('post')], PUT_SINGLE=[hook('put')],
+                                        PUT_MANY=[hook('put')]))
+    # One row exists and one is new, they both go through the POST hooks.
+    records = [{'id': 1, 'name': 'old'}, {'id': 9, 'name': 'new'}]
+    _, response = await api.client.put('/api/hooked?upsert=true', json=records)
+    assert response.status == 200
+    assert calls == [('pre', records), ('post', dict(num_upserted=2, objects=records))]
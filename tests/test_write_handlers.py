@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from sqlalchemy import event
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_primary_key_from_url_is_converted(api):
+    # Drivers like asyncpg do not cast a string parameter to an integer.
+    parameters = []
+    engine = getattr(api.db.engine, 'sync_engine', api.db.engine)
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, params, *args: parameters.append(params))
+    _, response = await api.client.get('/api/orders/03')
+    assert response.status == 200
+    assert response.json['id'] == 3
+    assert all('03' not in params for params in parameters)
+    assert any(3 in params for params in parameters)
+
+    _, response = await api.client.put('/api/orders/03', json={'customer': {'id': 2}})
+    assert response.status == 200
+    assert response.json['customer_id'] == 2
+
+
+async def test_post_and_validation_error(api):
+    _, response = await api.client.post('/api/widgets', json={'name': 'ok'})
+    assert response.status == 201
+    assert response.json['name'] == 'ok'
+
+    _, response = await api.client.post('/api/widgets', json={'name': 'bad'})
+    assert response.status == 520
+    assert 'validation_errors' in response.json
+
+
+async def test_put_single_and_many(api):
+    _, response = await api.client.put('/api/orders/999', json={'customer': {'id': 2}})
+    assert response.status == 520
+    assert response.json == {'message': 'No result found'}
+
+    _, response = await api.client.put('/api/orders', json={
+        'status': 'paid', 'q': {'filters': {'total': {'$lt': 4}}}})
+    assert response.status == 200
+    assert response.json == {'num_modified': 3}
+
+
+async def test_delete_single_and_many(api):
+    _, response = await api.client.delete('/api/orders/1')
+    assert response.status == 200
+    _, response = await api.client.delete('/api/orders/1')
+    assert response.status == 520
+
+    q = json.dumps({'filters': {'total': {'$gt': 7}}})
+    _, response = await api.client.delete('/api/orders?q=' + q)
+    assert response.status == 200
+    assert response.json == {'num_deleted': 2}
+
+
+async def test_hooks_run_in_both_views(make_api):
+    calls = []
+
+    def preprocess(**kw):
+        calls.append(('pre', kw['data']))
+
+    def postprocess(**kw):
+        calls.append(('post', kw['result']['name']))
+
+    api = make_api()
+    api.api.create_api(api.Widget, collection_name='hooked', methods=['POST'],
+                       preprocess=dict(POST=[preprocess]),
+                       postprocess=dict(POST=[postprocess]))
+    _, response = await api.client.post('/api/hooked', json={'name': 'hook'})
+    assert response.status == 201
+    assert calls == [('pre', {'name': 'hook'}), ('post', 'hook')]
@@ -0,0 +1,83 @@
+from decimal import Decimal
+from functools import partial
+import json
+import warnings
+
+from sanic.response import BaseHTTPResponse
+from sanic.response import json as json_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONCodec(object):
+    """How the views parse JSON from requests and encode their responses.
+
+    `loads` parses a ``str`` or ``bytes`` document and `dumps` encodes a
+    response body, or is ``None`` to keep the encoder of Sanic. If
+    `native_types` is ``True``, `dumps` encodes dates, times and UUIDs
+    itself, so the views hand them over unconverted.
+
+    """
+    def __init__(self, name, loads, dumps=None, native_types=False):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.native_types = native_types
+
+    def response(self, body, status=200, headers=None):
+        return json_response(body, status=status, headers=headers, dumps=self.dumps)
+
+    def encode(self, body):
+        """Returns `body` encoded as JSON in UTF-8 bytes, as :meth:`response`
+        would write it.
+
+        """
+        data = (self.dumps or BaseHTTPResponse._dumps)(body)
+        return data if isinstance(data, bytes) else data.encode('utf-8')
+
+    def __repr__(self):
+        return '<JSONCodec {0}>'.format(self.name)
+
+
+def _orjson_default(obj):
+    # orjson has no encoding for Decimal; Sanic's default encoder writes a
+    # number, so keep doing that.
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError('Object of type {0} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+#: The standard library parser with the default response encoder of Sanic.
+STDLIB_CODEC = JSONCodec('json', json.loads)
+
+#: orjson for both directions, or ``None`` if it is not installed.
+ORJSON_CODEC = None if orjson is None else JSONCodec(
+    'orjson', orjson.loads, partial(orjson.dumps, default=_orjson_default),
+    native_types=True)
+
+JSON_CODECS = {'json': STDLIB_CODEC, 'orjson': ORJSON_CODEC}
+
+
+def get_codec(codec=None):
+    """Returns the :class:`JSONCodec` named `codec` (a key of
+    :data:`JSON_CODECS`), or `codec` itself if it already is one.
+
+    ``None`` selects the standard library codec, as does ``'orjson'`` with a
+    warning when orjson is not installed.
+
+    """
+    if codec is None:
+        return STDLIB_CODEC
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec not in JSON_CODECS:
+        raise ValueError('json_codec must be one of {0}'.format(', '.join(JSON_CODECS)))
+    if JSON_CODECS[codec] is None:
+        warnings.warn('{0} is not installed, falling back to the standard json'
+                      ' module'.format(codec))
+        return STDLIB_CODEC
+    return JSON_CODECS[codec]
@@ -0,0 +1,228 @@
+import time
+from threading import Lock
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#: Content encodings in order of preference, when the client accepts
+#: several equally. ``br`` needs brotli and ``zstd`` needs zstandard.
+COMPRESSION_ENCODINGS = ('br', 'zstd', 'gzip', 'deflate')
+
+#: The compression level of each encoding, unless configured otherwise.
+DEFAULT_LEVELS = {'br': 4, 'zstd': 3, 'gzip': 6, 'deflate': 6}
+
+#: Request ``ctx`` keys of streamed responses: set by the handler which
+#: streams, and by :class:`Compression` to the compressor of its chunks.
+STREAMED_KEY = '_streamed_response'
+COMPRESSOR_KEY = '_response_compressor'
+
+
+class _ZlibCompressor(object):
+    def __init__(self, level, wbits):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def chunk(self, data):
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b''):
+        return self._obj.compress(data) + self._obj.flush()
+
+
+class _BrotliCompressor(object):
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def chunk(self, data):
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self, data=b''):
+        return self._obj.process(data) + self._obj.finish()
+
+
+class _ZstdCompressor(object):
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def chunk(self, data):
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data=b''):
+        return self._obj.compress(data) + self._obj.flush()
+
+
+_COMPRESSORS = {
+    'br': None if brotli is None else _BrotliCompressor,
+    'zstd': None if zstandard is None else _ZstdCompressor,
+    'gzip': lambda level: _ZlibCompressor(level, 16 + zlib.MAX_WBITS),
+    'deflate': lambda level: _ZlibCompressor(level, zlib.MAX_WBITS),
+}
+
+
+def mark_streamed(request):
+    """Tells :class:`Compression` that the response to `request` is streamed,
+    so that it compresses each chunk rather than the (still empty) body.
+    Call it before ``request.respond()``, then send the chunks with the
+    function returned by :func:`streamed_send`.
+
+    """
+    setattr(request.ctx, STREAMED_KEY, True)
+
+
+def streamed_send(request, response):
+    """Returns the function sending the chunks of the streamed `response`,
+    which compresses them when the response middleware chose an encoding.
+    Each chunk is flushed so the client can decode it on arrival, and the
+    last one (``end_stream=True``) ends the compressed stream.
+
+    """
+    compression, compressor = getattr(request.ctx, COMPRESSOR_KEY, (None, None))
+    if compressor is None:
+        return response.send
+
+    async def send(data, end_stream=False):
+        if end_stream:
+            data = compression._compress(compressor.finish, data)
+        elif data:
+            data = compression._compress(compressor.chunk, data)
+        await response.send(data, end_stream=end_stream)
+    return send
+
+
+def _accepted_encodings(accept_encoding):
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+class Compression(object):
+    """Compresses the responses of the APIs with the best encoding the
+    client accepts (``Accept-Encoding``) among `encodings`, those of
+    :data:`COMPRESSION_ENCODINGS` by default. Encodings whose library is not
+    installed are left out.
+
+    Bodies smaller than `min_size` bytes are sent as they are. `levels` maps
+    encodings to their compression level, see :data:`DEFAULT_LEVELS`.
+    Streamed responses (see :func:`mark_streamed`) are compressed chunk by
+    chunk, each chunk flushed so the client can decode it on arrival.
+
+    :meth:`stats` reports the bytes in and out and the CPU time spent.
+
+    """
+    def __init__(self, encodings=None, min_size=1024, levels=None):
+        encodings = COMPRESSION_ENCODINGS if encodings is None else encodings
+        for encoding in encodings:
+            if encoding not in _COMPRESSORS:
+                raise ValueError('Unknown encoding {0!r}, expected one of {1}'.format(
+                    encoding, ', '.join(COMPRESSION_ENCODINGS)))
+        self.encodings = tuple(e for e in encodings if _COMPRESSORS[e] is not None)
+        self.min_size = min_size
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self._lock = Lock()
+        self._responses = 0
+        self._streamed = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._cpu_time = 0.0
+
+    def negotiate(self, accept_encoding):
+        """Returns the encoding to use for a request whose ``Accept-Encoding``
+        header is `accept_encoding`, or ``None``.
+
+        """
+        accepted = _accepted_encodings(accept_encoding or '')
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compressor(self, encoding):
+        return _COMPRESSORS[encoding](self.levels[encoding])
+
+    def _record(self, size_in, size_out, cpu_time):
+        with self._lock:
+            self._bytes_in += size_in
+            self._bytes_out += size_out
+            self._cpu_time += cpu_time
+
+    def _compress(self, compress, data):
+        start = time.thread_time()
+        compressed = compress(data)
+        self._record(len(data), len(compressed), time.thread_time() - start)
+        return compressed
+
+    async def compress_response(self, request, response):
+        """Response middleware of the API blueprints."""
+        if (response.status < 200 or response.status in (204, 304)
+                or 'content-encoding' in response.headers):
+            return
+        streamed = getattr(request.ctx, STREAMED_KEY, False)
+        if not streamed and len(response.body or b'') < self.min_size:
+            return
+        vary = response.headers.get('vary')
+        response.headers['vary'] = 'Accept-Encoding' if not vary else vary + ', Accept-Encoding'
+        encoding = self.negotiate(request.headers.get('accept-encoding'))
+        if encoding is None:
+            return
+        response.headers['content-encoding'] = encoding
+        compressor = self.compressor(encoding)
+        if streamed:
+            setattr(request.ctx, COMPRESSOR_KEY, (self, compressor))
+            with self._lock:
+                self._streamed += 1
+            return
+        response.body = self._compress(compressor.finish, response.body)
+        with self._lock:
+            self._responses += 1
+
+    def stats(self):
+        """Returns a dictionary with the number of compressed responses, the
+        bytes before and after compression and the CPU time (in seconds)
+        spent compressing.
+
+        """
+        with self._lock:
+            return dict(encodings=list(self.encodings), responses=self._responses,
+                        streamed=self._streamed, bytes_in=self._bytes_in,
+                        bytes_out=self._bytes_out,
+                        ratio=(self._bytes_in / self._bytes_out) if self._bytes_out else 0.0,
+                        cpu_time_total=self._cpu_time)
+
+    def __repr__(self):
+        return '<Compression {0}>'.format(', '.join(self.encodings))
+
+
+def get_compression(compression=None):
+    """Returns the :class:`Compression` configured by the `compression`
+    argument of ``init_app``: ``None`` or ``False`` for none, ``True`` for
+    the defaults, a dictionary of :class:`Compression` arguments, or an
+    instance.
+
+    """
+    if compression is None or compression is False:
+        return None
+    if compression is True:
+        return Compression()
+    if isinstance(compression, dict):
+        return Compression(**compression)
+    return compression
@@ -53,6 +53,27 @@ OPERATORS = {
 
 READONLY_METHODS = frozenset(('GET', ))
 
+#: ``page`` slices GET_MANY results with OFFSET; ``cursor`` seeks past the
+#: last row of the previous page (keyset pagination).
+PAGINATION_MODES = ('page', 'cursor')
+
+#: How a paginated GET_MANY response reports its size: ``exact`` counts the
+#: matching rows, ``estimated`` asks the query planner (exact where the
+#: database has no estimate) and ``none`` only tells whether more pages follow.
+COUNT_MODES = ('exact', 'estimated', 'none')
+
+#: The shapes of a GET_MANY page, chosen by the ``format`` request argument:
+#: ``objects`` holds one dictionary per row, ``columnar`` the column names
+#: once and then one list of values per row.
+RESPONSE_FORMATS = ('objects', 'columnar')
+
+#: The content type of streamed GET_MANY responses: one JSON object per line.
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+#: The URL of the export route of a collection, after the collection URL. Its
+#: ``-`` segment keeps it apart from the instance URLs, ``<collection>/<instid>``.
+EXPORT_ENDPOINT_FORMAT = '{0}/-/export'
+
 LINKTEMPLATE = '<{0}?page={1}&results_per_page={2}>; rel="{3}"'
 
 APINAME_FORMAT = "{0}api"
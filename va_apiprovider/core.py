@@ -3,21 +3,45 @@ from collections import namedtuple
 from sanic import Blueprint
 from sanic import Blueprint, response
 
-from .constant import (READONLY_METHODS, BLUEPRINTNAME_FORMAT, APINAME_FORMAT)
+from .codec import get_codec
+from .compression import get_compression
+from .constant import (READONLY_METHODS, BLUEPRINTNAME_FORMAT, APINAME_FORMAT,
+                       EXPORT_ENDPOINT_FORMAT)
 from .exception import IllegalArgumentError
 from .helpers import upper_keys
 from sanic.views import HTTPMethodView
 
-RestInfo = namedtuple('RestInfo', ['db', 'universal_preprocess', 'universal_postprocess'])
+RestInfo = namedtuple('RestInfo', ['db', 'universal_preprocess', 'universal_postprocess',
+                                   'json_codec', 'compression'])
 
 class ModelView(HTTPMethodView):    
     primary_key = "id"    
+    #: The keyword options the view takes on top of its constructor
+    #: arguments, see :meth:`check_options`.
+    view_options = frozenset(['json_codec'])
+
+    @classmethod
+    def check_options(cls, **kw):
+        """Raises :exc:`IllegalArgumentError` if the keyword options `kw`
+        of an API are unknown to the view or invalid. Sanic builds the view
+        on every request, so the API providers check them once, when the API
+        is created.
+
+        """
+        unknown = sorted(set(kw) - cls.view_options)
+        if unknown:
+            msg = 'Unknown options for {0}: {1}'.format(cls.__name__, ', '.join(unknown))
+            raise IllegalArgumentError(msg)
+
     def __init__(self, model=None, collection_name=None, exclude_columns=None,
                  include_columns=None, include_methods=None, results_per_page=10,
                  max_results_per_page=1000, preprocess=None, postprocess=None,
                  primary_key=None, db=None, *args, **kw):
         
+        json_codec = kw.pop('json_codec', None)
         super(ModelView, self).__init__(*args, **kw)
+
+        self.json_codec = get_codec(json_codec)
         
         if primary_key is not None:
             self.primary_key = primary_key
@@ -40,6 +64,18 @@ class ModelView(HTTPMethodView):
         self.postprocess.update(upper_keys(postprocess or {}))
         self.preprocess.update(upper_keys(preprocess or {}))
 
+def export_view(view_cls, *args, **kw):
+    """Returns the handler of the export route of an API. Like
+    ``view_cls.as_view(*args, **kw)``, it builds a view for each request, and
+    answers with its ``export`` method.
+
+    """
+    def view(request):
+        return view.view_class(*args, **kw).export(request)
+    view.view_class = view_cls
+    view.__name__ = view_cls.__name__
+    return view
+
 class APIProvider(object):
     name = "restapi"
     view_cls = None
@@ -62,7 +98,8 @@ class APIProvider(object):
         if self.app is not None:
             self.init_app(self.app, **kw)            
             
-    def init_app(self, app, view_cls=ModelView, preprocess=None, postprocess=None, db=None, *args, **kw):
+    def init_app(self, app, view_cls=ModelView, preprocess=None, postprocess=None, db=None,
+                 json_codec=None, compression=None, *args, **kw):
         # if not hasattr(app, 'extensions'):
         #     app.extensions = {}
         if not hasattr(app, "ctx"):
@@ -73,7 +110,9 @@ class APIProvider(object):
         if self.name in app.ctx.extensions:
             raise ValueError(self.name + ' has already been initialized on'
                              ' this application: {0}'.format(app))
-        app.ctx.extensions[self.name] = RestInfo(db, preprocess or {}, postprocess or {})
+        app.ctx.extensions[self.name] = RestInfo(db, preprocess or {}, postprocess or {},
+                                                 get_codec(json_codec),
+                                                 get_compression(compression))
         
         if app is not None:
             self.app = app
@@ -92,7 +131,7 @@ class APIProvider(object):
                 url_prefix='/api', exclude_columns=None,
                 include_columns=None, include_methods=None,
                 results_per_page=10, max_results_per_page=100,
-                preprocess=None, postprocess=None, primary_key=None, *args, **kw):
+                preprocess=None, postprocess=None, primary_key=None, *args, export=False, **kw):
         if collection_name is None:
             msg = ('collection_name is not valid.')
             raise IllegalArgumentError(msg)
@@ -100,6 +139,10 @@ class APIProvider(object):
         if exclude_columns is not None and include_columns is not None:
             msg = ('Cannot simultaneously specify both include columns and exclude columns.')
             raise IllegalArgumentError(msg)
+
+        if export and not hasattr(self.view_cls, 'export'):
+            msg = ('{0} cannot export collections.'.format(self.view_cls.__name__))
+            raise IllegalArgumentError(msg)
         
         if app is None:
             app = self.app
@@ -121,15 +164,20 @@ class APIProvider(object):
         preprocessors_.update(preprocess or {})
         postprocessors_.update(postprocess or {})
         
-        api_view = self.view_cls.as_view(model=model, collection_name=collection_name,exclude_columns=exclude_columns,\
+        kw.setdefault('json_codec', restapi_ext.json_codec)
+        self.view_cls.check_options(**kw)
+        view_kw = dict(model=model, collection_name=collection_name,exclude_columns=exclude_columns,\
                 include_columns=include_columns, include_methods=include_methods,\
                 results_per_page=results_per_page, max_results_per_page=max_results_per_page, \
                 preprocess=preprocessors_, postprocess=postprocessors_, primary_key=primary_key,\
-                db=restapi_ext.db)
+                db=restapi_ext.db, **kw)
+        api_view = self.view_cls.as_view(**view_kw)
               
         blueprintname = APIProvider._next_blueprint_name(app.blueprints, apiname) 
         bp_route_name = blueprintname + "_nim" #### no_instance_methods
         blueprint = Blueprint(blueprintname, url_prefix=url_prefix)
+        if restapi_ext.compression is not None:
+            blueprint.middleware('response')(restapi_ext.compression.compress_response)
         blueprint.add_route(handler=api_view, uri=collection_endpoint,
                 methods=no_instance_methods, name=bp_route_name,)
  
@@ -138,6 +186,11 @@ class APIProvider(object):
         instance_endpoint = '{0}/<instid>'.format(collection_endpoint)
         blueprint.add_route(handler=api_view, uri=instance_endpoint,
                 methods=instance_methods, name=bp_route_name,)
+
+        if export:
+            blueprint.add_route(handler=export_view(self.view_cls, **view_kw),
+                    uri=EXPORT_ENDPOINT_FORMAT.format(collection_endpoint), methods=['GET'],
+                    name=blueprintname + "_export")
         
         return blueprint
     
@@ -1,16 +1,19 @@
-from contextvars import ContextVar
+from sanic import Request
+from sanic.exceptions import ServerError
 from sqlalchemy.ext.asyncio import ( create_async_engine, AsyncSession, async_sessionmaker, )
 from sqlalchemy.orm import declarative_base
 
-_current_session: ContextVar[AsyncSession | None] = ContextVar(
-    "current_db_session", default=None
-)
+from .pool import (engine_options, pool_stats)
+from .routing import (REPLICAS_KEY, ReplicaSet, RoutingSession)
 
 
 class DatabaseAlchemy:
-    def __init__(self, app=None, uri=None):
+    def __init__(self, app=None, uri=None, replica_uris=None):
         self.app = app
         self.uri = uri
+        self.engine_options = {}
+        self.replica_uris = list(replica_uris or [])
+        self.replicas = ReplicaSet([])
 
         self._engine = None
         self._sessionmaker = None
@@ -26,7 +29,8 @@ class DatabaseAlchemy:
     @property
     def engine(self):
         if self._engine is None:
-            self._engine = create_async_engine( self.uri, echo=False, future=True, )
+            self._engine = create_async_engine( self.uri, echo=False, future=True,
+                                                **self.engine_options, )
         return self._engine
 
     @property
@@ -37,13 +41,26 @@ class DatabaseAlchemy:
     # Session factory
     # -----------------------
     def _make_sessionmaker(self):
-        return async_sessionmaker( bind=self.engine, class_=AsyncSession, expire_on_commit=False, )
+        info = {REPLICAS_KEY: self.replicas} if self.replicas else None
+        return async_sessionmaker( bind=self.engine, class_=AsyncSession, expire_on_commit=False,
+                                   sync_session_class=RoutingSession, info=info, )
 
     @property
     def session(self) -> AsyncSession:
-        session = _current_session.get()
+        """The :class:`AsyncSession` of the current request. It is created on
+        first access, so requests which never touch the database pay nothing.
+
+        """
+        try:
+            request = Request.get_current()
+        except ServerError:
+            raise RuntimeError("No active DB session. Sessions only exist while a Sanic request is handled.")
+        session = getattr(request.ctx, "_db_session", None)
         if session is None:
-            raise RuntimeError("No active DB session. Did you forget to enable Sanic middleware?")
+            if self._sessionmaker is None:
+                self._sessionmaker = self._make_sessionmaker()
+            session = self._sessionmaker()
+            request.ctx._db_session = session
         return session
 
     # -----------------------
@@ -56,6 +73,12 @@ class DatabaseAlchemy:
             uri or self.uri or app.config.get("SQLALCHEMY_DATABASE_URI")
             or "sqlite+aiosqlite:///:memory:"
         )
+        self.engine_options = engine_options(self.uri, app.config)
+        self.replica_uris = self.replica_uris or list(app.config.get("SQLALCHEMY_REPLICA_URIS") or [])
+        self.replicas = ReplicaSet(
+            [create_async_engine(u, echo=False, future=True, **engine_options(u, app.config))
+             for u in self.replica_uris],
+            app.config.get("SQLALCHEMY_REPLICA_STRATEGY", "round_robin"))
 
         if not hasattr(app, "ctx"):
             app.ctx = type("C", (), {})()
@@ -65,40 +88,57 @@ class DatabaseAlchemy:
 
         app.ctx.extensions["sqlalchemy"] = self
 
-        # -------- request: open session --------
-        @app.middleware("request")
-        async def open_db_session(request):
-            if self._sessionmaker is None:
-                self._sessionmaker = self._make_sessionmaker()
-
-            session = self._sessionmaker()
-            token = _current_session.set(session)
-            request.ctx._db_session_token = token
-
-        # -------- response: close session --------
+        # -------- response: close session, if one was opened --------
         @app.middleware("response")
         async def close_db_session(request, response):
-            token = getattr(request.ctx, "_db_session_token", None)
-            if not token:
-                return response
-
-            session = _current_session.get()
-
-            try:
-                if app.config.get("SQLALCHEMY_COMMIT_ON_RESPONSE"):
-                    await session.commit()
-            except Exception:
-                await session.rollback()
-                raise
-            finally:
-                await session.close()
-                _current_session.reset(token)
-
+            if not getattr(request.ctx, "_db_session_deferred", False):
+                await self.end_session(request)
             return response
 
+    # -----------------------
+    # Streamed responses
+    # -----------------------
+    def defer_session_close(self, request):
+        """Keeps the session of `request` open past the response middleware,
+        which runs before a streamed body is written. The handler must call
+        :meth:`end_session` once it is done.
+
+        """
+        request.ctx._db_session_deferred = True
+
+    async def end_session(self, request):
+        """Commits (with ``SQLALCHEMY_COMMIT_ON_RESPONSE``) and closes the
+        session of `request`, if one was opened.
+
+        """
+        request.ctx._db_session_deferred = False
+        session = getattr(request.ctx, "_db_session", None)
+        if session is None:
+            return
+        request.ctx._db_session = None
+
+        try:
+            if request.app.config.get("SQLALCHEMY_COMMIT_ON_RESPONSE"):
+                await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
     # -----------------------
     # Helpers
     # -----------------------
+    def pool_stats(self):
+        """Returns the live connection pool counters of the engine, see
+        :func:`database.pool.pool_stats`.
+
+        """
+        stats = pool_stats(self.engine.pool)
+        if self.replicas:
+            stats["replicas"] = [pool_stats(engine.pool) for engine in self.replicas.engines]
+        return stats
+
     async def create_all(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(self.metadata.create_all)
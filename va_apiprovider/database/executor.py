@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+
+class BoundedExecutor:
+    """A fixed size thread pool for blocking database calls, which keeps count
+    of how many calls are waiting for a thread and how long they waited.
+
+    `max_workers` should not exceed the number of connections the engine pool
+    can hand out, otherwise the extra threads only wait on the pool.
+
+    """
+    def __init__(self, max_workers, thread_name_prefix="va_apiprovider-db"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=thread_name_prefix)
+        self._lock = Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+
+    def _call(self, submitted, func, args, kw):
+        waited = time.perf_counter() - submitted
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_total += waited
+            self._wait_last = waited
+            if waited > self._wait_max:
+                self._wait_max = waited
+        try:
+            return func(*args, **kw)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    async def run(self, func, *args, context=None, **kw):
+        """Runs ``func(*args, **kw)`` on a pool thread and awaits its result.
+
+        `func` runs inside `context` (a copy of the caller's context by
+        default), so context variables of the request stay visible.
+
+        """
+        context = context or contextvars.copy_context()
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, context.run, self._call,
+                                          time.perf_counter(), func, args, kw)
+
+    def stats(self):
+        """Returns a dictionary with the current queue depth, the number of
+        busy threads and the wait times (in seconds) of the calls so far.
+
+        """
+        with self._lock:
+            started = self._completed + self._active
+            return dict(max_workers=self.max_workers, queue_depth=self._queued,
+                        active=self._active, completed=self._completed,
+                        wait_time_total=self._wait_total,
+                        wait_time_avg=(self._wait_total / started) if started else 0.0,
+                        wait_time_max=self._wait_max, wait_time_last=self._wait_last)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __repr__(self):
+        return f"<BoundedExecutor max_workers={self.max_workers}>"
@@ -0,0 +1,127 @@
+import time
+from threading import Lock
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+#: App config keys mapped to the :func:`~sqlalchemy.create_engine` pool
+#: argument they set. Options left out of the config keep the SQLAlchemy
+#: defaults.
+POOL_CONFIG = {
+    "SQLALCHEMY_POOL_SIZE": "pool_size",
+    "SQLALCHEMY_MAX_OVERFLOW": "max_overflow",
+    "SQLALCHEMY_POOL_TIMEOUT": "pool_timeout",
+    "SQLALCHEMY_POOL_RECYCLE": "pool_recycle",
+    "SQLALCHEMY_POOL_PRE_PING": "pool_pre_ping",
+}
+
+#: Pool arguments which only a :class:`~sqlalchemy.pool.QueuePool` accepts.
+QUEUE_POOL_ONLY = ("pool_size", "max_overflow", "pool_timeout")
+
+
+class _PoolWaitStats:
+    """Counts the checkouts which found neither an idle connection nor room
+    for an overflow connection, and so had to wait for a checkin.
+
+    """
+    def _init_wait_stats(self):
+        self._stats_lock = Lock()
+        self._waiting = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+
+    def _must_wait(self):
+        return (self._pool.empty() and self._max_overflow > -1
+                and self._overflow >= self._max_overflow)
+
+    def _do_get(self):
+        if not self._must_wait():
+            return super()._do_get()
+        with self._stats_lock:
+            self._waiting += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self._waiting -= 1
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+    def wait_stats(self):
+        with self._stats_lock:
+            return dict(waiting=self._waiting, waits=self._waits,
+                        wait_time_total=self._wait_total,
+                        wait_time_max=self._wait_max, timeouts=self._timeouts)
+
+
+class InstrumentedQueuePool(_PoolWaitStats, QueuePool):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._init_wait_stats()
+
+
+class InstrumentedAsyncAdaptedQueuePool(_PoolWaitStats, AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._init_wait_stats()
+
+
+def engine_options(uri, config):
+    """Returns the pool keyword arguments for an engine connecting to `uri`,
+    read from the app `config` (see :data:`POOL_CONFIG`).
+
+    When the dialect would use a queue pool, an instrumented subclass is used
+    so that :func:`pool_stats` can report checkout waits. Queue pool options
+    are dropped for other pool classes (e.g. in-memory SQLite), which would
+    reject them.
+
+    """
+    options = dict((arg, config[key]) for key, arg in POOL_CONFIG.items()
+                   if config.get(key) is not None)
+    try:
+        url = make_url(uri)
+        poolclass = url.get_dialect().get_pool_class(url)
+    except Exception:
+        return options
+    if issubclass(poolclass, AsyncAdaptedQueuePool):
+        options["poolclass"] = InstrumentedAsyncAdaptedQueuePool
+    elif issubclass(poolclass, QueuePool):
+        options["poolclass"] = InstrumentedQueuePool
+    else:
+        for arg in QUEUE_POOL_ONLY:
+            options.pop(arg, None)
+    return options
+
+
+def pool_capacity(pool):
+    """Returns how many connections `pool` can hand out at the same time."""
+    size = pool.size() if hasattr(pool, "size") else 1
+    overflow = getattr(pool, "_max_overflow", 0)
+    return max(size + max(overflow, 0), 1)
+
+
+def pool_stats(pool):
+    """Returns a dictionary with the live state of `pool`: its size, how many
+    connections are checked out, idle or in overflow, and the checkout waits
+    recorded so far.
+
+    """
+    stats = dict(pool=type(pool).__name__, status=pool.status())
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(),
+                     idle=pool.checkedin(), overflow=max(pool.overflow(), 0),
+                     max_overflow=pool._max_overflow, timeout=pool.timeout(),
+                     capacity=pool_capacity(pool))
+    if isinstance(pool, _PoolWaitStats):
+        stats.update(pool.wait_stats())
+    return stats
@@ -0,0 +1,81 @@
+import itertools
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+#: Session ``info`` keys used for replica routing.
+REPLICAS_KEY = "replicas"
+READ_ONLY_KEY = "read_only"
+HAS_WRITTEN_KEY = "has_written"
+REPLICA_ENGINE_KEY = "replica_engine"
+
+REPLICA_STRATEGIES = ("round_robin", "least_connections")
+
+
+class ReplicaSet:
+    """The read replica engines of a database and the strategy used to pick
+    one of them for a session.
+
+    `engines` may hold synchronous or asynchronous engines.
+
+    """
+    def __init__(self, engines, strategy="round_robin"):
+        if strategy not in REPLICA_STRATEGIES:
+            raise ValueError("Unknown replica strategy {0!r}, expected one of {1}".format(
+                strategy, ", ".join(REPLICA_STRATEGIES)))
+        self.engines = list(engines)
+        self.strategy = strategy
+        self._cycle = itertools.cycle(self.engines)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def pick(self):
+        if self.strategy == "least_connections":
+            return min(self.engines, key=_checked_out)
+        return next(self._cycle)
+
+
+def _checked_out(engine):
+    checkedout = getattr(engine.pool, "checkedout", None)
+    return checkedout() if checkedout is not None else 0
+
+
+def use_replica(session):
+    """Marks `session` as serving a read-only handler: until it writes, its
+    SELECTs go to a replica (see :class:`RoutingSession`).
+
+    """
+    session.info[READ_ONLY_KEY] = True
+
+
+class RoutingSession(Session):
+    """A session bound to the primary engine which sends reads to one of the
+    replicas in ``info["replicas"]`` once :func:`use_replica` was called.
+
+    A session sticks to the replica it picked first. As soon as it flushes or
+    runs an INSERT, UPDATE or DELETE, it goes back to the primary for every
+    later statement, so reads after a write see that write.
+
+    """
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replicas = self.info.get(REPLICAS_KEY)
+        if (replicas and self.info.get(READ_ONLY_KEY)
+                and not self.info.get(HAS_WRITTEN_KEY)
+                and not self._flushing and not getattr(clause, "is_dml", False)):
+            engine = self.info.get(REPLICA_ENGINE_KEY)
+            if engine is None:
+                engine = self.info[REPLICA_ENGINE_KEY] = replicas.pick()
+            return getattr(engine, "sync_engine", engine)
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_written_on_flush(session, flush_context):
+    session.info[HAS_WRITTEN_KEY] = True
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_written_on_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[HAS_WRITTEN_KEY] = True
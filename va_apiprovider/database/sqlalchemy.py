@@ -1,17 +1,33 @@
 import asyncio
+import contextvars
 from threading import Lock
 from sqlalchemy import create_engine
 from sqlalchemy.orm import (
     declarative_base, scoped_session, sessionmaker
 )
 
+from .executor import BoundedExecutor
+from .pool import (engine_options, pool_capacity, pool_stats)
+from .routing import (REPLICAS_KEY, ReplicaSet, RoutingSession)
+
+#: The request task whose session should be used by code running outside of
+#: that task, i.e. on the worker threads of :attr:`DatabaseAlchemy.executor`.
+_session_scope = contextvars.ContextVar("session_scope", default=None)
+
+
 class DatabaseAlchemy:
-    def __init__(self, app=None, uri=None):
+    def __init__(self, app=None, uri=None, replica_uris=None):
         self.app = app
         self._engine = None
         self._engine_lock = Lock()
+        self._executor = None
+        self.offload_enabled = False
+        self.executor_workers = None
 
         self.uri = uri
+        self.engine_options = {}
+        self.replica_uris = list(replica_uris or [])
+        self.replicas = ReplicaSet([])
         self.session = None
         self.Model = declarative_base()
 
@@ -26,7 +42,7 @@ class DatabaseAlchemy:
         if self._engine is None:
             with self._engine_lock:
                 if self._engine is None:
-                    self._engine = create_engine(self.uri)
+                    self._engine = create_engine(self.uri, **self.engine_options)
         return self._engine
 
     @property
@@ -35,15 +51,48 @@ class DatabaseAlchemy:
 
     def _make_scoped_session(self):
         def _scopefunc():
-            try:
-                return asyncio.current_task()
-            except RuntimeError:
-                print("You are calling a synchronous function — use async to run it properly")
-                return None        
-        Session = scoped_session(sessionmaker(bind=self.engine),scopefunc=asyncio.current_task,)
+            scope = _session_scope.get()
+            if scope is not None:
+                return scope
+            return asyncio.current_task()
+        info = {REPLICAS_KEY: self.replicas} if self.replicas else None
+        factory = sessionmaker(bind=self.engine, class_=RoutingSession, info=info)
+        Session = scoped_session(factory,scopefunc=_scopefunc,)
         self.Model.query = Session.query_property()
         return Session
 
+    # -----------------------
+    # Executor (offload mode)
+    # -----------------------
+    @property
+    def executor(self):
+        """The :class:`BoundedExecutor` running blocking database calls, or
+        ``None`` unless ``SQLALCHEMY_OFFLOAD`` is enabled. Its size is
+        ``SQLALCHEMY_EXECUTOR_WORKERS``, by default the number of connections
+        the engine pool can hand out.
+
+        """
+        if not self.offload_enabled:
+            return None
+        if self._executor is None:
+            with self._engine_lock:
+                if self._executor is None:
+                    self._executor = BoundedExecutor(self.executor_workers
+                                                     or pool_capacity(self.engine.pool))
+        return self._executor
+
+    async def offload(self, func, *args, **kw):
+        """Runs ``func(*args, **kw)`` on :attr:`executor`, bound to the session
+        of the calling request, or inline when offloading is disabled.
+
+        """
+        executor = self.executor
+        if executor is None:
+            return func(*args, **kw)
+        context = contextvars.copy_context()
+        context.run(_session_scope.set, asyncio.current_task())
+        return await executor.run(func, *args, context=context, **kw)
+
     # -----------------------
     # Init app
     # -----------------------
@@ -51,7 +100,14 @@ class DatabaseAlchemy:
         uri_ = (uri or self.uri or app.config.get("SQLALCHEMY_DATABASE_URI") or "sqlite:///:memory:")
 
         self.uri = uri_
+        self.engine_options = engine_options(self.uri, app.config)
+        self.replica_uris = self.replica_uris or list(app.config.get("SQLALCHEMY_REPLICA_URIS") or [])
+        self.replicas = ReplicaSet(
+            [create_engine(u, **engine_options(u, app.config)) for u in self.replica_uris],
+            app.config.get("SQLALCHEMY_REPLICA_STRATEGY", "round_robin"))
         self.session = self._make_scoped_session()
+        self.offload_enabled = bool(app.config.get("SQLALCHEMY_OFFLOAD", False))
+        self.executor_workers = app.config.get("SQLALCHEMY_EXECUTOR_WORKERS")
 
         if not hasattr(app, "ctx"):
             app.ctx = type("C", (), {})()
@@ -63,18 +119,55 @@ class DatabaseAlchemy:
 
         @app.middleware("response")
         async def shutdown_session(request, response):
-            try:
-                if app.config.get("SQLALCHEMY_COMMIT_ON_RESPONSE"):
-                    self.session.commit()
-            except:
-                self.session.rollback()
-                raise
-            finally:
-                self.session.remove()
+            if getattr(request.ctx, "_db_session_deferred", False):
+                return
+            await self.end_session(request)
+
+        @app.listener("after_server_stop")
+        async def shutdown_executor(app, loop):
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    # -----------------------
+    # Streamed responses
+    # -----------------------
+    def defer_session_close(self, request):
+        """Keeps the session of `request` open past the response middleware,
+        which runs before a streamed body is written. The handler must call
+        :meth:`end_session` once it is done.
+
+        """
+        request.ctx._db_session_deferred = True
+
+    async def end_session(self, request):
+        """Commits (with ``SQLALCHEMY_COMMIT_ON_RESPONSE``) and removes the
+        session of `request`.
+
+        """
+        request.ctx._db_session_deferred = False
+        try:
+            if request.app.config.get("SQLALCHEMY_COMMIT_ON_RESPONSE"):
+                self.session.commit()
+        except:
+            self.session.rollback()
+            raise
+        finally:
+            self.session.remove()
 
     # -----------------------
     # Helpers
     # -----------------------
+    def pool_stats(self):
+        """Returns the live connection pool counters of the engine, see
+        :func:`database.pool.pool_stats`.
+
+        """
+        stats = pool_stats(self.engine.pool)
+        if self.replicas:
+            stats["replicas"] = [pool_stats(engine.pool) for engine in self.replicas.engines]
+        return stats
+
     def create_all(self):
         self.metadata.create_all(self.engine)
 
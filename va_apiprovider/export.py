@@ -0,0 +1,139 @@
+import csv
+import datetime
+from decimal import Decimal
+import io
+
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+
+from .helpers.sqlalchemy import get_serializer
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+#: The formats of the export route, chosen by its ``format`` request
+#: argument, mapped to their content type. ``arrow`` needs pyarrow.
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+class CSVWriter(object):
+    """Encodes rows of the `names` columns of `model` as CSV, with a header
+    line. Values are converted as in the JSON responses, so dates are
+    written in ISO 8601 and ``None`` as an empty field.
+
+    """
+    def __init__(self, model, names):
+        self.names = names
+        self._serializer = get_serializer(model, None, include=names)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self):
+        data = self._buffer.getvalue().encode('utf-8')
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def begin(self):
+        self._writer.writerow(self.names)
+        return self._drain()
+
+    def write(self, rows):
+        row_values = self._serializer.row_values
+        self._writer.writerows(row_values(row) for row in rows)
+        return self._drain()
+
+    def end(self):
+        return b''
+
+
+def _arrow_type(prop):
+    """Returns the Arrow type of the column property `prop`, or ``None`` if
+    its values are written as strings.
+
+    """
+    column_type = prop.columns[0].type
+    try:
+        python_type = column_type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+    if python_type is Decimal:
+        precision = getattr(column_type, 'precision', None)
+        scale = getattr(column_type, 'scale', None)
+        if precision is None or scale is None:
+            return None
+        return pyarrow.decimal128(precision, scale)
+    return {
+        bool: pyarrow.bool_(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        str: pyarrow.string(),
+        bytes: pyarrow.binary(),
+        datetime.datetime: pyarrow.timestamp('us'),
+        datetime.date: pyarrow.date32(),
+        datetime.time: pyarrow.time64('us'),
+        datetime.timedelta: pyarrow.duration('us'),
+    }.get(python_type)
+
+
+class ArrowWriter(object):
+    """Encodes rows of the `names` columns of `model` as an Arrow IPC stream,
+    one record batch per call to :meth:`write`.
+
+    The schema comes from the column types. Columns of other types (UUIDs,
+    enums, JSON, numerics without a scale) are written as strings.
+
+    """
+    def __init__(self, model, names):
+        self.names = names
+        column_attrs = sqlalchemy_inspect(model).column_attrs
+        types = [_arrow_type(column_attrs[name]) for name in names]
+        self._as_string = [arrow_type is None for arrow_type in types]
+        self.schema = pyarrow.schema([
+            (name, pyarrow.string() if arrow_type is None else arrow_type)
+            for name, arrow_type in zip(names, types)])
+        self._sink = io.BytesIO()
+        self._writer = None
+
+    def _drain(self):
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def begin(self):
+        self._writer = pyarrow.ipc.new_stream(self._sink, self.schema)
+        return self._drain()
+
+    def write(self, rows):
+        columns = [list(values) for values in zip(*rows)] or [[] for _ in self.names]
+        for i, as_string in enumerate(self._as_string):
+            if as_string:
+                columns[i] = [None if value is None else str(value) for value in columns[i]]
+        self._writer.write_batch(pyarrow.record_batch(columns, schema=self.schema))
+        return self._drain()
+
+    def end(self):
+        self._writer.close()
+        return self._drain()
+
+
+def export_writer(export_format, model, names):
+    """Returns the writer of `export_format`, a key of
+    :data:`EXPORT_FORMATS`, for the `names` columns of `model`.
+
+    Raises :exc:`ValueError` for an unknown format or when ``arrow`` is asked
+    for but pyarrow is not installed.
+
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('format must be one of {0}'.format(', '.join(EXPORT_FORMATS)))
+    if export_format == 'arrow':
+        if pyarrow is None:
+            raise ValueError('The arrow format needs pyarrow, which is not installed')
+        return ArrowWriter(model, names)
+    return CSVWriter(model, names)
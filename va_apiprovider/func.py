@@ -3,9 +3,12 @@ from collections import defaultdict
 from collections import namedtuple
 from sanic import Blueprint, response
 
-from .core import (RestInfo,ModelView)
+from .core import (RestInfo,ModelView,export_view)
 from .exception import IllegalArgumentError
-from .constant import (READONLY_METHODS, BLUEPRINTNAME_FORMAT, APINAME_FORMAT)
+from .codec import get_codec
+from .compression import get_compression
+from .constant import (READONLY_METHODS, BLUEPRINTNAME_FORMAT, APINAME_FORMAT,
+                       EXPORT_ENDPOINT_FORMAT)
 from .helpers import to_namespace
 
 from collections import defaultdict
@@ -29,7 +32,8 @@ def api_provider(name="restapi", app=None, **kw):
     if _app is not None:
         init_app(_app, **kw)           
             
-    def init_app(app, view_cls=ModelView, preprocess=None, postprocess=None, db=None, *args, **kw):
+    def init_app(app, view_cls=ModelView, preprocess=None, postprocess=None, db=None,
+                 json_codec=None, compression=None, *args, **kw):
         nonlocal _name, _app, _view_cls, _apis_to_create, _created_apis_for
         if not hasattr(app, "ctx"):
             app.ctx = type("C", (), {})()
@@ -39,7 +43,9 @@ def api_provider(name="restapi", app=None, **kw):
         if _name in app.ctx.extensions:
             raise ValueError(_name + ' has already been initialized on'
                              ' this application: {0}'.format(app))
-        app.ctx.extensions[_name] = RestInfo(db, preprocess or {}, postprocess or {})
+        app.ctx.extensions[_name] = RestInfo(db, preprocess or {}, postprocess or {},
+                                             get_codec(json_codec),
+                                             get_compression(compression))
         
         if app is not None:
             _app = app
@@ -57,7 +63,8 @@ def api_provider(name="restapi", app=None, **kw):
                              url_prefix='/api', exclude_columns=None,
                              include_columns=None, include_methods=None,
                              results_per_page=10, max_results_per_page=100,
-                             preprocess=None, postprocess=None, primary_key=None, *args, **kw):
+                             preprocess=None, postprocess=None, primary_key=None, *args,
+                             export=False, **kw):
         nonlocal _name, _app, _view_cls, _apis_to_create, _created_apis_for
         if collection_name is None:
             msg = ('collection_name is not valid.')
@@ -67,6 +74,10 @@ def api_provider(name="restapi", app=None, **kw):
             msg = ('Cannot simultaneously specify both include columns and'
                    ' exclude columns.')
             raise IllegalArgumentError(msg)
+
+        if export and not hasattr(_view_cls, 'export'):
+            msg = ('{0} cannot export collections.'.format(_view_cls.__name__))
+            raise IllegalArgumentError(msg)
         
         if app is None:
             app = _app
@@ -88,15 +99,20 @@ def api_provider(name="restapi", app=None, **kw):
         preprocessors_.update(preprocess or {})
         postprocessors_.update(postprocess or {})
         
-        api_view = _view_cls.as_view(model=model, collection_name=collection_name,exclude_columns=exclude_columns,\
+        kw.setdefault('json_codec', restapi_ext.json_codec)
+        _view_cls.check_options(**kw)
+        view_kw = dict(model=model, collection_name=collection_name,exclude_columns=exclude_columns,\
                 include_columns=include_columns, include_methods=include_methods,\
                 results_per_page=results_per_page, max_results_per_page=max_results_per_page, \
                 preprocess=preprocessors_, postprocess=postprocessors_, primary_key=primary_key,\
-                db=restapi_ext.db)
+                db=restapi_ext.db, **kw)
+        api_view = _view_cls.as_view(**view_kw)
                                
         bp_name = next_blueprint_name(app.blueprints, apiname)        
         bp_route_name = bp_name + "_nim" #### no_instance_methods
         blueprint = Blueprint(bp_name, url_prefix=url_prefix)
+        if restapi_ext.compression is not None:
+            blueprint.middleware('response')(restapi_ext.compression.compress_response)
         blueprint.add_route(handler=api_view, uri=collection_endpoint,
                 methods=no_instance_methods, name=bp_route_name,)
         
@@ -105,6 +121,11 @@ def api_provider(name="restapi", app=None, **kw):
         instance_endpoint = '{0}/<instid>'.format(collection_endpoint)
         blueprint.add_route(handler=api_view, uri=instance_endpoint,
                 methods=instance_methods, name=bp_route_name,)
+
+        if export:
+            blueprint.add_route(handler=export_view(_view_cls, **view_kw),
+                    uri=EXPORT_ENDPOINT_FORMAT.format(collection_endpoint), methods=['GET'],
+                    name=bp_name + "_export")
         
         return blueprint
     
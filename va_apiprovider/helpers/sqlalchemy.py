@@ -1,11 +1,21 @@
+from collections import OrderedDict
+import copy
 import datetime
+from decimal import Decimal
+from functools import partial
 import inspect
+from threading import Lock
 import uuid
 
 from dateutil.parser import parse as parse_datetime
 from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import Interval
+from sqlalchemy import insert
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import mysql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.exc import NoInspectionAvailable
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.associationproxy import AssociationProxy
@@ -20,6 +30,12 @@ from sqlalchemy.sql import func
 from sqlalchemy import select
 from sqlalchemy.sql.expression import ColumnElement
 from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.sql.expression import ClauseElement
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+from sqlalchemy.sql.expression import Executable
+from sqlalchemy.ext.compiler import compiles
+from json import loads as json_loads
 
 #: Names of attributes which should definitely not be considered relations when
 #: dynamically computing a list of relations of a SQLAlchemy model.
@@ -83,6 +99,70 @@ def upper_keys(d):
     return dict(zip((k.upper() for k in d.keys()), d.values()))
 
 
+class ModelMetadata(object):
+    """The columns, relations, primary keys and field types of a model class,
+    introspected once and then looked up by the helpers of this module.
+
+    Use :func:`model_metadata` to get the shared instance of a model.
+
+    """
+    def __init__(self, model):
+        self.model = model
+        self.columns = {}
+        for superclass in model.__mro__:
+            for name, column in superclass.__dict__.items():
+                if isinstance(column, COLUMN_TYPES):
+                    self.columns[name] = column
+        #: Maps every attribute name of the model to its related model class,
+        #: or ``None`` if the attribute is not a relation.
+        self.related_models = dict(
+            (k, _get_related_model(model, k)) for k in dir(model)
+            if not (k.startswith('__') or k in RELATION_BLACKLIST))
+        self.relations = [k for k, related in self.related_models.items() if related]
+        self.primary_key_names = [
+            key for key, field in inspect.getmembers(model)
+            if isinstance(field, QueryableAttribute)
+            and isinstance(getattr(field, 'property', None), ColumnProperty)
+            and field.property.columns[0].primary_key]
+        try:
+            descriptors = sqlalchemy_inspect(model).all_orm_descriptors
+        except NoInspectionAvailable:
+            self.settable = None
+        else:
+            self.settable = dict((name, d.fset is not None)
+                                 for name, d in descriptors.items()
+                                 if hasattr(d, 'fset'))
+        self.field_types = {}
+        #: Maps field names to the function converting their incoming values,
+        #: see :func:`get_field_converter`.
+        self.field_converters = {}
+        #: Maps primary key names to the function converting their incoming
+        #: values, see :func:`convert_key_value`.
+        self.key_converters = {}
+
+
+_model_metadata = {}
+
+
+def model_metadata(model):
+    """Returns the :class:`ModelMetadata` of `model`, introspecting it on
+    first use.
+
+    The registry is emptied whenever SQLAlchemy configures mappers, since new
+    mappers (and their backrefs) may add relations to models already seen.
+
+    """
+    metadata = _model_metadata.get(model)
+    if metadata is None:
+        metadata = _model_metadata[model] = ModelMetadata(model)
+    return metadata
+
+
+@event.listens_for(Mapper, 'after_configured')
+def _clear_model_metadata():
+    _model_metadata.clear()
+
+
 def get_columns(model):
     """Returns a dictionary-like object containing all the columns of the
     specified `model` class.
@@ -92,19 +172,12 @@ def get_columns(model):
     .. _hybrid attributes: http://docs.sqlalchemy.org/en/latest/orm/extensions/hybrid.html
 
     """
-    columns = {}
-    for superclass in model.__mro__:
-        for name, column in superclass.__dict__.items():
-            if isinstance(column, COLUMN_TYPES):
-                columns[name] = column
-    return columns
+    return dict(model_metadata(model).columns)
 
 
 def get_relations(model):
     """Returns a list of relation names of `model` (as a list of strings)."""
-    return [k for k in dir(model)
-            if not (k.startswith('__') or k in RELATION_BLACKLIST)
-            and get_related_model(model, k)]
+    return list(model_metadata(model).relations)
 
 
 def get_related_model(model, relationname):
@@ -112,6 +185,13 @@ def get_related_model(model, relationname):
     whose name is `relationname`.
 
     """
+    related_models = model_metadata(model).related_models
+    if relationname in related_models:
+        return related_models[relationname]
+    return _get_related_model(model, relationname)
+
+
+def _get_related_model(model, relationname):
     if hasattr(model, relationname):
         attr = getattr(model, relationname)
         if hasattr(attr, 'property') \
@@ -141,9 +221,11 @@ def has_field(model, fieldname):
     settable hybrid property for this field name.
 
     """
-    descriptors = sqlalchemy_inspect(model).all_orm_descriptors._data
-    if fieldname in descriptors and hasattr(descriptors[fieldname], 'fset'):
-        return descriptors[fieldname].fset is not None
+    settable = model_metadata(model).settable
+    if settable is None:
+        sqlalchemy_inspect(model)
+    if fieldname in settable:
+        return settable[fieldname]
     return hasattr(model, fieldname)
 
 
@@ -151,6 +233,15 @@ def get_field_type(model, fieldname):
     """Helper which returns the SQLAlchemy type of the field.
 
     """
+    field_types = model_metadata(model).field_types
+    if fieldname in field_types:
+        return field_types[fieldname]
+    fieldtype = _get_field_type(model, fieldname)
+    field_types[fieldname] = fieldtype
+    return fieldtype
+
+
+def _get_field_type(model, fieldname):
     field = getattr(model, fieldname)
     if isinstance(field, ColumnElement):
         fieldtype = field.type
@@ -202,10 +293,7 @@ def assign_attributes(sanic_restapi_model, **kwargs):
 
 def primary_key_names(model):
     """Returns all the primary keys for a model."""
-    return [key for key, field in inspect.getmembers(model)
-            if isinstance(field, QueryableAttribute)
-            and isinstance(field.property, ColumnProperty)
-            and field.property.columns[0].primary_key]
+    return list(model_metadata(model).primary_key_names)
 
 
 def primary_key_name(model_or_instance):
@@ -258,6 +346,256 @@ def is_mapped_class(cls):
         return False
 
 
+#: Types of values which :func:`to_dict` returns unchanged.
+PLAIN_TYPES = (type(None), bool, int, float, str, Decimal)
+
+#: How many :class:`ModelSerializer` instances :func:`get_serializer` keeps.
+SERIALIZER_CACHE_SIZE = 512
+
+
+def _convert_value(value):
+    if type(value) in PLAIN_TYPES:
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _convert_temporal(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return _convert_value(value)
+
+
+def _convert_uuid(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return _convert_value(value)
+
+
+def _convert_attribute(value):
+    """Like :func:`_convert_value`, but also serializes instances of mapped
+    classes, as :func:`to_dict` does for attributes which are not columns.
+
+    """
+    if type(value) in PLAIN_TYPES:
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    elif isinstance(value, uuid.UUID):
+        return str(value)
+    elif is_mapped_class(type(value)):
+        return to_dict(value)
+    return value
+
+
+def _convert_mapped(value):
+    """The counterpart of :func:`_convert_attribute` for a JSON encoder which
+    handles dates, times and UUIDs itself.
+
+    """
+    if type(value) in PLAIN_TYPES:
+        return value
+    if is_mapped_class(type(value)):
+        return get_serializer(type(value), native_types=True)(value)
+    return value
+
+
+def _column_converter(prop, native_types=False):
+    if native_types:
+        return None
+    try:
+        python_type = prop.columns[0].type.python_type
+    except (AttributeError, IndexError, NotImplementedError):
+        return _convert_value
+    if issubclass(python_type, (datetime.date, datetime.time)):
+        return _convert_temporal
+    if issubclass(python_type, uuid.UUID):
+        return _convert_uuid
+    return _convert_value
+
+
+class ModelSerializer(object):
+    """:func:`to_dict` precompiled for one model class and one set of its
+    arguments.
+
+    The columns, their value converters, the included methods and the
+    include/exclude settings of each relation are worked out once, so that
+    serializing an instance only reads and converts its attributes. Use
+    :func:`get_serializer` to share instances.
+
+    If `native_types` is ``True``, dates, times and UUIDs are left as they
+    are, for a JSON encoder which serializes them itself.
+
+    When the output only holds column attributes (no relations, hybrid
+    properties or methods), :attr:`row_columns` lists them and
+    :meth:`serialize_row` builds the same dictionary from a result row of
+    those columns, without an ORM instance. Otherwise it is ``None``.
+
+    :attr:`names` holds the keys of the dictionaries, in order.
+
+    """
+    def __init__(self, model, deep=None, exclude=None, include=None,
+                 exclude_relations=None, include_relations=None,
+                 include_methods=None, native_types=False):
+        if (exclude is not None or exclude_relations is not None) and \
+                (include is not None or include_relations is not None):
+            raise ValueError('Cannot specify both include and exclude.')
+        self.model = model
+        self._args = (deep, exclude, include, exclude_relations, include_relations,
+                      include_methods, native_types)
+        self._like_list = {}
+        self._related = {}
+        self.row_columns = None
+        self.names = None
+        try:
+            mapper = sqlalchemy_inspect(model)
+            column_attrs = mapper.column_attrs.keys()
+            descriptors = mapper.all_orm_descriptors.items()
+            hybrid_columns = [k for k, d in descriptors
+                              if d.extension_type == hybrid.hybrid_property
+                              and not (deep and k in deep)]
+        except NoInspectionAvailable:
+            self._columns = None
+            return
+        columns = column_attrs + hybrid_columns
+        if exclude is not None:
+            columns = [c for c in columns if c not in exclude]
+        elif include is not None:
+            columns = [c for c in columns if c in include]
+        convert_attribute = _convert_mapped if native_types else _convert_attribute
+        convert_value = None if native_types else _convert_value
+        self._columns = [
+            (c, _column_converter(mapper.column_attrs[c], native_types) if c in column_attrs
+             else convert_attribute)
+            for c in columns if not (c.startswith('__') or c in COLUMN_BLACKLIST)]
+        self._methods = [
+            (m, convert_value if m in column_attrs else convert_attribute)
+            for m in include_methods or () if '.' not in m]
+        self._relations = []
+        for relation in (deep or {}):
+            newexclude = None
+            newinclude = None
+            if exclude_relations is not None and relation in exclude_relations:
+                newexclude = exclude_relations[relation]
+            elif (include_relations is not None and
+                  relation in include_relations):
+                newinclude = include_relations[relation]
+            newmethods = None
+            if include_methods is not None:
+                newmethods = [method.split('.', 1)[1] for method in include_methods
+                              if method.split('.', 1)[0] == relation]
+            self._relations.append(
+                (relation, (deep[relation], newexclude, newinclude, newmethods)))
+        self.names = ([c for c, _ in self._columns] + [m for m, _ in self._methods]
+                      + [r for r, _ in self._relations])
+        if not (self._methods or self._relations
+                or any(c not in column_attrs for c, _ in self._columns)):
+            self.row_columns = [c for c, _ in self._columns]
+
+    def _serializer(self, relation, cls, args):
+        serializer = self._related.get((relation, cls))
+        if serializer is None:
+            rdeep, newexclude, newinclude, newmethods = args
+            serializer = self._related[relation, cls] = get_serializer(
+                cls, rdeep, exclude=newexclude, include=newinclude,
+                include_methods=newmethods, native_types=self._args[-1])
+        return serializer
+
+    def __call__(self, instance):
+        if type(instance) is not self.model:
+            return get_serializer(type(instance), *self._args)(instance)
+        if self._columns is None:
+            return instance
+        result = {}
+        for name, convert in self._columns:
+            value = getattr(instance, name)
+            result[name] = value if convert is None else convert(value)
+        for name, convert in self._methods:
+            value = getattr(instance, name)
+            # Allow properties and static attributes in include_methods
+            if callable(value):
+                value = value()
+            result[name] = value if convert is None else convert(value)
+        for relation, args in self._relations:
+            relatedvalue = getattr(instance, relation)
+            if relatedvalue is None:
+                result[relation] = None
+                continue
+            like_list = self._like_list.get(relation)
+            if like_list is None:
+                like_list = self._like_list[relation] = is_like_list(instance, relation)
+            if like_list:
+                result[relation] = [self._serializer(relation, type(inst), args)(inst)
+                                    for inst in relatedvalue]
+                continue
+            # If the related value is dynamically loaded, resolve the query to get
+            # the single instance.
+            if isinstance(relatedvalue, Query):
+                relatedvalue = relatedvalue.one()
+            result[relation] = self._serializer(relation, type(relatedvalue),
+                                                args)(relatedvalue)
+        return result
+
+    def serialize_row(self, row):
+        """Returns the dictionary of a result row whose first values are the
+        columns of :attr:`row_columns`, in that order.
+
+        """
+        result = {}
+        for (name, convert), value in zip(self._columns, row):
+            result[name] = value if convert is None else convert(value)
+        return result
+
+    def row_values(self, row):
+        """Like :meth:`serialize_row`, but returns the list of values."""
+        return [value if convert is None else convert(value)
+                for (name, convert), value in zip(self._columns, row)]
+
+
+def _frozen(value):
+    if isinstance(value, dict):
+        return (dict, tuple((k, _frozen(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_frozen(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+_serializers = OrderedDict()
+_serializers_lock = Lock()
+
+
+def get_serializer(model, deep=None, exclude=None, include=None,
+                   exclude_relations=None, include_relations=None,
+                   include_methods=None, native_types=False):
+    """Returns the :class:`ModelSerializer` of `model` for the given
+    :func:`to_dict` arguments, building it on first use.
+
+    Only the :data:`SERIALIZER_CACHE_SIZE` most recently used serializers are
+    kept, since request arguments such as ``fields`` make the number of
+    combinations unbounded.
+
+    """
+    args = (deep, exclude, include, exclude_relations, include_relations,
+            include_methods, native_types)
+    key = (model, _frozen(args))
+    with _serializers_lock:
+        serializer = _serializers.get(key)
+        if serializer is not None:
+            _serializers.move_to_end(key)
+            return serializer
+    serializer = ModelSerializer(model, *copy.deepcopy(args))
+    with _serializers_lock:
+        _serializers[key] = serializer
+        if len(_serializers) > SERIALIZER_CACHE_SIZE:
+            _serializers.popitem(last=False)
+    return serializer
+
+
 def to_dict(instance, deep=None, exclude=None, include=None,
             exclude_relations=None, include_relations=None,
             include_methods=None):
@@ -300,86 +638,10 @@ def to_dict(instance, deep=None, exclude=None, include=None,
     be called and their return values added to the returned dictionary.
 
     """
-    if (exclude is not None or exclude_relations is not None) and \
-            (include is not None or include_relations is not None):
-        raise ValueError('Cannot specify both include and exclude.')
-    # create a list of names of columns, including hybrid properties
-    instance_type = type(instance)
-    columns = []
-    try:
-        inspected_instance = sqlalchemy_inspect(instance_type)
-        column_attrs = inspected_instance.column_attrs.keys()
-        descriptors = inspected_instance.all_orm_descriptors.items()
-        hybrid_columns = [k for k, d in descriptors
-                          if d.extension_type == hybrid.hybrid_property
-                          and not (deep and k in deep)]
-        columns = column_attrs + hybrid_columns
-    except NoInspectionAvailable:
-        return instance
-    # filter the columns based on exclude and include values
-    if exclude is not None:
-        columns = (c for c in columns if c not in exclude)
-    elif include is not None:
-        columns = (c for c in columns if c in include)
-    # create a dictionary mapping column name to value
-    result = dict((col, getattr(instance, col)) for col in columns
-                  if not (col.startswith('__') or col in COLUMN_BLACKLIST))
-    # add any included methods
-    if include_methods is not None:
-        for method in include_methods:
-            if '.' not in method:
-                value = getattr(instance, method)
-                # Allow properties and static attributes in include_methods
-                if callable(value):
-                    value = value()
-                result[method] = value
-    # Check for objects in the dictionary that may not be serializable by
-    # default. Convert datetime objects to ISO 8601 format, convert UUID
-    # objects to hexadecimal strings, etc.
-    for key, value in result.items():
-        if isinstance(value, (datetime.date, datetime.time)):
-            result[key] = value.isoformat()
-        elif isinstance(value, uuid.UUID):
-            result[key] = str(value)
-        elif key not in column_attrs and is_mapped_class(type(value)):
-            result[key] = to_dict(value)
-    # recursively call _to_dict on each of the `deep` relations
-    deep = deep or {}
-    for relation, rdeep in deep.items():
-        # Get the related value so we can see if it is None, a list, a query
-        # (as specified by a dynamic relationship loader), or an actual
-        # instance of a model.
-        relatedvalue = getattr(instance, relation)
-        if relatedvalue is None:
-            result[relation] = None
-            continue
-        # Determine the included and excluded fields for the related model.
-        newexclude = None
-        newinclude = None
-        if exclude_relations is not None and relation in exclude_relations:
-            newexclude = exclude_relations[relation]
-        elif (include_relations is not None and
-              relation in include_relations):
-            newinclude = include_relations[relation]
-        # Determine the included methods for the related model.
-        newmethods = None
-        if include_methods is not None:
-            newmethods = [method.split('.', 1)[1] for method in include_methods
-                          if method.split('.', 1)[0] == relation]
-        if is_like_list(instance, relation):
-            result[relation] = [to_dict(inst, rdeep, exclude=newexclude,
-                                        include=newinclude,
-                                        include_methods=newmethods)
-                                for inst in relatedvalue]
-            continue
-        # If the related value is dynamically loaded, resolve the query to get
-        # the single instance.
-        if isinstance(relatedvalue, Query):
-            relatedvalue = relatedvalue.one()
-        result[relation] = to_dict(relatedvalue, rdeep, exclude=newexclude,
-                                   include=newinclude,
-                                   include_methods=newmethods)
-    return result
+    return get_serializer(type(instance), deep, exclude=exclude, include=include,
+                          exclude_relations=exclude_relations,
+                          include_relations=include_relations,
+                          include_methods=include_methods)(instance)
 
 
 def evaluate_functions(session, model, functions):
@@ -468,6 +730,7 @@ def query_by_primary_key(session, model, primary_key_value, primary_key=None):
     """
     pk_name = primary_key or primary_key_name(model)
     query = session_query(session, model)
+    primary_key_value = convert_key_value(model, pk_name, primary_key_value)
     return query.filter(getattr(model, pk_name) == primary_key_value)
 
 
@@ -484,7 +747,198 @@ def get_by(session, model, primary_key_value, primary_key=None):
     return result.first()
 
 
-def get_or_create(session, model, attrs):
+def is_column_record(model, attrs):
+    """Returns ``True`` if every key of the dictionary `attrs` names a column
+    attribute of `model`, so that it can be inserted by :func:`bulk_insert`.
+
+    """
+    column_attrs = sqlalchemy_inspect(model).column_attrs
+    return all(key in column_attrs for key in attrs)
+
+
+#: The mapper events of the rows written by an ``INSERT``, and by an
+#: ``UPDATE``, see :func:`has_orm_hooks`.
+INSERT_EVENTS = ('before_insert', 'after_insert')
+UPDATE_EVENTS = ('before_update', 'after_update')
+
+
+def has_orm_hooks(model, events=()):
+    """Returns ``True`` if writing rows of `model` runs Python code which
+    only goes through instances and the unit of work: ``@validates``
+    validators or other ``set`` listeners of its columns, or listeners of
+    the mapper `events` (see :data:`INSERT_EVENTS` and :data:`UPDATE_EVENTS`).
+
+    Statements sent directly, like those of :func:`bulk_insert`, skip them.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if mapper.validators:
+        return True
+    if any(getattr(model, key).dispatch.set for key in mapper.column_attrs.keys()):
+        return True
+    return any(getattr(mapper.dispatch, name) for name in events)
+
+
+def bulk_insert(session, model, rows):
+    """Inserts `rows`, dictionaries of column values (see
+    :func:`is_column_record`), as new rows of `model` and returns their
+    instances, in the order of `rows`.
+
+    Where the dialect supports ``RETURNING`` with many parameter sets, this
+    is a single batched ``INSERT ... RETURNING``, which also reads back the
+    generated keys and defaults. Otherwise the instances are added to the
+    session and flushed.
+
+    This method does not commit the changes made to the session; the
+    calling function has that responsibility.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    if session.get_bind(mapper=mapper).dialect.insert_executemany_returning:
+        stmt = insert(model).returning(model, sort_by_parameter_order=True)
+        return session.scalars(stmt, rows).all()
+    instances = [model(**row) for row in rows]
+    session.add_all(instances)
+    session.flush()
+    return instances
+
+
+#: Dialects with ``INSERT ... ON CONFLICT``, mapped to their ``insert``.
+ON_CONFLICT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+#: Dialects with ``INSERT ... ON DUPLICATE KEY UPDATE``.
+ON_DUPLICATE_KEY_DIALECTS = ('mysql', 'mariadb')
+
+
+def _primary_key_value(model, get, names):
+    # Converted to the column types, so that keys sent as 1.0, "01" or UUID
+    # strings match the values read back.
+    return tuple(convert_key_value(model, name, get(name)) for name in names)
+
+
+def upsert(session, model, rows):
+    """Inserts `rows`, dictionaries of column values (see
+    :func:`is_column_record`) which all hold the primary key, as rows of
+    `model`, updating the given columns of the rows whose primary key
+    already exists. Returns their instances, in the order of `rows`.
+
+    Rows with the same keys are written by one statement over all their
+    parameter sets: ``INSERT ... ON CONFLICT (pk) DO UPDATE ... RETURNING``
+    on PostgreSQL and SQLite, ``INSERT ... ON DUPLICATE KEY UPDATE`` on
+    MySQL and MariaDB, followed by one ``SELECT`` of the rows. Other
+    dialects, and models whose writes run hooks which those statements would
+    skip (see :func:`has_orm_hooks`), merge each row into the session, which
+    reads it first.
+
+    The primary key values of `rows` are converted to the column types, see
+    :func:`convert_key_value`.
+
+    This method does not commit the changes made to the session; the
+    calling function has that responsibility.
+
+    """
+    mapper = sqlalchemy_inspect(model)
+    pk_names = [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+    rows = [dict(row, **dict((name, convert_key_value(model, name, row[name]))
+                             for name in pk_names)) for row in rows]
+    dialect = session.get_bind(mapper=mapper).dialect.name
+    if (dialect not in ON_CONFLICT_INSERTS and dialect not in ON_DUPLICATE_KEY_DIALECTS) \
+            or has_orm_hooks(model, INSERT_EVENTS + UPDATE_EVENTS):
+        instances = [session.merge(model(**row)) for row in rows]
+        session.flush()
+        return instances
+
+    groups = OrderedDict()
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    instances = {}
+    for keys, group in groups.items():
+        columns = [mapper.column_attrs[key].columns[0] for key in keys
+                   if key not in pk_names]
+        if dialect in ON_CONFLICT_INSERTS:
+            stmt = ON_CONFLICT_INSERTS[dialect](model)
+            # Without columns to set, "update" the key so that RETURNING
+            # still gives back the existing rows.
+            set_ = dict((c, stmt.excluded[c.key]) for c in columns or mapper.primary_key)
+            stmt = stmt.on_conflict_do_update(index_elements=list(mapper.primary_key),
+                                              set_=set_).returning(model)
+            result = session.scalars(stmt, group,
+                                     execution_options=dict(populate_existing=True))
+            for instance in result:
+                key = _primary_key_value(model, partial(getattr, instance), pk_names)
+                instances[key] = instance
+        else:
+            stmt = mysql.insert(model)
+            stmt = stmt.on_duplicate_key_update(dict(
+                (c, stmt.inserted[c.key]) for c in columns or mapper.primary_key))
+            session.execute(stmt, group)
+    if dialect in ON_DUPLICATE_KEY_DIALECTS:
+        pk_columns = [getattr(model, name) for name in pk_names]
+        values = [tuple(row[name] for name in pk_names) for row in rows]
+        stmt = select(model).where(tuple_(*pk_columns).in_(values))
+        result = session.scalars(stmt, execution_options=dict(populate_existing=True))
+        for instance in result:
+            instances[_primary_key_value(model, partial(getattr, instance), pk_names)] = instance
+    return [instances[_primary_key_value(model, row.get, pk_names)] for row in rows]
+
+
+#: How many primary keys :func:`load_by_primary_keys` puts in one ``IN``.
+IN_QUERY_CHUNK_SIZE = 500
+
+
+def collect_primary_keys(model, records, keys=None):
+    """Adds to `keys` the primary key values found in `records`, the
+    dictionaries of attributes of `model` which :func:`get_or_create` takes,
+    and in the records of relations nested in them. Returns `keys`, which
+    maps models to the primary key values of their records.
+
+    """
+    keys = {} if keys is None else keys
+    pk_names = primary_key_names(model)
+    relations = get_relations(model)
+    for attrs in records:
+        if not isinstance(attrs, dict):
+            continue
+        if pk_names and all(name in attrs for name in pk_names):
+            values = dict((name, convert_key_value(model, name, attrs[name]))
+                          for name in pk_names)
+            keys.setdefault(model, {})[_primary_key_value(model, values.get, pk_names)] = values
+        for rel in relations:
+            if attrs.get(rel) is not None:
+                related = attrs[rel] if isinstance(attrs[rel], list) else [attrs[rel]]
+                collect_primary_keys(get_related_model(model, rel), related, keys)
+    return keys
+
+
+def load_by_primary_keys(session, keys):
+    """Loads the instances whose primary key values were gathered by
+    :func:`collect_primary_keys`, with one ``IN`` query per model (and per
+    :data:`IN_QUERY_CHUNK_SIZE` keys).
+
+    Returns a dictionary which maps each model of `keys` to its instances by
+    primary key value, for the `loaded` argument of :func:`get_or_create`.
+
+    """
+    loaded = {}
+    for model, values in keys.items():
+        pk_names = primary_key_names(model)
+        columns = [getattr(model, name) for name in pk_names]
+        instances = loaded[model] = {}
+        values = list(values.values())
+        for start in range(0, len(values), IN_QUERY_CHUNK_SIZE):
+            chunk = values[start:start + IN_QUERY_CHUNK_SIZE]
+            if len(columns) == 1:
+                criterion = columns[0].in_([v[pk_names[0]] for v in chunk])
+            else:
+                criterion = tuple_(*columns).in_(
+                    [tuple(v[name] for name in pk_names) for v in chunk])
+            for instance in session_query(session, model).filter(criterion):
+                key = _primary_key_value(model, partial(getattr, instance), pk_names)
+                instances[key] = instance
+    return loaded
+
+
+def get_or_create(session, model, attrs, loaded=None):
     """Returns the single instance of `model` whose primary key has the
     value found in `attrs`, or initializes a new instance if no primary key
     is specified.
@@ -492,6 +946,10 @@ def get_or_create(session, model, attrs):
     Before returning the new or existing instance, its attributes are
     assigned to the values supplied in the `attrs` dictionary.
 
+    `loaded`, as returned by :func:`load_by_primary_keys`, holds the
+    existing instances of the models it maps, which are then not queried one
+    by one; a primary key missing from it is a new row.
+
     This method does not commit the changes made to the session; the
     calling function has that responsibility.
 
@@ -507,10 +965,10 @@ def get_or_create(session, model, attrs):
             continue
         if isinstance(attrs[rel], list):
             attrs[rel] = [get_or_create(session, get_related_model(model, rel),
-                                        r) for r in attrs[rel]]
+                                        r, loaded) for r in attrs[rel]]
         else:
             attrs[rel] = get_or_create(session, get_related_model(model, rel),
-                                       attrs[rel])
+                                       attrs[rel], loaded)
 
     # Find private key names
     pk_names = primary_key_names(model)
@@ -519,12 +977,16 @@ def get_or_create(session, model, attrs):
     # an existing row.
     if all(k in attrs for k in pk_names):
         # Determine the sub-dictionary of `attrs` which contains the mappings
-        # for the primary keys.
-        pk_values = dict((k, v) for (k, v) in attrs.items()
-                         if k in pk_names)
+        # for the primary keys, converted to the column types.
+        pk_values = dict((k, convert_key_value(model, k, v))
+                         for (k, v) in attrs.items() if k in pk_names)
+        attrs.update(pk_values)
         # query for an existing row which matches all the specified
-        # primary key values.
-        instance = session_query(session, model).filter_by(**pk_values).first()
+        # primary key values, unless it was loaded beforehand.
+        if loaded is not None and model in loaded:
+            instance = loaded[model].get(_primary_key_value(model, pk_values.get, pk_names))
+        else:
+            instance = session_query(session, model).filter_by(**pk_values).first()
         if instance is not None:
             for pk in pk_names:
                 if (attrs is not None) and (pk in attrs):
@@ -536,6 +998,116 @@ def get_or_create(session, model, attrs):
     return model(**attrs)
 
 
+def _parse_date_string(value):
+    if value.strip() == '':
+        return None
+    if value in CURRENT_TIME_MARKERS:
+        return getattr(func, value.lower())()
+    # Clients mostly send ISO 8601, which the standard library parses much
+    # faster than dateutil; anything else still goes through dateutil.
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return parse_datetime(value)
+
+
+def _to_date(value):
+    # A Date column only needs the date component of the datetime.
+    value = _parse_date_string(value)
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _to_interval(value):
+    if isinstance(value, int):
+        return datetime.timedelta(seconds=value)
+    return value
+
+
+def _field_converter(fieldtype):
+    if isinstance(fieldtype, Date):
+        return _to_date
+    if isinstance(fieldtype, DateTime):
+        return _parse_date_string
+    if isinstance(fieldtype, Interval):
+        return _to_interval
+    return None
+
+
+def get_field_converter(model, fieldname):
+    """Returns the function :func:`strings_to_dates` applies to the values of
+    the field of `model` named `fieldname`, or ``None`` if they are kept as
+    they are.
+
+    """
+    field_converters = model_metadata(model).field_converters
+    if fieldname in field_converters:
+        return field_converters[fieldname]
+    converter = _field_converter(get_field_type(model, fieldname))
+    field_converters[fieldname] = converter
+    return converter
+
+
+def _to_integer_key(value):
+    # 1.0 and "01" name the row whose key is 1, as they do when the database
+    # compares them with an integer column.
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                return value
+            return int(number) if number.is_integer() else value
+    return value
+
+
+def _to_uuid_key(value):
+    if isinstance(value, str):
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _key_converter(fieldtype):
+    try:
+        python_type = fieldtype.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+    if python_type is int:
+        return _to_integer_key
+    if python_type is uuid.UUID:
+        return _to_uuid_key
+    converter = _field_converter(fieldtype)
+    if converter is None:
+        return None
+    return lambda value: converter(value) if isinstance(value, str) else value
+
+
+def convert_key_value(model, fieldname, value):
+    """Returns `value`, given by a client for the primary key field of
+    `model` named `fieldname`, converted to the Python type of the column,
+    so that it can be compared with the keys of loaded instances and sent
+    to drivers which do not cast parameters themselves.
+
+    Values which do not convert are returned as they are.
+
+    """
+    key_converters = model_metadata(model).key_converters
+    if fieldname in key_converters:
+        converter = key_converters[fieldname]
+    else:
+        converter = key_converters[fieldname] = _key_converter(
+            get_field_type(model, fieldname))
+    return value if converter is None or value is None else converter(value)
+
+
 def strings_to_dates(model, dictionary):
     """Returns a new dictionary with all the mappings of `dictionary` but
     with date strings and intervals mapped to :class:`datetime.datetime` or
@@ -554,27 +1126,34 @@ def strings_to_dates(model, dictionary):
     """
     result = {}
     for fieldname, value in dictionary.items():
-        if is_date_field(model, fieldname) and value is not None:
-            if value.strip() == '':
-                result[fieldname] = None
-            elif value in CURRENT_TIME_MARKERS:
-                result[fieldname] = getattr(func, value.lower())()
-            else:
-                value_as_datetime = parse_datetime(value)
-                result[fieldname] = value_as_datetime
-                # If the attribute on the model needs to be a Date object as
-                # opposed to a DateTime object, just get the date component of
-                # the datetime.
-                fieldtype = get_field_type(model, fieldname)
-                if isinstance(fieldtype, Date):
-                    result[fieldname] = value_as_datetime.date()
-        elif (is_interval_field(model, fieldname) and value is not None
-              and isinstance(value, int)):
-            result[fieldname] = datetime.timedelta(seconds=value)
-        else:
-            result[fieldname] = value
+        if value is not None:
+            converter = get_field_converter(model, fieldname)
+            if converter is not None:
+                value = converter(value)
+        result[fieldname] = value
     return result
 
+
+def strings_to_dates_many(model, dictionaries):
+    """Returns the list of :func:`strings_to_dates` applied to each of
+    `dictionaries`, looking up the converter of each field only once.
+
+    """
+    converters = {}
+    results = []
+    for dictionary in dictionaries:
+        result = {}
+        for fieldname, value in dictionary.items():
+            if value is not None:
+                if fieldname not in converters:
+                    converters[fieldname] = get_field_converter(model, fieldname)
+                converter = converters[fieldname]
+                if converter is not None:
+                    value = converter(value)
+            result[fieldname] = value
+        results.append(result)
+    return results
+
 # def count(session, query):
 #     """Returns the count of the specified `query`.
 
@@ -598,3 +1177,134 @@ def count(session, query):
     if num_results is None or query.statement._limit_clause is not None:
         return query.count()
     return num_results
+
+
+class Explain(Executable, ClauseElement):
+    """A PostgreSQL ``EXPLAIN (FORMAT JSON)`` of the `statement`."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def _planned_rows(plan):
+    if isinstance(plan, str):
+        plan = json_loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(session, query):
+    """Returns the number of rows the query planner expects the specified
+    `query` to return.
+
+    The estimate comes from the table statistics of the database, so it is
+    cheap but only as fresh as the last ``ANALYZE``. Databases other than
+    PostgreSQL fall back to the exact :func:`count`.
+
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return count(session, query)
+    return _planned_rows(session.execute(Explain(query.statement.order_by(None))).scalar())
+
+
+#: The first server version of each dialect with window functions.
+WINDOW_FUNCTION_VERSIONS = {
+    'postgresql': (8, 4),
+    'sqlite': (3, 25),
+    'mysql': (8, 0),
+    'mariadb': (10, 2),
+    'mssql': (9,),
+    'oracle': (8,),
+}
+
+
+def supports_window_count(session, statement):
+    """Returns ``True`` if the total row count of the :func:`select`
+    `statement` can be read from a ``count(*) OVER ()`` column of its page.
+
+    That needs a database with window functions and a statement without its
+    own LIMIT, OFFSET or DISTINCT, which the window would not see. The
+    server version is only known once the engine has connected, so the very
+    first query of an engine is never windowed.
+
+    """
+    if (statement._limit_clause is not None or statement._offset_clause is not None
+            or statement._distinct):
+        return False
+    dialect = session.get_bind().dialect
+    name = 'mariadb' if getattr(dialect, 'is_mariadb', False) else dialect.name
+    minimum = WINDOW_FUNCTION_VERSIONS.get(name)
+    version = dialect.server_version_info
+    return (minimum is not None and version is not None
+            and tuple(version[:len(minimum)]) >= minimum)
+
+
+def _window_total():
+    return func.count().over().label('_window_total')
+
+
+def _split_window_total(rows, scalar=True):
+    if not rows:
+        return [], None
+    if scalar:
+        return [row[0] for row in rows], rows[0][-1]
+    return [row[:-1] for row in rows], rows[0][-1]
+
+
+def windowed_page(query, start, end=None, scalar=True):
+    """Returns the rows of ``query[start:end]`` and the total count of
+    `query`, both fetched by a single statement.
+
+    The total is ``None`` if the page is empty, since then no row carries it.
+    If `scalar` is ``False``, `query` selects several columns and their rows
+    are returned as tuples rather than their first value.
+
+    """
+    return _split_window_total(query.add_columns(_window_total())[start:end], scalar)
+
+
+async def async_windowed_page(session, statement, start, end=None, scalar=True):
+    """Returns the rows of the :func:`select` `statement` from `start` to
+    `end` and its total count, awaited on the ``AsyncSession`` `session`.
+
+    This is the asynchronous counterpart of :func:`windowed_page`.
+
+    """
+    statement = statement.add_columns(_window_total())
+    if start:
+        statement = statement.offset(start)
+    if end is not None:
+        statement = statement.limit(end - start)
+    result = await session.execute(statement)
+    return _split_window_total((result.unique() if scalar else result).all(), scalar)
+
+
+async def async_count(session, statement):
+    """Returns the count of the specified :func:`~sqlalchemy.select`
+    `statement`, awaited on the ``AsyncSession`` `session`.
+
+    This is the asynchronous counterpart of :func:`count`.
+
+    """
+    subq = statement.order_by(None).subquery()
+    count_stmt = select(func.count()).select_from(subq)
+    num_results = await session.scalar(count_stmt)
+    return num_results or 0
+
+
+async def async_estimate_count(session, statement):
+    """Returns the planner estimate of the row count of the specified
+    :func:`~sqlalchemy.select` `statement`, awaited on the ``AsyncSession``
+    `session`.
+
+    This is the asynchronous counterpart of :func:`estimate_count`.
+
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return await async_count(session, statement)
+    return _planned_rows(await session.scalar(Explain(statement.order_by(None))))
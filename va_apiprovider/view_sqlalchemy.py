@@ -1,50 +1,79 @@
 import asyncio
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
 from collections import defaultdict
+import datetime
+from decimal import Decimal
+import enum
 from functools import wraps
 import math
+import uuid
 import warnings
 
 from sanic.exceptions import SanicException, ServerError
 from sanic.response import json, text, HTTPResponse
 # from sanic.request import json_loads
-from json import loads as json_loads
 from sanic.views import HTTPMethodView
 
 from sqlalchemy import Column
 from sqlalchemy.exc import (DataError, IntegrityError, ProgrammingError, OperationalError)
 from sqlalchemy.ext.associationproxy import AssociationProxy
+from sqlalchemy.inspection import inspect as sqlalchemy_inspect
+from sqlalchemy.ext import hybrid
+from sqlalchemy.orm import (immediateload, joinedload, load_only, selectinload,
+                            subqueryload)
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.exc import (MultipleResultsFound, NoResultFound)
 from sqlalchemy.orm.query import Query
 
+from .helpers.sqlalchemy import bulk_insert
+from .helpers.sqlalchemy import collect_primary_keys
+from .helpers.sqlalchemy import convert_key_value
 from .helpers.sqlalchemy import count
+from .helpers.sqlalchemy import estimate_count
 from .helpers.sqlalchemy import evaluate_functions
 from .helpers.sqlalchemy import get_by
 from .helpers.sqlalchemy import get_columns
 from .helpers.sqlalchemy import get_or_create
+from .helpers.sqlalchemy import get_serializer
 from .helpers.sqlalchemy import get_related_model
 from .helpers.sqlalchemy import get_relations
 from .helpers.sqlalchemy import has_field
+from .helpers.sqlalchemy import has_orm_hooks
+from .helpers.sqlalchemy import is_column_record
 from .helpers.sqlalchemy import is_like_list
+from .helpers.sqlalchemy import load_by_primary_keys
 from .helpers.sqlalchemy import partition
 from .helpers.sqlalchemy import primary_key_name
+from .helpers.sqlalchemy import primary_key_names
 from .helpers.sqlalchemy import query_by_primary_key
 from .helpers.sqlalchemy import session_query
 from .helpers.sqlalchemy import strings_to_dates
+from .helpers.sqlalchemy import strings_to_dates_many
+from .helpers.sqlalchemy import supports_window_count
 from .helpers.sqlalchemy import to_dict
 from .helpers.sqlalchemy import upper_keys
+from .helpers.sqlalchemy import upsert
+from .helpers.sqlalchemy import windowed_page
 from .helpers.sqlalchemy import get_related_association_proxy_model
+from .helpers.sqlalchemy import INSERT_EVENTS
+from .helpers.sqlalchemy import UPDATE_EVENTS
 
+from .compression import mark_streamed, streamed_send
 from .core import ModelView
-from .exception import (ProcessingException, ValidationError, response_exception)
+from .export import (EXPORT_FORMATS, export_writer)
+from .database.routing import use_replica
+from .exception import (IllegalArgumentError, ProcessingException, ValidationError,
+                        response_exception)
 ######
 from inspect import getfullargspec
 
-from sqlalchemy import (and_,or_)
+from sqlalchemy import (and_, or_, select, tuple_, update)
 from .helpers.sqlalchemy import session_query
 from .helpers import to_namespace
 
-from .constant import OPERATORS
+from .constant import (COUNT_MODES, NDJSON_MIMETYPE, OPERATORS, PAGINATION_MODES,
+                       RESPONSE_FORMATS)
 
 class SqlaFilter(object):
     def __init__(self, junction="Filter", field=None, operator=None, argument=None, 
@@ -123,11 +152,35 @@ def sqla_create_filter(model, filt):
     return sqla_create_operation(model, fieldname, filt.operator, val, relation)
 
 def sqla_create_query(session, model, search_params, _ignore_order_by=False):
+    sqla_query = session_query(session, model)
+    return sqla_apply_search_params(sqla_query, model, search_params, _ignore_order_by)
+
+def sqla_create_select(model, search_params, _ignore_order_by=False):
+    """Same as :func:`sqla_create_query` but builds a 2.0 style
+    :func:`~sqlalchemy.select` statement, for use with an ``AsyncSession``.
+
+    """
+    return sqla_apply_search_params(select(model), model, search_params, _ignore_order_by)
+
+def sqla_create_update(model, search_params, values):
+    """Builds a single ``UPDATE`` which sets `values` on the rows of `model`
+    matched by the filters of `search_params`. Its ordering is ignored, and
+    it must not limit, offset or group the rows.
+
+    The session is not synchronized with the updated rows.
+
+    """
+    where = sqla_create_select(model, search_params, _ignore_order_by=True).whereclause
+    stmt = update(model).values(values)
+    if where is not None:
+        stmt = stmt.where(where)
+    return stmt.execution_options(synchronize_session=False)
+
+def sqla_apply_search_params(sqla_query, model, search_params, _ignore_order_by=False):
     if isinstance(search_params, dict):
         search_params = search_parameters_namespace(search_params)
     if _ignore_order_by:
-        setattr(search_params, order_by, None)
-    sqla_query = session_query(session, model)     
+        search_params.order_by = None
     filters = bool(search_params.filters) and [
         sqla_create_filter(model, search_params.filters)] or []
     sqla_query = sqla_query.filter(*filters)
@@ -159,6 +212,108 @@ def sqla_create_query(session, model, search_params, _ignore_order_by=False):
 
     return sqla_query
 
+def sqla_keyset(model, search_params, primary_key=None):
+    """Returns the ``(field, direction)`` pairs ordering a keyset (cursor)
+    page: the ``order_by`` of `search_params` followed by the primary key,
+    which makes the order total.
+
+    Keyset fields should not be nullable; rows whose key is NULL can not be
+    seeked past.
+
+    """
+    if isinstance(search_params, dict):
+        search_params = search_parameters_namespace(search_params)
+    keys = []
+    for order_by in search_params.order_by or []:
+        if getattr(model, order_by.field, None) is None:
+            raise ValueError(f"The order_by field '{order_by.field}' is invalid")
+        if order_by.direction not in ('asc', 'desc'):
+            raise ValueError(f"The order_by direction '{order_by.direction}' is invalid")
+        keys.append((order_by.field, order_by.direction))
+    pk_name = primary_key or primary_key_name(model)
+    if pk_name not in [field for field, direction in keys]:
+        keys.append((pk_name, 'asc'))
+    return keys
+
+def sqla_apply_keyset(sqla_query, model, keys, values=None):
+    """Orders `sqla_query` by `keys` (see :func:`sqla_keyset`) and, when the
+    key `values` of the previous page's last row are given, keeps only the
+    rows after it.
+
+    The seek uses a row value comparison ``(k1, k2) > (v1, v2)`` when all keys
+    share one direction, and the equivalent OR expansion otherwise.
+
+    """
+    columns = [getattr(model, field) for field, direction in keys]
+    directions = [direction for field, direction in keys]
+    sqla_query = sqla_query.order_by(*[getattr(column, direction)()
+                                       for column, direction in zip(columns, directions)])
+    if values is None:
+        return sqla_query
+    after = lambda column, value, direction: column > value if direction == 'asc' else column < value
+    if len(columns) == 1:
+        return sqla_query.filter(after(columns[0], values[0], directions[0]))
+    if len(set(directions)) == 1:
+        return sqla_query.filter(after(tuple_(*columns), tuple_(*values), directions[0]))
+    clauses = []
+    for i, (column, direction) in enumerate(zip(columns, directions)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*equal, after(column, values[i], direction)))
+    return sqla_query.filter(or_(*clauses))
+
+def _cursor_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+def _from_cursor_value(column, value):
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if value is None:
+        return None
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return python_type.fromisoformat(value)
+    if python_type in (uuid.UUID, Decimal):
+        return python_type(value)
+    if issubclass(python_type, enum.Enum):
+        return python_type[value]
+    return value
+
+def encode_cursor(values, json_codec):
+    """Returns the opaque cursor string for the keyset `values` of a row,
+    encoded with the :class:`~va_apiprovider.codec.JSONCodec` of the view.
+
+    """
+    payload = json_codec.encode([_cursor_value(v) for v in values])
+    return urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(model, keys, cursor, json_codec):
+    """Returns the keyset values encoded in `cursor`, converted back to the
+    Python types of the `keys` columns of `model`.
+
+    Raises :exc:`ValueError` if `cursor` was not made for these keys.
+
+    """
+    try:
+        payload = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json_codec.loads(payload)
+    except (TypeError, ValueError, binascii.Error) as exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(keys) \
+            or any(isinstance(value, (dict, list)) for value in values):
+        raise ValueError('Invalid cursor')
+    try:
+        return [_from_cursor_value(getattr(model, field), value)
+                for (field, direction), value in zip(keys, values)]
+    except (KeyError, TypeError, ValueError) as exception:
+        raise ValueError('Invalid cursor')
+
 #######
         
 def catch_integrity_errors(session):
@@ -185,6 +340,81 @@ def _parse_includes(column_names):
             columns.remove(relation)
     return columns, relations
 
+#: The loader options a view may use to fetch the relations it serializes;
+#: ``lazy`` leaves a relation to load on first access.
+RELATION_LOADERS = {
+    'selectin': selectinload,
+    'joined': joinedload,
+    'subquery': subqueryload,
+    'immediate': immediateload,
+    'lazy': None,
+}
+
+def sqla_loader_options(model, deep, choose_loader=None, related_options=None):
+    """Returns the loader options which fetch every relation of `model` named
+    in the `deep` map (and, recursively, the relations nested in it) together
+    with the query, rather than one query per row on first access.
+
+    `choose_loader` is called with each relationship property and returns a
+    key of :data:`RELATION_LOADERS`, or ``None`` for the default:
+    ``selectin`` for collections and ``joined`` for scalar relations.
+    Dynamic and write-only relations cannot be eagerly loaded and are skipped.
+
+    `related_options`, if given, is called with each relationship property
+    and returns further options for the related entity, such as the ones of
+    :func:`sqla_column_options`.
+
+    """
+    options = []
+    mapper = sqlalchemy_inspect(model)
+    for name, rdeep in (deep or {}).items():
+        prop = mapper.relationships.get(name)
+        if prop is None or prop.lazy in ('dynamic', 'write_only', 'noload'):
+            continue
+        loader = choose_loader(prop) if choose_loader is not None else None
+        if loader is None:
+            loader = 'selectin' if prop.uselist else 'joined'
+        if RELATION_LOADERS[loader] is None:
+            continue
+        option = RELATION_LOADERS[loader](getattr(model, name))
+        suboptions = list(related_options(prop)) if related_options is not None else []
+        if isinstance(rdeep, dict) and rdeep:
+            suboptions += sqla_loader_options(prop.mapper.class_, rdeep, choose_loader,
+                                              related_options)
+        if suboptions:
+            option = option.options(*suboptions)
+        options.append(option)
+    return options
+
+def sqla_column_options(model, include=None, exclude=None, keep=()):
+    """Returns a :func:`~sqlalchemy.orm.load_only` option which fetches only
+    the columns of `model` that :func:`to_dict` serializes for the given
+    `include` or `exclude` lists, or an empty list if that is all of them.
+
+    The primary key and foreign key columns, which relationship loading
+    relies on, are always fetched, as are the `keep` columns. Models with
+    serialized hybrid properties are left whole, since a hybrid may read any
+    column.
+
+    """
+    if include is None and not exclude:
+        return []
+    mapper = sqlalchemy_inspect(model)
+    if any(d.extension_type == hybrid.hybrid_property
+           for d in mapper.all_orm_descriptors):
+        return []
+    columns = mapper.column_attrs.keys()
+    if include is not None:
+        wanted = [c for c in columns if c in include]
+    else:
+        wanted = [c for c in columns if c not in exclude]
+    wanted += [prop.key for prop in mapper.column_attrs
+               if any(column.foreign_keys for column in prop.columns)]
+    wanted = set(wanted).union(keep)
+    if wanted.issuperset(columns):
+        return []
+    return [load_only(*[getattr(model, c) for c in columns if c in wanted])]
+
 def _parse_excludes(column_names):
     dotted_names, columns = partition(column_names, lambda name: '.' in name)
     relations = defaultdict(list)
@@ -222,26 +452,79 @@ async def run_process(process, **kwargs):
 
 class SQLAView(ModelView):
     db = None
-    session = None
+    _session = None
+    #: How GET_MANY responses are paginated, one of :data:`PAGINATION_MODES`.
+    pagination = 'page'
+    #: How paginated responses report their size, one of :data:`COUNT_MODES`;
+    #: the ``count`` request argument overrides it.
+    count_mode = 'exact'
+    #: Maps relation names to the key of :data:`RELATION_LOADERS` used to
+    #: fetch them; unlisted relations get the default of
+    #: :func:`sqla_loader_options`.
+    relation_loaders = None
+    #: Whether an exact count is read from a ``count(*) OVER ()`` column of
+    #: the page query, where the database allows it, rather than counted by a
+    #: second query.
+    window_count = True
+    #: How many rows a streamed GET_MANY response reads from the database and
+    #: writes to the client at a time.
+    stream_batch_size = 100
+    #: Whether GET_MANY reads plain rows of the serialized columns rather
+    #: than ORM instances, when its output holds no relations, hybrid
+    #: properties or methods.
+    row_mode = True
+    #: Whether a PUT_MANY which only sets columns runs as a single ``UPDATE``
+    #: of the matching rows instead of loading and updating each of them.
+    set_based_put_many = True
+    #: Whether the POST hooks run once per record of a bulk POST (a JSON
+    #: array) rather than once for the whole array.
+    bulk_hooks_per_record = False
+    _reading_rows = False
+    view_options = ModelView.view_options | frozenset([
+        'session', 'validation_exceptions', 'serializer', 'deserializer', 'pagination',
+        'relation_loaders', 'window_count', 'stream_batch_size', 'row_mode',
+        'set_based_put_many', 'bulk_hooks_per_record', 'count_mode'])
+
+    @classmethod
+    def check_options(cls, **kw):
+        super(SQLAView, cls).check_options(**kw)
+        if kw.get('pagination', cls.pagination) not in PAGINATION_MODES:
+            msg = 'pagination must be one of {0}'.format(', '.join(PAGINATION_MODES))
+            raise IllegalArgumentError(msg)
+        for loader in (kw.get('relation_loaders', cls.relation_loaders) or {}).values():
+            if loader not in RELATION_LOADERS:
+                msg = 'relation loaders must be one of {0}'.format(', '.join(RELATION_LOADERS))
+                raise IllegalArgumentError(msg)
+        if kw.get('count_mode', cls.count_mode) not in COUNT_MODES:
+            msg = 'count_mode must be one of {0}'.format(', '.join(COUNT_MODES))
+            raise IllegalArgumentError(msg)
 
     def __init__(self, model=None, collection_name=None, exclude_columns=None,
                  include_columns=None, include_methods=None, results_per_page=10,
                  max_results_per_page=1000, preprocess=None, postprocess=None,
                  primary_key=None, db=None, *args, **kw):
 
+        session = kw.pop('session', None)
+        validation_exceptions = kw.pop('validation_exceptions', None)
+        
+        serializer = kw.pop('serializer', None)
+        deserializer = kw.pop('deserializer', None)
+
+        self.pagination = kw.pop('pagination', self.pagination)
+        self.relation_loaders = kw.pop('relation_loaders', self.relation_loaders)
+        self.window_count = kw.pop('window_count', self.window_count)
+        self.stream_batch_size = kw.pop('stream_batch_size', self.stream_batch_size)
+        self.row_mode = kw.pop('row_mode', self.row_mode)
+        self.set_based_put_many = kw.pop('set_based_put_many', self.set_based_put_many)
+        self.bulk_hooks_per_record = kw.pop('bulk_hooks_per_record',
+                                            self.bulk_hooks_per_record)
+        self.count_mode = kw.pop('count_mode', self.count_mode)
+
         super(SQLAView, self).__init__(model,collection_name, exclude_columns, include_columns,
                 include_methods, results_per_page, max_results_per_page,
                 preprocess, postprocess, primary_key, db, *args, **kw)
         
-        self.session = kw.pop('session', None)
-        validation_exceptions = kw.get('validation_exceptions', None)
-        
-        serializer = kw.get('serializer', None)
-        deserializer = kw.get('deserializer', None)
-        
-        if db is not None:
-            if self.session is None:
-                self.session = getattr(self.db, 'session', None)
+        self.session = session
         
         if exclude_columns is None:
             self.exclude_columns, self.exclude_relations = (None, None)
@@ -270,7 +553,58 @@ class SQLAView(ModelView):
         decorate = lambda name, f: setattr(self, name, f(getattr(self, name)))
         # for method in ['get', 'post', 'patch', 'put', 'delete']:
         for method in ['get', 'post', 'put', 'delete']:
-            decorate(method, catch_integrity_errors(self.session))
+            decorate(method, self._catch_integrity_errors)
+
+    @property
+    def session(self):
+        """The session given to the constructor, or else the session of
+        :attr:`db`. It is looked up lazily so that request-bound sessions
+        (see :mod:`database.async`) can be used.
+
+        """
+        if self._session is None and self.db is not None:
+            return self.db.session
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def _catch_integrity_errors(self, func):
+        return catch_integrity_errors(self.session)(func)
+
+    def _pk_column(self, model=None, primary_key=None):
+        model = model or self.model
+        return getattr(model, primary_key or self.primary_key or primary_key_name(model))
+
+    def _pk_criterion(self, instid, model=None, primary_key=None):
+        """Returns the comparison of the primary key column with `instid`,
+        the key from the URL converted to the type of the column (see
+        :func:`convert_key_value`).
+
+        """
+        model = model or self.model
+        column = self._pk_column(model, primary_key)
+        return column == convert_key_value(model, column.key, instid)
+
+    def _use_replica(self):
+        """Sends the reads of a read-only handler to a replica of :attr:`db`,
+        when it has any.
+
+        """
+        if getattr(self.db, 'replicas', None):
+            use_replica(self.session)
+
+    async def _run_db(self, func, *args, **kw):
+        """Runs ``func(*args, **kw)``, the database part of a handler. When
+        :attr:`db` offloads blocking calls (``SQLALCHEMY_OFFLOAD``) it runs on
+        the database executor, otherwise inline on the event loop.
+
+        """
+        offload = getattr(self.db, 'offload', None)
+        if offload is None:
+            return func(*args, **kw)
+        return await offload(func, *args, **kw)
 
     def _get_column_name(self, column):
         if hasattr(column, '__clause_element__'):
@@ -286,43 +620,69 @@ class SQLAView(ModelView):
             return clause_element.key
         return column
 
-    def _add_to_relation(self, query, relationname, toadd=None):
+    def _add_to_relation(self, query, relationname, toadd=None, session=None,
+                         loaded=None):
+        session = self.session if session is None else session
         submodel = get_related_model(self.model, relationname)
         if isinstance(toadd, dict):
             toadd = [toadd]
+        instances = list(query) if toadd else []
         for dictionary in toadd or []:
-            subinst = get_or_create(self.session, submodel, dictionary)
+            subinst = get_or_create(session, submodel, dictionary, loaded)
             try:
-                for instance in query:
+                for instance in instances:
                     getattr(instance, relationname).append(subinst)
             except AttributeError as exception:
                 setattr(instance, relationname, subinst)
 
-    def _remove_from_relation(self, query, relationname, toremove=None):
+    def _remove_from_relation(self, query, relationname, toremove=None, session=None):
+        session = self.session if session is None else session
         submodel = get_related_model(self.model, relationname)
         for dictionary in toremove or []:
             remove = dictionary.pop('__delete__', False)
             if 'id' in dictionary:
-                subinst = get_by(self.session, submodel, dictionary['id'])
+                subinst = get_by(session, submodel, dictionary['id'])
             else:
-                subinst = self.query(submodel).filter_by(**dictionary).first()
+                subinst = session_query(session, submodel).filter_by(**dictionary).first()
             for instance in query:
                 getattr(instance, relationname).remove(subinst)
             if remove:
-                self.session.delete(subinst)
+                session.delete(subinst)
 
-    def _set_on_relation(self, query, relationname, toset=None):
+    def _set_on_relation(self, query, relationname, toset=None, session=None,
+                         loaded=None):
+        session = self.session if session is None else session
         submodel = get_related_model(self.model, relationname)
         if isinstance(toset, list):
-            value = [get_or_create(self.session, submodel, d) for d in toset]
+            value = [get_or_create(session, submodel, d, loaded) for d in toset]
         else:
-            value = get_or_create(self.session, submodel, toset)
+            value = get_or_create(session, submodel, toset, loaded)
         for instance in query:
             setattr(instance, relationname, value)
 
-    def _update_relations(self, query, params):
+    def _load_related(self, params, relationnames, session):
+        """Loads the existing rows of the related records in `params` (and
+        in the records nested in them) with one query per model, for
+        :func:`get_or_create`.
+
+        """
+        keys = {}
+        for relationname in relationnames:
+            records = params[relationname]
+            if isinstance(records, dict) and any(k in records for k in ['add', 'remove']):
+                records = records.get('add', [])
+            if records is None:
+                continue
+            submodel = get_related_model(self.model, relationname)
+            collect_primary_keys(submodel, records if isinstance(records, list) else [records],
+                                 keys)
+        return load_by_primary_keys(session, keys)
+
+    def _update_relations(self, query, params, session=None):
+        session = self.session if session is None else session
         relations = get_relations(self.model)
         tochange = frozenset(relations) & frozenset(params)
+        loaded = self._load_related(params, tochange, session)
 
         for columnname in tochange:
             if (isinstance(params[columnname], dict)
@@ -330,19 +690,32 @@ class SQLAView(ModelView):
 
                 toadd = params[columnname].get('add', [])
                 toremove = params[columnname].get('remove', [])
-                self._add_to_relation(query, columnname, toadd=toadd)
+                self._add_to_relation(query, columnname, toadd=toadd,
+                                      session=session, loaded=loaded)
                 self._remove_from_relation(query, columnname,
-                                           toremove=toremove)
+                                           toremove=toremove, session=session)
             else:
                 toset = params[columnname]
-                self._set_on_relation(query, columnname, toset=toset)
+                self._set_on_relation(query, columnname, toset=toset,
+                                      session=session, loaded=loaded)
         return tochange
 
     def _handle_validation_exception(self, exception):
         self.session.rollback()
         errors = extract_error_messages(exception) or \
             'Could not determine specific validation errors'
-        return json(dict(validation_errors=errors), status=520)
+        return self._json(dict(validation_errors=errors), status=520)
+
+    async def _validation_error(self, exception):
+        return await self._run_db(self._handle_validation_exception, exception)
+
+    def _json(self, body, status=200, headers=None):
+        return self.json_codec.response(body, status=status, headers=headers)
+
+    def _request_json(self, request):
+        if request.parsed_json is None:
+            request.load_json(loads=self.json_codec.loads)
+        return request.parsed_json
 
     def _compute_results_per_page(self, request):
         """Helper function which returns the number of results per page based
@@ -359,30 +732,292 @@ class SQLAView(ModelView):
             results_per_page = self.results_per_page
         return min(results_per_page, self.max_results_per_page)
 
-    def _paginated(self, request, instances, deep):
-        if isinstance(instances, list):
-            num_results = len(instances)
+    def _compute_count_mode(self, request):
+        """Helper function which returns the count mode requested by the
+        ``count`` request argument, or :attr:`count_mode` if it is missing or
+        unknown.
+
+        """
+        count_mode = request.args.get('count')
+        return count_mode if count_mode in COUNT_MODES else self.count_mode
+
+    def _compute_format(self, request):
+        """Helper function which returns the response format requested by
+        the ``format`` request argument, ``objects`` if it is missing or
+        unknown.
+
+        """
+        response_format = request.args.get('format')
+        return response_format if response_format in RESPONSE_FORMATS else 'objects'
+
+    def _serialize_page(self, request, items, deep):
+        """Returns the serialized `items` of a GET_MANY page keyed as in
+        the response: ``objects``, or ``columns`` and ``rows`` in the
+        ``columnar`` format.
+
+        """
+        if self._compute_format(request) != 'columnar':
+            return dict(objects=self._to_dicts(items, deep))
+        serializer = self._serializer(deep)
+        if self._reading_rows:
+            rows = [serializer.row_values(row) for row in items]
         else:
-            num_results = count(self.session, instances)
+            names = serializer.names
+            rows = [[obj[name] for name in names] for obj in map(serializer, items)]
+        return dict(columns=serializer.names, rows=rows)
+
+    def _paginated(self, request, instances, deep):
+        count_mode = self._compute_count_mode(request)
         results_per_page = self._compute_results_per_page(request)
+        if count_mode == 'none':
+            page_num, instances, has_more = self._page_without_count(
+                request, instances, results_per_page)
+            items = self._serialize_page(request, instances, deep)
+            return dict(page=page_num, **items, has_more=has_more)
         if results_per_page > 0:
             page_num = int(request.args.get('page', 1))
             start = (page_num - 1) * results_per_page
-            end = min(num_results, start + results_per_page)
-            total_pages = int(math.ceil(num_results / results_per_page))
+            end = start + results_per_page
         else:
             page_num = 1
             start = 0
-            end = num_results
+            end = None
+        if isinstance(instances, list):
+            num_results = len(instances)
+            rows = instances[start:end]
+        elif count_mode == 'exact' and self._window_countable(instances.statement):
+            rows, num_results = windowed_page(instances, start, end,
+                                              scalar=not self._reading_rows)
+            if num_results is None:
+                num_results = count(self.session, instances) if start > 0 else 0
+        else:
+            if count_mode == 'estimated':
+                num_results = estimate_count(self.session, instances)
+            else:
+                num_results = count(self.session, instances)
+                end = num_results if end is None else min(num_results, end)
+            rows = instances[start:end]
+        if results_per_page > 0:
+            total_pages = int(math.ceil(num_results / results_per_page))
+        else:
             total_pages = 1
-        objects = [to_dict(x, deep, exclude=self.exclude_columns,
-                exclude_relations=self.exclude_relations, include=self.include_columns,
-                include_relations=self.include_relations, include_methods=self.include_methods)
-                for x in instances[start:end]]
-        return dict(page=page_num, objects=objects, total_pages=total_pages, num_results=num_results)
+        items = self._serialize_page(request, rows, deep)
+        return dict(page=page_num, **items, total_pages=total_pages, num_results=num_results)
 
+    def _window_countable(self, statement):
+        return self.window_count and supports_window_count(self.session, statement)
 
-    def _inst_to_dict(self, inst):
+    def _page_without_count(self, request, instances, results_per_page):
+        """Returns the page number, the rows of that page and whether more
+        pages follow, found by fetching one row past the page rather than by
+        counting `instances`.
+
+        """
+        if results_per_page <= 0:
+            return 1, instances[:], False
+        page_num = int(request.args.get('page', 1))
+        start = (page_num - 1) * results_per_page
+        rows = instances[start:start + results_per_page + 1]
+        return page_num, rows[:results_per_page], len(rows) > results_per_page
+
+    def _keyset_paginated(self, request, query, deep, keys, values=None):
+        """Returns the page of `query` following the row whose keyset values
+        are `values` (the first page if ``None``), with the ``next_cursor``
+        of its last row, or ``None`` on the last page.
+
+        """
+        results_per_page = self._compute_results_per_page(request)
+        query = sqla_apply_keyset(query, self.model, keys, values)
+        if results_per_page > 0:
+            query = query.limit(results_per_page + 1)
+        instances = query.all()
+        next_cursor = None
+        if results_per_page > 0 and len(instances) > results_per_page:
+            instances = instances[:results_per_page]
+            next_cursor = encode_cursor([getattr(instances[-1], field) for field, _ in keys],
+                                        self.json_codec)
+        items = self._serialize_page(request, instances, deep)
+        return dict(**items, next_cursor=next_cursor)
+
+    def _stream_requested(self, request):
+        """Whether the client asked for a streamed NDJSON response, with the
+        ``stream`` request argument or else with its ``Accept`` header.
+
+        """
+        stream = request.args.get('stream')
+        if stream is not None:
+            return stream.lower() in ('true', '1')
+        return NDJSON_MIMETYPE in request.headers.get('accept', '')
+
+    def _upsert_requested(self, request):
+        """Whether a PUT to the collection asks for an upsert, with the
+        ``upsert`` request argument.
+
+        """
+        upsert = request.args.get('upsert')
+        return upsert is not None and upsert.lower() in ('true', '1')
+
+    def _streamable(self, request):
+        """Whether the GET_MANY response to `request` is streamed. Cursor
+        pagination needs the last row for its ``next_cursor`` and GET_MANY
+        postprocessors need the whole result, so those get a JSON response.
+
+        """
+        return (self.pagination == 'page' and not self.postprocess['GET_MANY']
+                and self._stream_requested(request))
+
+    def _stream_yield_per(self):
+        """Returns how many rows to fetch from the cursor at a time, or
+        ``None`` if a relation collection is joined or a relation is loaded by
+        subquery, which SQLAlchemy cannot load in batches.
+
+        """
+        for prop in sqlalchemy_inspect(self.model).relationships:
+            loader = self._relation_loader(prop)
+            if loader == 'subquery' or (prop.uselist and loader == 'joined'):
+                return None
+        return self.stream_batch_size
+
+    def _stream_slice(self, request, query):
+        """Returns `query` limited to the page selected by the ``page`` and
+        ``results_per_page`` request arguments.
+
+        """
+        results_per_page = self._compute_results_per_page(request)
+        if results_per_page <= 0:
+            return query
+        page_num = int(request.args.get('page', 1))
+        return query.offset((page_num - 1) * results_per_page).limit(results_per_page)
+
+    def _defer_session_close(self, request):
+        """Keeps the request session of :attr:`db` open while the response is
+        streamed, since the response middleware which closes it runs first.
+        Returns whether it did, in which case the caller ends the session.
+
+        """
+        if not hasattr(self.db, 'defer_session_close'):
+            return False
+        self.db.defer_session_close(request)
+        return True
+
+    def _ndjson_lines(self, instances, serialize):
+        encode = self.json_codec.encode
+        return b''.join(encode(serialize(instance)) + b'\n' for instance in instances)
+
+    async def _stream(self, request, query, deep):
+        """Writes the page of `query` to the client as NDJSON, see
+        :meth:`_stream_response`.
+
+        """
+        serialize = self._item_serializer(deep)
+        return await self._stream_response(
+            request, self._stream_slice(request, query), NDJSON_MIMETYPE,
+            lambda items: self._ndjson_lines(items, serialize),
+            yield_per=self._stream_yield_per(), scalars=not self._reading_rows)
+
+    def _next_chunk(self, batches, encode):
+        items = next(batches, None)
+        return None if items is None else encode(items)
+
+    async def _stream_response(self, request, query, content_type, encode,
+                               yield_per=None, scalars=False, begin=None, end=None):
+        """Runs `query` and writes its result to the client in batches of
+        :attr:`stream_batch_size` items, which `encode` turns into bytes, so
+        only one batch is held in memory. The bytes returned by `begin` and
+        `end`, if given, are written before the first and after the last batch.
+
+        The items are the rows of the result, or its instances if `scalars`.
+        With `yield_per`, they are fetched that many at a time, from a
+        server-side cursor where the driver has one.
+
+        """
+        statement = query.statement if isinstance(query, Query) else query
+        options = {} if yield_per is None else dict(yield_per=yield_per)
+        deferred = self._defer_session_close(request)
+        mark_streamed(request)
+        try:
+            result = await self._run_db(self.session.execute, statement,
+                                        execution_options=options)
+            if scalars:
+                result = result.scalars() if yield_per else result.unique().scalars()
+            batches = result.partitions(self.stream_batch_size)
+            response = await request.respond(content_type=content_type)
+            send = streamed_send(request, response)
+            if begin is not None:
+                await send(begin())
+            while True:
+                chunk = await self._run_db(self._next_chunk, batches, encode)
+                if chunk is None:
+                    break
+                await send(chunk)
+            await send(b'' if end is None else end(), end_stream=True)
+        finally:
+            if deferred:
+                await self.db.end_session(request)
+
+    def _request_keyset(self, request, search_params):
+        """Returns the keyset of a cursor paginated search and the values
+        decoded from the ``cursor`` request argument, if any.
+
+        """
+        keys = sqla_keyset(self.model, search_params, self.primary_key)
+        cursor = request.args.get('cursor')
+        values = decode_cursor(self.model, keys, cursor, self.json_codec) if cursor else None
+        return keys, values
+
+    def _serializer(self, deep):
+        """Returns the shared :class:`ModelSerializer` of the view's model,
+        its include/exclude settings and `deep`.
+
+        When the JSON codec encodes dates, times and UUIDs itself, they are
+        left unconverted, also in the results handed to postprocessors.
+
+        """
+        return get_serializer(self.model, deep, exclude=self.exclude_columns,
+                              exclude_relations=self.exclude_relations,
+                              include=self.include_columns,
+                              include_relations=self.include_relations,
+                              include_methods=self.include_methods,
+                              native_types=self.json_codec.native_types)
+
+    def _to_dict(self, instance, deep):
+        return self._serializer(deep)(instance)
+
+    def _to_dicts(self, instances, deep):
+        serialize = self._item_serializer(deep)
+        return [serialize(x) for x in instances]
+
+    def _item_serializer(self, deep):
+        """Returns the function which serializes each item of a GET_MANY
+        result: an instance, or a row of :meth:`_row_columns` in row mode.
+
+        """
+        serializer = self._serializer(deep)
+        return serializer.serialize_row if self._reading_rows else serializer
+
+    def _row_columns(self, deep, keep=()):
+        """Returns the column attributes a GET_MANY query selects in row
+        mode, the serialized ones first and then the `keep` columns, or
+        ``None`` if the output needs ORM instances.
+
+        Starts row mode for the rest of the request when it returns columns.
+
+        """
+        if not self.row_mode or deep or self.include_methods:
+            return None
+        names = self._serializer(deep).row_columns
+        if not names:
+            return None
+        self._reading_rows = True
+        names = names + [name for name in keep if name not in names]
+        return [getattr(self.model, name) for name in names]
+
+
+    def _relations_deep(self):
+        """Returns the `deep` map of the relations serialized with each
+        instance, after the include and exclude settings of the view.
+
+        """
         relations = frozenset(get_relations(self.model))
         if self.include_columns is not None:
             cols = frozenset(self.include_columns)
@@ -390,14 +1025,120 @@ class SQLAView(ModelView):
             relations &= (cols | rels)
         elif self.exclude_columns is not None:
             relations -= frozenset(self.exclude_columns)
-        deep = dict((r, {}) for r in relations)
-        return to_dict(inst, deep, exclude=self.exclude_columns,
-                       exclude_relations=self.exclude_relations,
-                       include=self.include_columns,
-                       include_relations=self.include_relations,
-                       include_methods=self.include_methods)
+        return dict((r, {}) for r in relations)
+
+    def _exposed_columns(self, model, include=None, exclude=None):
+        return [c for c in sqlalchemy_inspect(model).column_attrs.keys()
+                if (include is None or c in include) and not (exclude and c in exclude)]
+
+    def _exposed_relation_columns(self, relation):
+        include = exclude = None
+        if self.exclude_relations is not None and relation in self.exclude_relations:
+            exclude = self.exclude_relations[relation]
+        elif self.include_relations is not None and relation in self.include_relations:
+            include = self.include_relations[relation]
+        return self._exposed_columns(get_related_model(self.model, relation), include, exclude)
+
+    def _select_fields(self, fields):
+        """Narrows what this view serializes to the comma separated `fields`:
+        columns, relations, ``relation.field`` pairs or included methods, all
+        of which the view must already expose.
+
+        A view is instantiated per request, so the selection only applies to
+        the current one. Raises :exc:`ValueError` on a field the view does not
+        expose.
+
+        """
+        deep = self._relations_deep()
+        methods = self.include_methods or ()
+        columns, relations, selected_methods = [], {}, []
+        for name in fields.split(','):
+            name = name.strip()
+            relation, _, field = name.partition('.')
+            if not name:
+                continue
+            if name in methods:
+                selected_methods.append(name)
+            elif relation in deep:
+                exposed = self._exposed_relation_columns(relation)
+                if field and field not in exposed:
+                    raise ValueError("Invalid field '{0}'".format(name))
+                relations.setdefault(relation, set()).update([field] if field else exposed)
+            elif name in self._exposed_columns(self.model, self.include_columns,
+                                               self.exclude_columns):
+                columns.append(name)
+            else:
+                raise ValueError("Invalid field '{0}'".format(name))
+        self.include_columns = columns
+        self.include_relations = dict((r, list(f)) for r, f in relations.items())
+        self.exclude_columns = self.exclude_relations = None
+        self.include_methods = selected_methods or None
+
+    def _apply_request_fields(self, request):
+        """Applies the ``fields`` request argument, if any, with
+        :meth:`_select_fields`, and returns an error response if it names a
+        field the view does not expose.
+
+        """
+        fields = request.args.get('fields')
+        if fields is None:
+            return None
+        try:
+            self._select_fields(fields)
+        except ValueError as exception:
+            return self._json(dict(message=str(exception)), status=520)
+        return None
+
+    def _relation_loader(self, prop):
+        """Returns the loader used to fetch the relationship property `prop`,
+        a key of :data:`RELATION_LOADERS` or ``None`` for the default.
+
+        Override this to choose loaders by more than the relation name.
+
+        """
+        return (self.relation_loaders or {}).get(prop.key)
+
+    def _loader_options(self, deep, keep=()):
+        """Returns the options which load the relations in `deep` and only the
+        columns the view serializes, besides the `keep` columns.
+
+        Nothing is left out when :attr:`include_methods` is set, since the
+        methods may read any column.
+
+        """
+        options = sqla_loader_options(self.model, deep, self._relation_loader,
+                                      self._related_column_options)
+        if self.include_methods:
+            return options
+        return options + sqla_column_options(self.model, self.include_columns,
+                                             self.exclude_columns, keep)
+
+    def _related_column_options(self, prop):
+        if self.include_methods or prop.parent.class_ is not self.model:
+            return []
+        if self.exclude_relations is not None and prop.key in self.exclude_relations:
+            return sqla_column_options(prop.mapper.class_,
+                                       exclude=self.exclude_relations[prop.key])
+        if self.include_relations is not None and prop.key in self.include_relations:
+            return sqla_column_options(prop.mapper.class_,
+                                       include=self.include_relations[prop.key])
+        return []
+
+    def _single_options(self):
+        """Returns the loader options of a single instance GET, which only
+        narrows the columns for the default serializer.
 
-    def _dict_to_inst(self, data):
+        """
+        deep = self._relations_deep()
+        if self.serialize != self._inst_to_dict:
+            return sqla_loader_options(self.model, deep, self._relation_loader)
+        return self._loader_options(deep)
+
+    def _inst_to_dict(self, inst):
+        return self._to_dict(inst, self._relations_deep())
+
+    def _dict_to_inst(self, data, session=None):
+        session = self.session if session is None else session
         for field in data:
             if not has_field(self.model, field):
                 msg = "Model does not have field '{0}'".format(field)
@@ -415,12 +1156,14 @@ class SQLAView(ModelView):
         modelargs = dict([(i, data[i]) for i in props])
         instance = self.model(**modelargs)
 
-        for col in set(relations).intersection(paramkeys):
+        tochange = set(relations).intersection(paramkeys)
+        loaded = self._load_related(data, tochange, session)
+        for col in tochange:
             submodel = get_related_model(self.model, col)
 
             if type(data[col]) == list:
                 for subparams in data[col]:
-                    subinst = get_or_create(self.session, submodel, subparams)
+                    subinst = get_or_create(session, submodel, subparams, loaded)
                     try:
                         getattr(instance, col).append(subinst)
                     except AttributeError:
@@ -428,7 +1171,7 @@ class SQLAView(ModelView):
                         attribute[subinst.key] = subinst.value
             else:
                 if data[col] is not None:
-                    subinst = get_or_create(self.session, submodel, data[col])
+                    subinst = get_or_create(session, submodel, data[col], loaded)
                     setattr(instance, col, subinst)
 
         return instance
@@ -436,15 +1179,403 @@ class SQLAView(ModelView):
     def _instid_to_dict(self, instid):
         inst = get_by(self.session, self.model, instid, self.primary_key)
         if inst is None:
-            return json(dict(message='No result found'), status=520)
+            return self._json(dict(message='No result found'), status=520)
         return self._inst_to_dict(inst)
 
+    async def _instance_result(self, instid):
+        return await self._run_db(self._instid_to_dict, instid)
+
+
+    def _get_single(self, request, instid, relationname=None, relationinstid=None):
+        if relationname is None:
+            query = query_by_primary_key(self.session, self.model, instid, self.primary_key)
+            instance = query.options(*self._single_options()).first()
+            return None if instance is None else self.serialize(instance)
+        instance = get_by(self.session, self.model, instid, self.primary_key)
+        if instance is None:
+            return None
+        related_value = getattr(instance, relationname)
+        related_model = get_related_model(self.model, relationname)
+        relations = frozenset(get_relations(related_model))
+        deep = dict((r, {}) for r in relations)
+        if relationinstid is not None:
+            related_value_instance = get_by(self.session, related_model, relationinstid)
+            if related_value_instance is None:
+                return None
+            return to_dict(related_value_instance, deep)
+        if is_like_list(instance, relationname):
+            return self._paginated(request, list(related_value), deep)
+        return to_dict(related_value, deep)
+
+    def _create(self, data):
+        instance = self.deserialize(data)
+        self.session.add(instance)
+        self.session.commit()
+        return instance, self.serialize(instance)
+
+    async def _create_record(self, data):
+        return await self._run_db(self._create, data)
+
+    def _insert_many(self, records, session=None):
+        """Inserts the records of a bulk POST and returns the list of their
+        serialized results, with ``None`` in place of the records which
+        failed, and the list of errors, each with the ``index`` of its record.
+
+        Records made only of columns are inserted together by
+        :func:`bulk_insert`, or when the model has validators or insert events
+        (see :func:`has_orm_hooks`), deserialized and flushed together. The
+        others, and all of them if that batch fails, are deserialized and
+        inserted one by one. Each insert runs in a savepoint, so a failing
+        record leaves the others in place.
+
+        """
+        session = self.session if session is None else session
+        objects = [None] * len(records)
+        errors = []
+
+        def validation_error(index, exception):
+            messages = extract_error_messages(exception) or \
+                'Could not determine specific validation errors'
+            errors.append(dict(index=index, validation_errors=messages))
+
+        batch, single = [], []
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                errors.append(dict(index=index, message='Record must be a JSON object'))
+            elif (self.deserialize == self._dict_to_inst
+                  and is_column_record(self.model, record)):
+                batch.append(index)
+            else:
+                single.append(index)
+        if batch and not has_orm_hooks(self.model, INSERT_EVENTS):
+            rows = strings_to_dates_many(self.model, [records[i] for i in batch])
+            try:
+                with session.begin_nested():
+                    instances = bulk_insert(session, self.model, rows)
+            except (DataError, IntegrityError):
+                single = sorted(single + batch)
+            else:
+                for index, instance in zip(batch, instances):
+                    objects[index] = self.serialize(instance)
+        elif batch:
+            instances = {}
+            for index in batch:
+                try:
+                    instances[index] = self._dict_to_inst(records[index], session)
+                except self.validation_exceptions as exception:
+                    validation_error(index, exception)
+            try:
+                with session.begin_nested():
+                    session.add_all(instances.values())
+                    session.flush()
+            except (DataError, IntegrityError) + self.validation_exceptions:
+                single = sorted(single + list(instances))
+            else:
+                for index, instance in instances.items():
+                    objects[index] = self.serialize(instance)
+        for index in single:
+            try:
+                with session.begin_nested():
+                    if self.deserialize == self._dict_to_inst:
+                        instance = self._dict_to_inst(records[index], session)
+                    else:
+                        instance = self.deserialize(records[index])
+                    session.add(instance)
+                    session.flush()
+            except self.validation_exceptions as exception:
+                validation_error(index, exception)
+            except (DataError, IntegrityError) as exception:
+                errors.append(dict(index=index, message=type(exception).__name__))
+            else:
+                objects[index] = self.serialize(instance)
+        errors.sort(key=lambda error: error['index'])
+        return objects, errors
+
+    def _create_many(self, records):
+        objects, errors = self._insert_many(records)
+        self.session.commit()
+        return objects, errors
+
+    async def _create_records(self, records):
+        return await self._run_db(self._create_many, records)
+
+    async def _post_many(self, request, records):
+        """Handles a POST of a JSON array: its records are created in one
+        transaction, and the response lists the result of each and the
+        errors. It is a 201 if every record was created, a 520 otherwise.
+
+        The POST hooks get the whole array as `data` and the response as
+        `result`, or each record and each created result if
+        :attr:`bulk_hooks_per_record`.
+
+        """
+        per_record = self.bulk_hooks_per_record
+        try:
+            for data in (records if per_record else [records]):
+                for preprocess in self.preprocess['POST']:
+                    resp = await run_process(process=preprocess, request=request,
+                            data=data, Model=self.model, collection_name=self.collection_name)
+                    if (resp is not None) and isinstance(resp, HTTPResponse):
+                        return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        objects, errors = await self._create_records(records)
+        num_created = sum(1 for obj in objects if obj is not None)
+        result = dict(num_created=num_created, objects=objects, errors=errors)
+
+        try:
+            headers = {}
+            created = [obj for obj in objects if obj is not None]
+            for postprocessed in (created if per_record else [result]):
+                for postprocess in self.postprocess['POST']:
+                    resp = await run_process(process=postprocess, request=request,
+                            result=postprocessed, Model=self.model, headers=headers,
+                            collection_name=self.collection_name)
+                    if (resp is not None) and isinstance(resp, HTTPResponse):
+                        return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+        return self._json(result, headers=headers, status=520 if errors else 201)
+
+    def _updates_by_statement(self, data):
+        """Whether setting `data` on rows can run as an ``UPDATE`` statement:
+        it only sets columns, and the model has no validators or update
+        events, which the statement would skip (see :func:`has_orm_hooks`).
+
+        """
+        return (bool(data) and is_column_record(self.model, data)
+                and not has_orm_hooks(self.model, UPDATE_EVENTS))
+
+    def _set_based_update(self, search_params, data):
+        """Returns the single ``UPDATE`` statement of a PUT_MANY, or ``None``
+        if it has to load and update each row: when :attr:`set_based_put_many`
+        is off, `data` cannot be set by a statement (see
+        :meth:`_updates_by_statement`), or the search limits, offsets or
+        groups the rows.
+
+        """
+        if not (self.set_based_put_many and self._updates_by_statement(data)):
+            return None
+        if any(search_params.get(key) for key in ('limit', 'offset', 'group_by')):
+            return None
+        values = strings_to_dates(self.model, data)
+        return sqla_create_update(self.model, search_params, values)
+
+    def _update_single(self, instid, data, session=None):
+        """Sets the columns in `data` on the instance `instid` and returns its
+        serialization, as :meth:`_instid_to_dict` does, or ``None`` if there
+        is no such instance. `data` must pass :meth:`_updates_by_statement`.
+
+        This is a single ``UPDATE ... RETURNING`` where the dialect supports
+        it, which returns only the serialized columns when the output holds
+        no relations or methods. Elsewhere the instance is read back after
+        the ``UPDATE``.
+
+        """
+        session = self.session if session is None else session
+        stmt = update(self.model).where(self._pk_criterion(instid)) \
+            .values(strings_to_dates(self.model, data)) \
+            .execution_options(synchronize_session=False)
+        deep = self._relations_deep()
+        serializer = self._serializer(deep)
+        if session.get_bind(mapper=sqlalchemy_inspect(self.model)).dialect.update_returning:
+            names = None if deep or self.include_methods else serializer.row_columns
+            if names:
+                columns = [getattr(self.model, name) for name in names]
+                row = session.execute(stmt.returning(*columns)).first()
+                return None if row is None else serializer.serialize_row(row)
+            stmt = stmt.returning(self.model).execution_options(populate_existing=True)
+            instance = session.scalars(stmt).first()
+        elif session.execute(stmt).rowcount:
+            query = query_by_primary_key(session, self.model, instid, self.primary_key)
+            instance = query.options(*self._loader_options(deep)).first()
+        else:
+            instance = None
+        return None if instance is None else serializer(instance)
+
+    def _put_single(self, instid, data):
+        result = self._update_single(instid, data)
+        self.session.commit()
+        return result
+
+    async def _update_record(self, instid, data):
+        return await self._run_db(self._put_single, instid, data)
+
+    def _execute_update(self, stmt):
+        num_modified = self.session.execute(stmt).rowcount
+        self.session.commit()
+        return num_modified
+
+    async def _update_rows(self, stmt):
+        return await self._run_db(self._execute_update, stmt)
+
+    def _upsert_error(self, records):
+        """Returns the message of the first record which cannot be upserted,
+        with its index, or ``None``.
+
+        """
+        pk_names = primary_key_names(self.model)
+        seen = set()
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                return index, 'Record must be a JSON object'
+            for field in record:
+                if not has_field(self.model, field):
+                    return index, "Model does not have field '{0}'".format(field)
+            if not is_column_record(self.model, record):
+                return index, 'Upserted records can only set columns'
+            missing = [name for name in pk_names if record.get(name) is None]
+            if missing:
+                return index, "Upserted records must have the primary key '{0}'".format(
+                    "', '".join(missing))
+            key = tuple(convert_key_value(self.model, name, record[name])
+                        for name in pk_names)
+            if any(isinstance(value, (dict, list)) for value in key):
+                return index, 'Upserted records must have a scalar primary key'
+            if key in seen:
+                return index, 'Upserted records must have distinct primary keys'
+            seen.add(key)
+        return None
+
+    def _upsert_many(self, records, session=None):
+        session = self.session if session is None else session
+        rows = strings_to_dates_many(self.model, records)
+        return [self.serialize(instance) for instance in upsert(session, self.model, rows)]
+
+    def _upsert_commit(self, records):
+        objects = self._upsert_many(records)
+        self.session.commit()
+        return objects
+
+    async def _upsert_records(self, records):
+        return await self._run_db(self._upsert_commit, records)
+
+    async def _upsert(self, request, data):
+        """Handles ``PUT /api/<collection>?upsert=true`` of a record or a JSON
+        array of records, each of them inserted or else updating the row with
+        its primary key, see :func:`upsert`.
+
+        It deliberately runs only the POST hooks, as a POST of the same body
+        would, for the rows it updates too: whether a row existed is only
+        known once the upsert statement has run, after the preprocessors,
+        and the ``PUT_SINGLE``/``PUT_MANY`` hooks take an instance id or
+        search parameters, which an upsert does not have. The response is
+        the result of the record, or the results of the array in its order,
+        with their count.
+
+        """
+        many = isinstance(data, list)
+        records = data if many else [data]
+        per_record = self.bulk_hooks_per_record or not many
+        try:
+            for data in (records if per_record else [records]):
+                for preprocess in self.preprocess['POST']:
+                    resp = await run_process(process=preprocess, request=request,
+                            data=data, Model=self.model, collection_name=self.collection_name)
+                    if (resp is not None) and isinstance(resp, HTTPResponse):
+                        return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        error = self._upsert_error(records)
+        if error is not None:
+            index, msg = error
+            return self._json(dict(message=msg, index=index) if many else dict(message=msg),
+                              status=520)
+
+        try:
+            objects = await self._upsert_records(records)
+        except self.validation_exceptions as exception:
+            return await self._validation_error(exception)
+        result = dict(num_upserted=len(objects), objects=objects) if many else objects[0]
+
+        try:
+            headers = {}
+            for postprocessed in (objects if per_record else [result]):
+                for postprocess in self.postprocess['POST']:
+                    resp = await run_process(process=postprocess, request=request,
+                            result=postprocessed, Model=self.model, headers=headers,
+                            collection_name=self.collection_name)
+                    if (resp is not None) and isinstance(resp, HTTPResponse):
+                        return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+        return self._json(result, headers=headers, status=200)
+
+    def _search_query(self, search_params, **kw):
+        """Returns the query of the rows matched by `search_params`, which
+        the write handlers update or delete.
+
+        """
+        return sqla_create_query(self.session, self.model, search_params, **kw)
+
+    def _instance_query(self, instid):
+        return query_by_primary_key(self.session, self.model, instid, self.primary_key)
+
+    def _update_query(self, query, data):
+        relations = self._update_relations(query, data)
+        field_list = frozenset(data) ^ relations
+
+        data = dict((field, data[field]) for field in field_list)
+        data = strings_to_dates(self.model, data)
+        num_modified = 0
+        if data:
+            for item in query.all():
+                for field, value in data.items():
+                    setattr(item, field, value)
+                num_modified += 1
+        self.session.commit()
+        return num_modified
+
+    async def _update_instances(self, query, data, single=False):
+        """Sets `data`, relations included, on the rows of `query` and
+        returns how many were modified, or ``None`` if `single` and there is
+        no such row.
+
+        """
+        if single:
+            num_results = await self._run_db(query.count)
+            if num_results == 0:
+                return None
+            assert num_results == 1, 'Multiple rows with same ID'
+        return await self._run_db(self._update_query, query, data)
+
+    def _delete_query(self, query):
+        if isinstance(query, Query):
+            num_deleted = query.delete(synchronize_session=False)
+        else:
+            self.session.delete(query)
+            num_deleted = 1
+        self.session.commit()
+        return num_deleted
+
+    async def _delete_rows(self, query):
+        return await self._run_db(self._delete_query, query)
+
+    def _delete_single(self, instid, relationname=None, relationinstid=None):
+        was_deleted = False
+        inst = get_by(self.session, self.model, instid, self.primary_key)
+        if relationname:
+            relation = getattr(inst, relationname)
+            related_model = get_related_model(self.model, relationname)
+            relation_instance = get_by(self.session, related_model, relationinstid)
+            relation.remove(relation_instance)
+            was_deleted = len(self.session.dirty) > 0
+        elif inst is not None:
+            self.session.delete(inst)
+            was_deleted = len(self.session.deleted) > 0
+        self.session.commit()
+        return was_deleted
+
+    async def _delete_record(self, instid, relationname=None, relationinstid=None):
+        return await self._run_db(self._delete_single, instid, relationname, relationinstid)
 
     async def _search(self, request):
         try:
-            search_params = json_loads(request.args.get('q', '{}'))
+            search_params = self.json_codec.loads(request.args.get('q', '{}'))
         except (TypeError, ValueError, OverflowError) as exception:
-            return json(dict(message='Unable to decode data'), status=520)
+            return self._json(dict(message='Unable to decode data'), status=520)
 
         try:
             for preprocess in self.preprocess['GET_MANY']:     
@@ -456,33 +1587,47 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
+        resp = self._apply_request_fields(request)
+        if resp is not None:
+            return resp
+
+        keyset = self.pagination == 'cursor'
+        if keyset:
+            try:
+                keys, values = self._request_keyset(request, search_params)
+            except ValueError as exception:
+                return self._json(dict(message=str(exception)), status=520)
+
+        self._use_replica()
         try:
-            result = sqla_create_query(self.session, self.model, search_params)
+            result = sqla_create_query(self.session, self.model, search_params,
+                                       _ignore_order_by=keyset)
         except NoResultFound:
-            return json(dict(message='No result found'), status=520)
+            return self._json(dict(message='No result found'), status=520)
         except MultipleResultsFound:
-            return json(dict(message='Multiple results found'), status=520)
+            return self._json(dict(message='Multiple results found'), status=520)
         except Exception as exception:
-            return json(dict(message='Unable to construct query'), status=520)
-
-        relations = frozenset(get_relations(self.model))
-        if self.include_columns is not None:
-            cols = frozenset(self.include_columns)
-            rels = frozenset(self.include_relations)
-            relations &= (cols | rels)
-        elif self.exclude_columns is not None:
-            relations -= frozenset(self.exclude_columns)
-        deep = dict((r, {}) for r in relations)
+            return self._json(dict(message='Unable to construct query'), status=520)
 
+        deep = self._relations_deep()
         if isinstance(result, Query):
-            result = self._paginated(request, result, deep)
+            keep = [field for field, _ in keys] if keyset else ()
+            columns = self._row_columns(deep, keep)
+            if columns is not None:
+                result = result.with_entities(*columns)
+            else:
+                result = result.options(*self._loader_options(deep, keep))
+
+        if isinstance(result, Query) and self._streamable(request):
+            return await self._stream(request, result, deep)
+        if isinstance(result, Query) and keyset:
+            result = await self._run_db(self._keyset_paginated, request, result,
+                                        deep, keys, values)
+        elif isinstance(result, Query):
+            result = await self._run_db(self._paginated, request, result, deep)
         else:
             # primary_key = self.primary_key or primary_key_name(result)
-            result = to_dict(result, deep, exclude=self.exclude_columns,
-                             exclude_relations=self.exclude_relations,
-                             include=self.include_columns,
-                             include_relations=self.include_relations,
-                             include_methods=self.include_methods)
+            result = await self._run_db(self._to_dict, result, deep)
         try:
             headers = {}
             for postprocess in self.postprocess['GET_MANY']:
@@ -493,7 +1638,7 @@ class SQLAView(ModelView):
                     return resp
         except ProcessingException as exception:
             return response_exception(exception)
-        return json(result, headers=headers, status=200)
+        return self._json(result, headers=headers, status=200)
 
     async def get(self, request, instid=None, relationname=None, relationinstid=None):
         if instid is None:
@@ -512,30 +1657,16 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
-        instance = get_by(self.session, self.model, instid, self.primary_key)
-
-        if instance is None:
-            return json(dict(message='No result found'),status=520)
-        
         if relationname is None:
-            result = self.serialize(instance)
-        else:
-            related_value = getattr(instance, relationname)
-            related_model = get_related_model(self.model, relationname)
-            relations = frozenset(get_relations(related_model))
-            deep = dict((r, {}) for r in relations)
-            if relationinstid is not None:
-                related_value_instance = get_by(self.session, related_model, relationinstid)
-                if related_value_instance is None:
-                    return json(dict(message='No result found'),status=520)
-                result = to_dict(related_value_instance, deep)
-            else:
-                if is_like_list(instance, relationname):
-                    result = self._paginated(list(related_value), deep)
-                else:
-                    result = to_dict(related_value, deep)
+            resp = self._apply_request_fields(request)
+            if resp is not None:
+                return resp
+
+        self._use_replica()
+        result = await self._run_db(self._get_single, request, instid,
+                                    relationname, relationinstid)
         if result is None:
-            return json(dict(message='No result found'),status=520)
+            return self._json(dict(message='No result found'),status=520)
 
         try:
             headers = {}
@@ -548,13 +1679,69 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
-        return json(result, headers=headers, status=200)
+        return self._json(result, headers=headers, status=200)
+
+    def _export_columns(self):
+        """Returns the names of the columns an export writes: the column
+        attributes the view serializes, after include/exclude and ``fields``.
+
+        """
+        column_attrs = sqlalchemy_inspect(self.model).column_attrs
+        return [name for name in self._serializer({}).names if name in column_attrs]
+
+    async def export(self, request):
+        """Answers the export route of the API with every row matching the
+        ``q`` search, as CSV or, with ``format=arrow`` and pyarrow installed,
+        as an Arrow IPC stream.
+
+        The rows are streamed from a server-side cursor, without pagination
+        or count. Only the columns of :meth:`_export_columns` are written.
+        GET_MANY preprocessors run as for a search, postprocessors do not.
+
+        """
+        try:
+            search_params = self.json_codec.loads(request.args.get('q', '{}'))
+        except (TypeError, ValueError, OverflowError) as exception:
+            return self._json(dict(message='Unable to decode data'), status=520)
+
+        try:
+            for preprocess in self.preprocess['GET_MANY']:
+                resp = await run_process(process=preprocess, request=request,
+                        search_params=search_params, Model=self.model,
+                        collection_name=self.collection_name)
+                if (resp is not None) and isinstance(resp, HTTPResponse):
+                    return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        resp = self._apply_request_fields(request)
+        if resp is not None:
+            return resp
+
+        export_format = request.args.get('format', 'csv')
+        names = self._export_columns()
+        if not names:
+            return self._json(dict(message='No columns to export'), status=520)
+        try:
+            writer = export_writer(export_format, self.model, names)
+        except ValueError as exception:
+            return self._json(dict(message=str(exception)), status=520)
+
+        self._use_replica()
+        columns = [getattr(self.model, name) for name in names]
+        try:
+            stmt = sqla_apply_search_params(select(*columns), self.model, search_params)
+        except Exception as exception:
+            return self._json(dict(message='Unable to construct query'), status=520)
+        return await self._stream_response(request, stmt, EXPORT_FORMATS[export_format],
+                                           writer.write, yield_per=self.stream_batch_size,
+                                           begin=writer.begin, end=writer.end)
 
     async def _delete_many(self, request):
         try:
-            search_params = json_loads(request.args.get('q', '{}'))
+            search_params = self.json_codec.loads(request.args.get('q', '{}'))
         except (TypeError, ValueError, OverflowError) as exception:
-            return json(dict(message='Unable to decode search query'), status=520)
+            return self._json(dict(message='Unable to decode search query'), status=520)
 
         try:
             for preprocess in self.preprocess['DELETE_MANY']:
@@ -567,21 +1754,15 @@ class SQLAView(ModelView):
             return response_exception(exception)
 
         try:
-            result = sqla_create_query(self.session, self.model, search_params,
-                            _ignore_order_by=True)
+            result = self._search_query(search_params, _ignore_order_by=True)
         except NoResultFound:
-            return json(dict(message='No result found'), status=520)
+            return self._json(dict(message='No result found'), status=520)
         except MultipleResultsFound:
-            return json(dict(message='Multiple results found'), status=520)
+            return self._json(dict(message='Multiple results found'), status=520)
         except Exception as exception:
-            return json(dict(message='Unable to construct query'), status=520)
+            return self._json(dict(message='Unable to construct query'), status=520)
 
-        if isinstance(result, Query):
-            num_deleted = result.delete(synchronize_session=False)
-        else:
-            self.session.delete(result)
-            num_deleted = 1
-        self.session.commit()
+        num_deleted = await self._delete_rows(result)
         result = dict(num_deleted=num_deleted)
 
         try:
@@ -595,7 +1776,7 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
-        return (json(result, headers=headers, status=200)) if num_deleted > 0 else json({}, headers=headers, status=520)
+        return (self._json(result, headers=headers, status=200)) if num_deleted > 0 else self._json({}, headers=headers, status=520)
 
     async def delete(self, request, instid=None, relationname=None, relationinstid=None):
         if instid is None:
@@ -614,20 +1795,10 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
-        inst = get_by(self.session, self.model, instid, self.primary_key)
-        if relationname:
-            if not relationinstid:
-                msg = ('Cannot DELETE entire "{0}" relation').format(relationname)
-                return json(dict(message=msg), status=520)
-            relation = getattr(inst, relationname)
-            related_model = get_related_model(self.model, relationname)
-            relation_instance = get_by(self.session, related_model, relationinstid)
-            relation.remove(relation_instance)
-            was_deleted = len(self.session.dirty) > 0
-        elif inst is not None:
-            self.session.delete(inst)
-            was_deleted = len(self.session.deleted) > 0
-        self.session.commit()
+        if relationname and not relationinstid:
+            msg = ('Cannot DELETE entire "{0}" relation').format(relationname)
+            return self._json(dict(message=msg), status=520)
+        was_deleted = await self._delete_record(instid, relationname, relationinstid)
 
         try:
             headers = {}
@@ -640,7 +1811,7 @@ class SQLAView(ModelView):
         except ProcessingException as exception:
             return response_exception(exception)
 
-        return json({}, headers=headers, status=200) if was_deleted else json({}, headers=headers, status=520)
+        return self._json({}, headers=headers, status=200) if was_deleted else self._json({}, headers=headers, status=520)
 
     async def post(self, request):
         content_type = request.headers.get('Content-Type', "")
@@ -648,12 +1819,15 @@ class SQLAView(ModelView):
 
         if not content_is_json:
             msg = 'Request must have "Content-Type: application/json" header'
-            return json(dict(message=msg),status=520)
+            return self._json(dict(message=msg),status=520)
 
         try:
-            data = request.json or {}
+            data = self._request_json(request)
         except (ServerError, TypeError, ValueError, OverflowError) as exception:
-            return json(dict(message='Unable to decode data'),status=520)
+            return self._json(dict(message='Unable to decode data'),status=520)
+        if isinstance(data, list):
+            return await self._post_many(request, data)
+        data = data or {}
 
         try:
             for preprocess in self.preprocess['POST']:
@@ -665,12 +1839,9 @@ class SQLAView(ModelView):
             return response_exception(exception)
 
         try:
-            instance = self.deserialize(data)
-            self.session.add(instance)
-            self.session.commit()
-            result = self.serialize(instance)
+            instance, result = await self._create_record(data)
         except self.validation_exceptions as exception:
-            return self._handle_validation_exception(exception)
+            return await self._validation_error(exception)
         pk_name = self.primary_key or primary_key_name(instance)
         primary_key = result[pk_name]
         try:
@@ -690,20 +1861,25 @@ class SQLAView(ModelView):
                     return resp
         except ProcessingException as exception:
             return response_exception(exception)
-        return json(result,headers=headers, status=201)
+        return self._json(result,headers=headers, status=201)
 
     async def put(self, request, instid=None, relationname=None, relationinstid=None):
         content_type = request.headers.get('Content-Type', "")
         content_is_json = content_type.startswith('application/json')
         if not content_is_json:
             msg = 'Request must have "Content-Type: application/json" header'
-            return json(dict(message=msg),status=520)
+            return self._json(dict(message=msg),status=520)
         try:
-            data = request.json or {}
+            data = self._request_json(request) or {}
         except (ServerError, TypeError, ValueError, OverflowError) as exception:
-            return json(dict(message='Unable to decode data'),status=520)
+            return self._json(dict(message='Unable to decode data'),status=520)
 
         putmany = instid is None
+        if putmany and self._upsert_requested(request):
+            return await self._upsert(request, data)
+        if not isinstance(data, dict):
+            msg = '{0} body must be a JSON object'.format('PUT_MANY' if putmany else 'PUT')
+            return self._json(dict(message=msg), status=520)
         if putmany:
             search_params = data.pop('q', {})
             try:
@@ -732,38 +1908,33 @@ class SQLAView(ModelView):
         for field in data:
             if not has_field(self.model, field):
                 msg = "Model does not have field '{0}'".format(field)
-                return json(dict(message=msg),status=520)
+                return self._json(dict(message=msg),status=520)
 
+        update_stmt = result = None
         if putmany:
             try:
-                query = sqla_create_query(self.session, self.model, search_params)
+                query = self._search_query(search_params)
+                update_stmt = self._set_based_update(search_params, data)
             except Exception as exception:
-                return json(dict(message='Unable to construct query'),status=520)
+                return self._json(dict(message='Unable to construct query'),status=520)
+        elif self._updates_by_statement(data):
+            result = await self._update_record(instid, data)
+            if result is None:
+                return self._json(dict(message='No result found'), status=520)
         else:
-            query = query_by_primary_key(self.session, self.model, instid,
-                                         self.primary_key)
-            if query.count() == 0:
-                return json(dict(message='No result found'), status=520)
-            assert query.count() == 1, 'Multiple rows with same ID'
-        try:
-            relations = self._update_relations(query, data)
-        except self.validation_exceptions as exception:
-            #current_app.logger.exception(str(exception))
-            return self._handle_validation_exception(exception)
-        field_list = frozenset(data) ^ relations
-
-        data = dict((field, data[field]) for field in field_list)
-        data = strings_to_dates(self.model, data)
-        try:
-            num_modified = 0
-            if data:
-                for item in query.all():
-                    for field, value in data.items():
-                        setattr(item, field, value)
-                    num_modified += 1
-            self.session.commit()
-        except self.validation_exceptions as exception:
-            return self._handle_validation_exception(exception)
+            query = self._instance_query(instid)
+        if result is None:
+            try:
+                if update_stmt is not None:
+                    num_modified = await self._update_rows(update_stmt)
+                else:
+                    num_modified = await self._update_instances(query, data,
+                                                                single=not putmany)
+            except self.validation_exceptions as exception:
+                #current_app.logger.exception(str(exception))
+                return await self._validation_error(exception)
+            if num_modified is None:
+                return self._json(dict(message='No result found'), status=520)
 
         headers = {}
         if putmany:
@@ -779,7 +1950,8 @@ class SQLAView(ModelView):
                 return response_exception(exception)
 
         else:
-            result = self._instid_to_dict(instid)
+            if result is None:
+                result = await self._instance_result(instid)
             try:
                 for postprocess in self.postprocess['PUT_SINGLE']:
                     resp = await run_process(process=postprocess,request=request, 
@@ -790,7 +1962,7 @@ class SQLAView(ModelView):
             except ProcessingException as exception:
                 return response_exception(exception)
 
-        return json(result, headers=headers, status=200)
+        return self._json(result, headers=headers, status=200)
 
     async def _put_many(self, request):
         pass
\ No newline at end of file
@@ -0,0 +1,374 @@
+import math
+from functools import wraps
+
+from sanic.response import HTTPResponse
+
+from sqlalchemy import delete as sqla_delete
+from sqlalchemy import select
+from sqlalchemy.exc import (DataError, IntegrityError, ProgrammingError)
+
+from .helpers.sqlalchemy import async_count
+from .helpers.sqlalchemy import async_estimate_count
+from .helpers.sqlalchemy import async_windowed_page
+from .helpers.sqlalchemy import get_related_model
+from .helpers.sqlalchemy import get_relations
+from .helpers.sqlalchemy import is_like_list
+from .helpers.sqlalchemy import strings_to_dates
+from .helpers.sqlalchemy import to_dict
+
+from .compression import mark_streamed, streamed_send
+from .exception import (ProcessingException, response_exception)
+from .view_sqlalchemy import (SQLAView, encode_cursor, extract_error_messages,
+                              run_process, sqla_apply_keyset, sqla_create_select)
+
+
+class AsyncSQLAView(SQLAView):
+    """A :class:`SQLAView` whose database work is awaited on the
+    ``AsyncSession`` of ``database.async.DatabaseAlchemy``, so a slow query
+    never blocks the event loop.
+
+    Queries are built with :func:`~sqlalchemy.select` and run with ``await
+    session.execute()``. Code which must stay synchronous (serialization of
+    lazily loaded relations and :func:`get_or_create` on nested payloads) runs
+    through :meth:`AsyncSession.run_sync`, which keeps it awaitable.
+
+    The POST, PUT and DELETE handlers, with their hooks and responses, are
+    those of :class:`SQLAView`; this class overrides the database methods
+    they await (``_create_record``, ``_update_instances``, ``_delete_rows``
+    and so on). Preprocess and postprocess hooks receive exactly the same
+    arguments as in :class:`SQLAView`.
+
+    """
+
+    def _catch_integrity_errors(self, func):
+        @wraps(func)
+        async def wrapped(*args, **kw):
+            try:
+                return await func(*args, **kw)
+            except (DataError, IntegrityError, ProgrammingError) as exception:
+                await self.session.rollback()
+                return self._json({"message":type(exception).__name__}, status=520)
+        return wrapped
+
+    async def _get_by(self, model, instid, primary_key=None, options=()):
+        stmt = select(model).where(self._pk_criterion(instid, model, primary_key))
+        return (await self.session.scalars(stmt.options(*options).limit(1))).unique().first()
+
+    def _search_query(self, search_params, **kw):
+        return sqla_create_select(self.model, search_params, **kw)
+
+    def _instance_query(self, instid):
+        return select(self.model).where(self._pk_criterion(instid))
+
+    async def _validation_error(self, exception):
+        await self.session.rollback()
+        errors = extract_error_messages(exception) or \
+            'Could not determine specific validation errors'
+        return self._json(dict(validation_errors=errors), status=520)
+
+    async def _serialize(self, instance):
+        return await self.session.run_sync(lambda session: self.serialize(instance))
+
+    async def _create_record(self, data):
+        if self.deserialize == self._dict_to_inst:
+            instance = await self.session.run_sync(
+                lambda session: self._dict_to_inst(data, session))
+        else:
+            instance = self.deserialize(data)
+        self.session.add(instance)
+        await self.session.commit()
+        return instance, await self._serialize(instance)
+
+    async def _create_records(self, records):
+        objects, errors = await self.session.run_sync(
+            lambda session: self._insert_many(records, session))
+        await self.session.commit()
+        return objects, errors
+
+    async def _upsert_records(self, records):
+        objects = await self.session.run_sync(
+            lambda session: self._upsert_many(records, session))
+        await self.session.commit()
+        return objects
+
+    async def _update_record(self, instid, data):
+        result = await self.session.run_sync(
+            lambda session: self._update_single(instid, data, session))
+        await self.session.commit()
+        return result
+
+    async def _update_rows(self, stmt):
+        num_modified = (await self.session.execute(stmt)).rowcount
+        await self.session.commit()
+        return num_modified
+
+    async def _update_instances(self, query, data, single=False):
+        instances = (await self.session.scalars(query)).all()
+        if single:
+            if len(instances) == 0:
+                return None
+            assert len(instances) == 1, 'Multiple rows with same ID'
+        relations = await self.session.run_sync(
+            lambda session: self._update_relations(instances, data, session))
+        field_list = frozenset(data) ^ relations
+
+        data = dict((field, data[field]) for field in field_list)
+        data = strings_to_dates(self.model, data)
+        num_modified = 0
+        if data:
+            for item in instances:
+                for field, value in data.items():
+                    setattr(item, field, value)
+                num_modified += 1
+        await self.session.commit()
+        return num_modified
+
+    async def _delete_rows(self, stmt):
+        delete_stmt = sqla_delete(self.model)
+        if stmt.whereclause is not None:
+            delete_stmt = delete_stmt.where(stmt.whereclause)
+        deleted = await self.session.execute(
+            delete_stmt.execution_options(synchronize_session=False))
+        await self.session.commit()
+        return deleted.rowcount
+
+    async def _delete_record(self, instid, relationname=None, relationinstid=None):
+        was_deleted = False
+        inst = await self._get_by(self.model, instid, self.primary_key)
+        if relationname:
+            related_model = get_related_model(self.model, relationname)
+            relation_instance = await self._get_by(related_model, relationinstid)
+            await self.session.run_sync(
+                lambda session: getattr(inst, relationname).remove(relation_instance))
+            was_deleted = len(self.session.dirty) > 0
+        elif inst is not None:
+            await self.session.delete(inst)
+            was_deleted = len(self.session.deleted) > 0
+        await self.session.commit()
+        return was_deleted
+
+    async def _all(self, stmt):
+        result = await self.session.execute(stmt)
+        return result.all() if self._reading_rows else result.scalars().unique().all()
+
+    async def _slice(self, instances, start, end=None):
+        if isinstance(instances, list):
+            return instances[start:end]
+        if end is not None and end <= start:
+            return []
+        stmt = instances.offset(start) if start else instances
+        if end is not None:
+            stmt = stmt.limit(end - start)
+        return await self._all(stmt)
+
+    async def _paginated(self, request, instances, deep):
+        count_mode = self._compute_count_mode(request)
+        results_per_page = self._compute_results_per_page(request)
+        if count_mode == 'none':
+            if results_per_page > 0:
+                page_num = int(request.args.get('page', 1))
+                start = (page_num - 1) * results_per_page
+                rows = await self._slice(instances, start, start + results_per_page + 1)
+                has_more = len(rows) > results_per_page
+                rows = rows[:results_per_page]
+            else:
+                page_num, has_more = 1, False
+                rows = await self._slice(instances, 0)
+            items = await self.session.run_sync(
+                lambda session: self._serialize_page(request, rows, deep))
+            return dict(page=page_num, **items, has_more=has_more)
+        if results_per_page > 0:
+            page_num = int(request.args.get('page', 1))
+            start = (page_num - 1) * results_per_page
+            end = start + results_per_page
+        else:
+            page_num = 1
+            start = 0
+            end = None
+        if isinstance(instances, list):
+            num_results = len(instances)
+            rows = instances[start:end]
+        elif count_mode == 'exact' and self._window_countable(instances):
+            rows, num_results = await async_windowed_page(self.session, instances, start, end,
+                                                          scalar=not self._reading_rows)
+            if num_results is None:
+                num_results = await async_count(self.session, instances) if start > 0 else 0
+        else:
+            if count_mode == 'estimated':
+                num_results = await async_estimate_count(self.session, instances)
+            else:
+                num_results = await async_count(self.session, instances)
+                end = num_results if end is None else min(num_results, end)
+            rows = await self._slice(instances, start, end)
+        if results_per_page > 0:
+            total_pages = int(math.ceil(num_results / results_per_page))
+        else:
+            total_pages = 1
+        items = await self.session.run_sync(
+            lambda session: self._serialize_page(request, rows, deep))
+        return dict(page=page_num, **items, total_pages=total_pages, num_results=num_results)
+
+    async def _keyset_paginated(self, request, stmt, deep, keys, values=None):
+        results_per_page = self._compute_results_per_page(request)
+        stmt = sqla_apply_keyset(stmt, self.model, keys, values)
+        if results_per_page > 0:
+            stmt = stmt.limit(results_per_page + 1)
+        rows = await self._all(stmt)
+        next_cursor = None
+        if results_per_page > 0 and len(rows) > results_per_page:
+            rows = rows[:results_per_page]
+            next_cursor = encode_cursor([getattr(rows[-1], field) for field, _ in keys],
+                                        self.json_codec)
+        items = await self.session.run_sync(
+            lambda session: self._serialize_page(request, rows, deep))
+        return dict(**items, next_cursor=next_cursor)
+
+    async def _stream_response(self, request, stmt, content_type, encode,
+                               yield_per=None, scalars=False, begin=None, end=None):
+        if yield_per is not None:
+            stmt = stmt.execution_options(yield_per=yield_per)
+        deferred = self._defer_session_close(request)
+        mark_streamed(request)
+        try:
+            result = await self.session.stream(stmt)
+            if scalars:
+                # An AsyncResult only uniques the rows of its scalars, which
+                # are then pulled by partitions.
+                result = result.scalars() if yield_per else result.scalars().unique()
+            response = await request.respond(content_type=content_type)
+            send = streamed_send(request, response)
+            if begin is not None:
+                await send(begin())
+            async for items in result.partitions(self.stream_batch_size):
+                chunk = await self.session.run_sync(lambda session: encode(items))
+                await send(chunk)
+            await send(b'' if end is None else end(), end_stream=True)
+        finally:
+            if deferred:
+                await self.db.end_session(request)
+
+    async def _instance_result(self, instid):
+        inst = await self._get_by(self.model, instid, self.primary_key)
+        if inst is None:
+            return self._json(dict(message='No result found'), status=520)
+        return await self._serialize(inst)
+
+    async def _search(self, request):
+        try:
+            search_params = self.json_codec.loads(request.args.get('q', '{}'))
+        except (TypeError, ValueError, OverflowError) as exception:
+            return self._json(dict(message='Unable to decode data'), status=520)
+
+        try:
+            for preprocess in self.preprocess['GET_MANY']:
+                resp = await run_process(process=preprocess, request=request,
+                        search_params=search_params, Model=self.model,
+                        collection_name=self.collection_name)
+                if (resp is not None) and isinstance(resp, HTTPResponse):
+                    return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        resp = self._apply_request_fields(request)
+        if resp is not None:
+            return resp
+
+        keyset = self.pagination == 'cursor'
+        if keyset:
+            try:
+                keys, values = self._request_keyset(request, search_params)
+            except ValueError as exception:
+                return self._json(dict(message=str(exception)), status=520)
+
+        self._use_replica()
+        try:
+            stmt = sqla_create_select(self.model, search_params, _ignore_order_by=keyset)
+        except Exception as exception:
+            return self._json(dict(message='Unable to construct query'), status=520)
+
+        deep = self._relations_deep()
+        keep = [field for field, _ in keys] if keyset else ()
+        columns = self._row_columns(deep, keep)
+        if columns is not None:
+            stmt = stmt.with_only_columns(*columns)
+        else:
+            stmt = stmt.options(*self._loader_options(deep, keep))
+        if self._streamable(request):
+            return await self._stream(request, stmt, deep)
+        if keyset:
+            result = await self._keyset_paginated(request, stmt, deep, keys, values)
+        else:
+            result = await self._paginated(request, stmt, deep)
+        try:
+            headers = {}
+            for postprocess in self.postprocess['GET_MANY']:
+                resp = await run_process(process=postprocess, request=request, result=result,
+                        search_params=search_params, Model=self.model, headers=headers,
+                        collection_name=self.collection_name)
+                if (resp is not None) and isinstance(resp, HTTPResponse):
+                    return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+        return self._json(result, headers=headers, status=200)
+
+    async def get(self, request, instid=None, relationname=None, relationinstid=None):
+        if instid is None:
+            return await self._search(request)
+
+        try:
+            for preprocess in self.preprocess['GET_SINGLE']:
+                resp = await run_process(process=preprocess, request=request,
+                        instance_id=instid, Model=self.model,
+                        collection_name=self.collection_name)
+                if (resp is not None) and isinstance(resp, HTTPResponse):
+                    return resp
+                if resp is not None:
+                    instid = resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        if relationname is None:
+            resp = self._apply_request_fields(request)
+            if resp is not None:
+                return resp
+
+        self._use_replica()
+        options = () if relationname else self._single_options()
+        instance = await self._get_by(self.model, instid, self.primary_key, options)
+        if instance is None:
+            return self._json(dict(message='No result found'),status=520)
+
+        if relationname is None:
+            result = await self._serialize(instance)
+        else:
+            related_model = get_related_model(self.model, relationname)
+            deep = dict((r, {}) for r in get_relations(related_model))
+            if relationinstid is not None:
+                related_value_instance = await self._get_by(related_model, relationinstid)
+                if related_value_instance is None:
+                    return self._json(dict(message='No result found'),status=520)
+                result = await self.session.run_sync(
+                    lambda session: to_dict(related_value_instance, deep))
+            else:
+                related_value = await self.session.run_sync(
+                    lambda session: getattr(instance, relationname))
+                if is_like_list(instance, relationname):
+                    result = await self._paginated(request, list(related_value), deep)
+                else:
+                    result = await self.session.run_sync(
+                        lambda session: to_dict(related_value, deep))
+        if result is None:
+            return self._json(dict(message='No result found'),status=520)
+
+        try:
+            headers = {}
+            for postprocess in self.postprocess['GET_SINGLE']:
+                resp = await run_process(process=postprocess,request=request, instance_id=instid,
+                    result=result, Model=self.model, headers=headers,
+                        collection_name=self.collection_name)
+                if (resp is not None) and isinstance(resp, HTTPResponse):
+                    return resp
+        except ProcessingException as exception:
+            return response_exception(exception)
+
+        return self._json(result, headers=headers, status=200)